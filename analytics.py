@@ -0,0 +1,271 @@
+# analytics.py
+# Vectorized attendance analytics: chronic absenteeism, absence streaks and
+# per-class trends over a date window, computed on students x days arrays.
+#
+# The input is attendance_bits rows (one 31-bit mask per student, month and
+# status), which app.py loads and hands to AttendanceWindow.from_bits().
+#
+#   python analytics.py --students 20000 --days 365     # benchmark
+import argparse
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+DAY_BITS = np.arange(31, dtype=np.uint32)
+
+
+def _month_length(first):
+    return ((first.replace(day=28) + timedelta(days=4)).replace(day=1) - first).days
+
+
+class AttendanceWindow:
+    """
+    Attendance for `students` x `days` as boolean arrays.
+
+    present / absent / leave: (students, days) masks
+    recorded:                 present | absent | leave
+    school_days:              days on which anyone has attendance recorded
+    """
+
+    def __init__(self, start, student_ids, class_ids, present, absent, leave):
+        self.start = start
+        self.student_ids = np.asarray(student_ids)
+        self.class_ids = np.asarray(class_ids)
+        self.present = present
+        self.absent = absent
+        self.leave = leave
+        self.recorded = present | absent | leave
+        self.school_days = self.recorded.any(axis=0)
+
+    @property
+    def days(self):
+        return self.present.shape[1]
+
+    def dates(self):
+        return [self.start + timedelta(days=i) for i in range(self.days)]
+
+    @classmethod
+    def from_bits(cls, start, end, rows):
+        """
+        rows: iterable of (student_id, class_id, month, present, absent, on_leave)
+        with month the first day of the month and the last three 31-bit masks.
+        """
+        rows = list(rows)
+        n_days = (end - start).days + 1
+        if not rows:
+            empty = np.zeros((0, n_days), dtype=bool)
+            return cls(start, [], [], empty, empty, empty)
+
+        student_col, class_col, month_col, *masks = zip(*rows)
+        student_ids, row_student = np.unique(np.array(student_col, dtype=np.int64), return_inverse=True)
+
+        # class of each student (last seen wins; students rarely change class mid-window)
+        class_ids = np.zeros(len(student_ids), dtype=np.int64)
+        class_ids[row_student] = np.array([c or 0 for c in class_col], dtype=np.int64)
+
+        # rows grouped by month: each month is one block of window columns
+        month_index = {m: i for i, m in enumerate(sorted(set(month_col)))}
+        row_month = np.array([month_index[m] for m in month_col], dtype=np.int64)
+        blocks = []
+        for month, i in month_index.items():
+            offset = (month - start).days
+            lo, hi = max(offset, 0), min(offset + _month_length(month), n_days)
+            if lo < hi:
+                blocks.append((np.flatnonzero(row_month == i), lo, hi, lo - offset, hi - offset))
+
+        def unpack(column):
+            values = np.array(column, dtype=np.uint32)
+            out = np.zeros((len(student_ids), n_days), dtype=bool)
+            for sel, lo, hi, first_bit, last_bit in blocks:
+                bits = (values[sel, None] >> DAY_BITS[None, first_bit:last_bit]) & 1
+                out[row_student[sel], lo:hi] = bits
+            return out
+
+        return cls(start, student_ids, class_ids, *(unpack(m) for m in masks))
+
+    # ---------- per student ----------
+    def percentages(self):
+        """Present days / recorded days * 100 per student (NaN when nothing recorded)."""
+        recorded = self.recorded.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(recorded > 0, self.present.sum(axis=1) * 100.0 / recorded, np.nan)
+
+    def trailing_percentages(self, window, ending=None):
+        """
+        Percentage over the `window` days up to day index `ending` (default:
+        the last day) per student; NaN where nothing was recorded in them.
+        """
+        ending = self.days - 1 if ending is None else ending
+        lo = max(ending - window + 1, 0)
+        present = self.present[:, lo:ending + 1].sum(axis=1)
+        recorded = self.recorded[:, lo:ending + 1].sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(recorded > 0, present * 100.0 / recorded, np.nan)
+
+    def absence_streaks(self):
+        """
+        (longest, current) run of consecutive absent school days per student.
+        Days nobody has attendance for (weekends, holidays) are skipped, so a
+        Friday + Monday absence is a 2-day streak.
+        """
+        absent = self.absent[:, self.school_days]
+        if absent.shape[1] == 0:
+            zeros = np.zeros(absent.shape[0], dtype=np.int16)
+            return zeros, zeros
+        count = np.cumsum(absent, axis=1, dtype=np.int16)
+        # running count at the last non-absent day, carried forward
+        last_reset = np.maximum.accumulate(np.where(absent, 0, count), axis=1)
+        run = count - last_reset
+        return run.max(axis=1), run[:, -1]
+
+    # ---------- per class ----------
+    def class_daily_rates(self):
+        """
+        (class_ids, rates): present / recorded * 100 per class and day
+        (classes x days; NaN on days the class has nothing recorded).
+        """
+        if len(self.student_ids) == 0:
+            return np.array([], dtype=np.int64), np.zeros((0, self.days))
+        order = np.argsort(self.class_ids, kind="stable")
+        classes, starts = np.unique(self.class_ids[order], return_index=True)
+        present = np.add.reduceat(self.present[order], starts, axis=0, dtype=np.int32)
+        recorded = np.add.reduceat(self.recorded[order], starts, axis=0, dtype=np.int32)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return classes, np.where(recorded > 0, present * 100.0 / recorded, np.nan)
+
+    def class_trends(self, per_days=30):
+        """
+        (class_ids, mean_rate, slope): least-squares slope of each class's
+        daily rate, in percentage points per `per_days` days.
+        """
+        classes, rates = self.class_daily_rates()
+        valid = ~np.isnan(rates)
+        t = np.broadcast_to(np.arange(self.days, dtype=float), rates.shape)
+        n = valid.sum(axis=1)
+        y = np.where(valid, rates, 0.0)
+        tv = np.where(valid, t, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t_mean = tv.sum(axis=1) / n
+            y_mean = y.sum(axis=1) / n
+            dt = np.where(valid, t - t_mean[:, None], 0.0)
+            slope = (dt * (y - y_mean[:, None])).sum(axis=1) / (dt * dt).sum(axis=1)
+        return classes, y_mean, slope * per_days
+
+
+def summarize(win, chronic_pct=75, streak_days=3, rolling_days=30, drop_pp=5, limit=200):
+    """Flagged students and classes, ready for a template or JSON."""
+    pct = win.percentages()
+    longest, current = win.absence_streaks()
+
+    rolling = win.trailing_percentages(rolling_days)
+    previous = np.full(len(win.student_ids), np.nan)
+    if win.days > rolling_days:
+        previous = win.trailing_percentages(rolling_days, win.days - 1 - rolling_days)
+
+    def student(i):
+        return {
+            "student_id": int(win.student_ids[i]),
+            "class_id": int(win.class_ids[i]) or None,
+            "pct": _round(pct[i]),
+            "rolling_pct": _round(rolling[i]),
+            "rolling_change": _round(rolling[i] - previous[i]),
+            "longest_streak": int(longest[i]),
+            "current_streak": int(current[i]),
+        }
+
+    chronic = np.flatnonzero(pct < chronic_pct)
+    chronic = chronic[np.argsort(pct[chronic], kind="stable")]
+    streaks = np.flatnonzero(current >= streak_days)
+    streaks = streaks[np.argsort(-current[streaks], kind="stable")]
+
+    classes, mean_rate, slope = win.class_trends(rolling_days)
+    dropping = np.flatnonzero(slope <= -drop_pp)
+    dropping = dropping[np.argsort(slope[dropping], kind="stable")]
+
+    return {
+        "students": int(len(win.student_ids)),
+        "school_days": int(win.school_days.sum()),
+        "average_pct": _round(np.nanmean(pct)) if len(pct) and not np.isnan(pct).all() else None,
+        "chronic_count": int(len(chronic)),
+        "chronic": [student(i) for i in chronic[:limit]],
+        "streak_count": int(len(streaks)),
+        "streaks": [student(i) for i in streaks[:limit]],
+        "dropping_classes": [
+            {
+                "class_id": int(classes[i]) or None,
+                "mean_rate": _round(mean_rate[i]),
+                "slope": _round(slope[i]),
+            }
+            for i in dropping
+        ],
+    }
+
+
+def _round(value, digits=1):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+# ---------- benchmark ----------
+def synthetic_rows(students, days, end, classes=600, seed=1):
+    """attendance_bits-shaped rows for `students` over the `days` up to `end`."""
+    rng = np.random.default_rng(seed)
+    start = end - timedelta(days=days - 1)
+    weekday = np.array([(start + timedelta(days=i)).weekday() < 5 for i in range(days)])
+
+    # per-student attendance rate, a few chronic absentees
+    rate = np.clip(rng.normal(0.92, 0.06, students), 0.3, 1.0)
+    present = (rng.random((students, days)) < rate[:, None]) & weekday
+    leave = ~present & (rng.random((students, days)) < 0.1) & weekday
+    absent = ~present & ~leave & weekday
+    class_of = rng.integers(1, classes + 1, students)
+
+    rows = []
+    first = start.replace(day=1)
+    while first <= end:
+        lo = max((first - start).days, 0)
+        hi = min((first - start).days + _month_length(first), days)
+        shift = np.arange(lo, hi) - (first - start).days
+        weights = (np.uint32(1) << shift.astype(np.uint32))
+        masks = [(m[:, lo:hi] * weights).sum(axis=1) for m in (present, absent, leave)]
+        rows.extend(zip(
+            range(1, students + 1), class_of.tolist(), [first] * students,
+            masks[0].tolist(), masks[1].tolist(), masks[2].tolist()
+        ))
+        first = (first + timedelta(days=32)).replace(day=1)
+    return start, rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the attendance analytics on synthetic data.")
+    ap.add_argument("--students", type=int, default=20000)
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--budget", type=float, default=1.0, help="seconds allowed per run")
+    args = ap.parse_args()
+
+    end = date(2026, 3, 31)
+    start, rows = synthetic_rows(args.students, args.days, end)
+    print(f"{args.students} students x {args.days} days, {len(rows)} month rows")
+
+    best = None
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        win = AttendanceWindow.from_bits(start, end, rows)
+        loaded = time.perf_counter()
+        report = summarize(win)
+        done = time.perf_counter()
+        print(f"  unpack {loaded - started:6.3f}s   analyse {done - loaded:6.3f}s   total {done - started:6.3f}s")
+        best = done - started if best is None else min(best, done - started)
+
+    print(
+        f"best {best:.3f}s; {report['chronic_count']} chronic, "
+        f"{report['streak_count']} on a streak, {len(report['dropping_classes'])} classes dropping"
+    )
+    if best > args.budget:
+        print(f"SLOWER than the {args.budget:g}s budget")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
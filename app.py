@@ -4,8 +4,22 @@
 # =========================
 import os
 import io
+import re
+import ast
 import csv
-from datetime import datetime, date, timedelta
+import json
+import time
+import zlib
+import zipfile
+import hashlib
+import secrets
+import queue
+import socket
+import threading
+import multiprocessing
+from functools import wraps
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from datetime import datetime, date, timedelta, timezone
 from calendar import monthrange
 from email.message import EmailMessage
 import smtplib
@@ -26,7 +40,16 @@ from flask import (
     send_file,
     send_from_directory,
     abort,
+    g,
+    has_app_context,
+    has_request_context,
 )
+from flask.cli import AppGroup
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from werkzeug.datastructures import CallbackDict, MultiDict
+from itsdangerous import Signer, BadSignature
+import click
 
 # =========================
 # Database
@@ -42,50 +65,2480 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 
 # =========================
-# PDF / Reports (ReportLab)
+# PDF / Reports (drawing is in pdf_render.py)
 # =========================
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4, letter
-from reportlab.lib.units import mm, cm
-from reportlab.lib import colors
+# pypdf joins per-worker chunks of a merged class PDF; without it the whole
+# class is drawn by one worker
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    PdfReader = PdfWriter = None
 
 # =========================
 # IO Helpers
 # =========================
 from io import BytesIO
+
+# =========================
+# Local
+# =========================
+import config
+from pdf_render import (
+    SIGNATURE_PATH,
+    render_fee_receipt,
+    render_fee_receipt_full,
+    render_report_card,
+    render_report_card_chunk,
+    report_card_filename,
+    school_details,
+)
+
+# analytics needs NumPy; the rest of the app runs without it
+try:
+    import analytics
+except ImportError:
+    analytics = None
+# -------------------------------------------------------------------------
+
+
+
+# ---- App & config ----
+app = Flask(__name__)
+app.secret_key = "super_secret_key_123"
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.path.join(BASE_DIR, "static", "uploads")
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+ALLOWED_EXT = {"png", "jpg", "jpeg", "gif"}
+MAX_FILE_SIZE = 2 * 1024 * 1024
+
+app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+app.config["MAX_CONTENT_LENGTH"] = MAX_FILE_SIZE
+
+def allowed_file(filename):
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXT
+# -------------------------------------------------------------------------
+
+
+
+# ---------- DATABASE CONNECTION ----------
+class PoolTimeout(Exception):
+    """No pooled connection became free within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of MySQL connections shared by all request threads.
+
+    Connections are opened lazily up to `size`. A borrower waits up to
+    `timeout` seconds for a free slot, then PoolTimeout is raised.
+    Connections that sat idle longer than `ping_after` seconds are pinged
+    on borrow and replaced if the server dropped them.
+    """
+
+    def __init__(self, name, size, timeout, ping_after, **connect_args):
+        self.name = name
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.connect_args = connect_args
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._in_use = 0
+        self._counters = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "connects": 0,
+            "health_failures": 0,
+            "wait_ms_total": 0.0,
+        }
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.connect_args)
+        with self._lock:
+            self._opened += 1
+            self._counters["connects"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._opened -= 1
+
+    def acquire(self, wait=True):
+        """Borrow a connection; with wait=False return None if none is free right now."""
+        start = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            if not wait:
+                return None
+            with self._lock:
+                self._counters["waits"] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._counters["timeouts"] += 1
+                raise PoolTimeout(
+                    f"pool '{self.name}': no connection free after {self.timeout}s"
+                )
+
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._connect()
+                    break
+
+                # health-check on borrow (only when it has been idle a while)
+                if time.monotonic() - idle_since >= self.ping_after and not conn.is_connected():
+                    with self._lock:
+                        self._counters["health_failures"] += 1
+                    self._discard(conn)
+                    conn = None
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._counters["checkouts"] += 1
+            self._counters["wait_ms_total"] += (time.monotonic() - start) * 1000
+        return conn
+
+    def release(self, conn):
+        try:
+            # never hand a half-finished transaction (or its snapshot) to the next borrower
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put((conn, time.monotonic()))
+        except Exception:
+            self._discard(conn)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            c = dict(self._counters)
+            opened, in_use = self._opened, self._in_use
+        return {
+            "name": self.name,
+            "size": self.size,
+            "open": opened,
+            "in_use": in_use,
+            "idle": self._idle.qsize(),
+            "checkouts": c["checkouts"],
+            "waits": c["waits"],
+            "timeouts": c["timeouts"],
+            "connects": c["connects"],
+            "health_failures": c["health_failures"],
+            "avg_wait_ms": round(c["wait_ms_total"] / c["checkouts"], 3) if c["checkouts"] else 0.0,
+        }
+
+
+class PooledConnection:
+    """
+    Connection handle returned by get_db().
+
+    Routes keep calling conn.close() as before. Inside an app context that
+    is a no-op: the one connection bound to the request is returned to the
+    pool by release_db() at teardown. Outside an app context (scripts,
+    worker threads) close() returns it to the pool straight away.
+    """
+
+    def __init__(self, pool, conn, request_bound):
+        self._pool = pool
+        self._conn = conn
+        self._request_bound = request_bound
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        cur = self._conn.cursor(*args, **kwargs)
+        if config.SQL_INSTRUMENT and has_request_context():
+            return InstrumentedCursor(cur)
+        return cur
+
+    def commit(self):
+        self._conn.commit()
+        # remember the write so this session's next reads skip the replica
+        if self._pool is db_pool and has_request_context():
+            session["db_wrote_at"] = time.time()
+
+    def close(self):
+        if self._request_bound or self._conn is None:
+            return
+        self._pool.release(self._conn)
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+db_pool = ConnectionPool(
+    "primary",
+    size=config.DB_POOL_SIZE,
+    timeout=config.DB_POOL_TIMEOUT,
+    ping_after=config.DB_POOL_PING_AFTER,
+    host=config.DB_HOST,
+    port=config.DB_PORT,
+    user=config.DB_USER,
+    password=config.DB_PASS,
+    database=config.DB_NAME,
+    auth_plugin="mysql_native_password"
+)
+
+
+replica_pool = None
+if config.DB_REPLICA_HOST:
+    replica_pool = ConnectionPool(
+        "replica",
+        size=config.DB_REPLICA_POOL_SIZE,
+        timeout=config.DB_POOL_TIMEOUT,
+        ping_after=config.DB_POOL_PING_AFTER,
+        host=config.DB_REPLICA_HOST,
+        port=config.DB_REPLICA_PORT,
+        user=config.DB_REPLICA_USER,
+        password=config.DB_REPLICA_PASS,
+        database=config.DB_NAME,
+        auth_plugin="mysql_native_password",
+        init_command="SET SESSION TRANSACTION READ ONLY"
+    )
+
+
+def replica_ok(view):
+    """
+    Mark a read-only route as safe to serve from the replica.
+    get_db() calls inside it go to the replica pool unless the caller
+    passes readonly=False explicitly.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_readonly = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _use_replica(readonly):
+    if replica_pool is None:
+        return False
+    if readonly is None:
+        readonly = g.get("db_readonly", False) if has_app_context() else False
+    if not readonly:
+        return False
+    # read-your-writes: stay on the primary right after this session wrote
+    if has_request_context():
+        wrote_at = session.get("db_wrote_at", 0)
+        if time.time() - wrote_at < config.DB_READ_YOUR_WRITES_SECONDS:
+            return False
+    return True
+
+
+def get_db(readonly=None):
+    """
+    Borrow a connection. readonly=True marks a single query block as
+    replica-safe; readonly=None follows the route (see replica_ok).
+    """
+    if _use_replica(readonly):
+        pool, key = replica_pool, "db_replica"
+    else:
+        pool, key = db_pool, "db"
+
+    if not has_app_context():
+        return PooledConnection(pool, pool.acquire(), request_bound=False)
+
+    if key not in g:
+        setattr(g, key, PooledConnection(pool, pool.acquire(), request_bound=True))
+    return g.get(key)
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    for key in ("db", "db_replica"):
+        conn = g.pop(key, None)
+        if conn is not None:
+            conn._pool.release(conn._conn)
+
+
+@app.errorhandler(PoolTimeout)
+def db_pool_timeout(e):
+    print("DB POOL TIMEOUT:", e)
+    return "The server is busy, please try again in a moment.", 503
+
+
+@app.route("/admin/db/stats")
+def db_stats():
+    if "user" not in session or session.get("role") != "admin":
+        abort(403)
+    pools = [db_pool] + ([replica_pool] if replica_pool else [])
+    return jsonify({p.name: p.stats() for p in pools})
+# -------------------------------------------------------------------------
+
+
+
+# ---------- SQL INSTRUMENTATION ----------
+# Every cursor handed out inside a request records its statements in
+# g.sql_log. After the request we print slow statements and repeated
+# statement shapes (N+1 loops), and fold the numbers into a per-route
+# summary served at /admin/db/queries.
+_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_IN_LIST = re.compile(r"IN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+
+route_sql_stats = {}
+route_sql_lock = threading.Lock()
+
+
+def normalize_sql(sql):
+    """Statement shape: literals and params become ?, IN lists collapse."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    sql = " ".join(sql.split())
+    sql = _LITERAL.sub("?", sql)
+    return _IN_LIST.sub("IN (...)", sql)
+
+
+class InstrumentedCursor:
+    """Thin cursor wrapper that times each statement for the current request."""
+
+    def __init__(self, cur):
+        self._cur = cur
+        self._entry = None
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cur.close()
+
+    def _record(self, operation, started, many=False):
+        self._entry = {
+            "sql": normalize_sql(operation),
+            "ms": (time.perf_counter() - started) * 1000,
+            "rows": self._cur.rowcount if self._cur.rowcount >= 0 else 0,
+            "many": many,
+        }
+        g.setdefault("sql_log", []).append(self._entry)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cur.execute(operation, params, *args, **kwargs)
+        finally:
+            self._record(operation, started)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cur.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            self._record(operation, started, many=True)
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        if row is not None and self._entry is not None:
+            self._entry["rows"] = max(self._entry["rows"], self._cur.rowcount)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cur.fetchmany(*args, **kwargs)
+        if self._entry is not None:
+            self._entry["rows"] = max(self._entry["rows"], self._cur.rowcount)
+        return rows
+
+    def fetchall(self):
+        rows = self._cur.fetchall()
+        if self._entry is not None:
+            self._entry["rows"] = max(self._entry["rows"], len(rows))
+        return rows
+
+
+@app.after_request
+def report_sql(response):
+    log = g.pop("sql_log", None)
+    if not log:
+        return response
+
+    route = request.endpoint or request.path
+    total_ms = sum(e["ms"] for e in log)
+
+    for e in log:
+        if e["ms"] >= config.SQL_SLOW_MS:
+            print(f"SLOW QUERY [{route}] {e['ms']:.1f}ms rows={e['rows']}: {e['sql']}")
+
+    shapes = {}
+    for e in log:
+        shapes[e["sql"]] = shapes.get(e["sql"], 0) + 1
+    repeated = {sql: n for sql, n in shapes.items() if n >= config.SQL_REPEAT_THRESHOLD}
+    for sql, n in repeated.items():
+        print(f"N+1 SUSPECT [{route}] {n}x: {sql}")
+
+    with route_sql_lock:
+        st = route_sql_stats.setdefault(route, {
+            "requests": 0,
+            "queries": 0,
+            "sql_ms": 0.0,
+            "max_queries": 0,
+            "n_plus_one": 0,
+            "repeated": {},
+        })
+        st["requests"] += 1
+        st["queries"] += len(log)
+        st["sql_ms"] += total_ms
+        st["max_queries"] = max(st["max_queries"], len(log))
+        if repeated:
+            st["n_plus_one"] += 1
+            for sql, n in repeated.items():
+                st["repeated"][sql] = max(st["repeated"].get(sql, 0), n)
+
+    response.headers["X-SQL-Queries"] = str(len(log))
+    response.headers["X-SQL-Time-ms"] = f"{total_ms:.1f}"
+    return response
+
+
+@app.route("/admin/db/queries")
+def db_query_stats():
+    if "user" not in session or session.get("role") != "admin":
+        abort(403)
+
+    with route_sql_lock:
+        rows = []
+        for route, st in route_sql_stats.items():
+            rows.append({
+                "route": route,
+                "requests": st["requests"],
+                "queries": st["queries"],
+                "avg_queries": round(st["queries"] / st["requests"], 2),
+                "max_queries": st["max_queries"],
+                "sql_ms": round(st["sql_ms"], 1),
+                "avg_sql_ms": round(st["sql_ms"] / st["requests"], 2),
+                "n_plus_one_requests": st["n_plus_one"],
+                "repeated_statements": dict(st["repeated"]),
+            })
+
+    rows.sort(key=lambda r: r["sql_ms"], reverse=True)
+    return jsonify(rows)
+# -------------------------------------------------------------------------
+
+# ---------- QUERY FAN-OUT ----------
+# Dashboards run several independent reads; fan_out() runs them at the
+# same time, each on its own pooled connection, and returns when all are
+# done. At most FANOUT_PER_REQUEST run at once per call, and only on
+# connections that are free right now: the request usually holds one
+# already, and waiting on the pool for more could starve other requests
+# (or deadlock when it is small). With none free, the next query runs on
+# the request's own connection instead.
+class FanOutTimeout(Exception):
+    """Fan-out queries did not all finish within the timeout."""
+
+
+fanout_executor = ThreadPoolExecutor(
+    max_workers=config.FANOUT_WORKERS,
+    thread_name_prefix="fanout"
+)
+
+
+def _fanout_query(pool, conn, sql, params, fetch):
+    started = time.perf_counter()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(sql, params)
+        result = cur.fetchone() if fetch == "one" else cur.fetchall()
+        cur.close()
+    finally:
+        pool.release(conn)
+
+    rows = len(result) if fetch == "all" else int(result is not None)
+    return result, (time.perf_counter() - started) * 1000, rows
+
+
+def fan_out(queries, timeout=None):
+    """
+    Run independent read queries concurrently.
+
+    queries: {name: (sql, params, "one" | "all")}
+    returns: {name: row or rows}
+    """
+    pool = replica_pool if _use_replica(None) else db_pool
+    deadline = time.monotonic() + (config.FANOUT_TIMEOUT if timeout is None else timeout)
+    log = g.setdefault("sql_log", []) if config.SQL_INSTRUMENT and has_request_context() else None
+
+    pending = list(queries.items())
+    running = {}
+    results = {}
+
+    while pending or running:
+        while pending and len(running) < config.FANOUT_PER_REQUEST:
+            conn = pool.acquire(wait=False)
+            if conn is None:
+                break
+            name, (sql, params, fetch) = pending.pop(0)
+            fut = fanout_executor.submit(_fanout_query, pool, conn, sql, params, fetch)
+            running[fut] = (name, sql)
+
+        if not running:
+            # pool is busy: run the next query on the request's own connection
+            if time.monotonic() > deadline:
+                raise FanOutTimeout(", ".join(name for name, _ in pending))
+            name, (sql, params, fetch) = pending.pop(0)
+            conn = get_db()
+            cur = conn.cursor(dictionary=True)
+            cur.execute(sql, params)
+            results[name] = cur.fetchone() if fetch == "one" else cur.fetchall()
+            cur.close()
+            conn.close()
+            continue
+
+        done, _ = wait(
+            running,
+            timeout=max(0.0, deadline - time.monotonic()),
+            return_when=FIRST_COMPLETED
+        )
+        if not done:
+            raise FanOutTimeout(", ".join(name for name, _ in running.values()))
+
+        for fut in done:
+            name, sql = running.pop(fut)
+            result, ms, rows = fut.result()
+            results[name] = result
+            if log is not None:
+                log.append({"sql": normalize_sql(sql), "ms": ms, "rows": rows, "many": False})
+
+    return results
+
+
+@app.errorhandler(FanOutTimeout)
+def fan_out_timeout(e):
+    print("FAN-OUT TIMEOUT:", e)
+    return "The page took too long to load, please try again.", 504
 # -------------------------------------------------------------------------
 
+# ---------- SCHEMA MIGRATIONS ----------
+# migrations/NNNN_name.sql are applied in order and recorded in
+# schema_migrations. Usage:
+#   flask --app app db upgrade
+#   flask --app app db status
+#   flask --app app db explain
+MIGRATIONS_DIR = os.path.join(BASE_DIR, "migrations")
+
+# re-applying an index someone already created by hand (or dropping one
+# that is already gone) is not an error
+IGNORABLE_DDL_ERRORS = {1061, 1091}  # ER_DUP_KEYNAME, ER_CANT_DROP_FIELD_OR_KEY
+
+db_cli = AppGroup("db", help="Schema migrations and query plan checks.")
+app.cli.add_command(db_cli)
+
+
+def migration_files():
+    files = []
+    for fname in sorted(os.listdir(MIGRATIONS_DIR)):
+        if fname.endswith(".sql") and fname[:4].isdigit():
+            files.append((fname[:4], fname))
+    return files
+
+
+def split_sql(text):
+    """Split a migration file into statements (one per trailing ';')."""
+    statements, buf = [], []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("--"):
+            continue
+        buf.append(line)
+        if stripped.endswith(";"):
+            statements.append("\n".join(buf).rstrip().rstrip(";"))
+            buf = []
+    if buf:
+        statements.append("\n".join(buf))
+    return statements
+
+
+def applied_migrations(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version     CHAR(4) PRIMARY KEY,
+            name        VARCHAR(200) NOT NULL,
+            checksum    CHAR(64) NOT NULL,
+            applied_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("SELECT version, checksum FROM schema_migrations")
+    return {r[0]: r[1] for r in cur.fetchall()}
+
+
+@db_cli.command("upgrade")
+def db_upgrade():
+    """Apply pending migrations."""
+    conn = get_db()
+    cur = conn.cursor()
+    applied = applied_migrations(cur)
+
+    pending = [(v, f) for v, f in migration_files() if v not in applied]
+    if not pending:
+        click.echo("Schema is up to date.")
+
+    for version, fname in pending:
+        with open(os.path.join(MIGRATIONS_DIR, fname), encoding="utf-8") as f:
+            text = f.read()
+
+        click.echo(f"Applying {fname}")
+        for stmt in split_sql(text):
+            try:
+                cur.execute(stmt)
+            except Error as e:
+                if e.errno in IGNORABLE_DDL_ERRORS:
+                    click.echo(f"  skipped: {e.msg}")
+                    continue
+                # MySQL DDL is not transactional: earlier statements stay applied
+                conn.rollback()
+                cur.close()
+                raise click.ClickException(f"{fname} failed: {e}")
+
+        cur.execute(
+            "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+            (version, fname, hashlib.sha256(text.encode()).hexdigest())
+        )
+        conn.commit()
+
+    cur.close()
+    conn.close()
+
+
+@db_cli.command("status")
+def db_status():
+    """List migrations and whether they are applied."""
+    conn = get_db()
+    cur = conn.cursor()
+    applied = applied_migrations(cur)
+    cur.close()
+    conn.close()
+
+    for version, fname in migration_files():
+        with open(os.path.join(MIGRATIONS_DIR, fname), encoding="utf-8") as f:
+            checksum = hashlib.sha256(f.read().encode()).hexdigest()
+
+        if version not in applied:
+            state = "pending"
+        elif applied[version] != checksum:
+            state = "applied (file changed since!)"
+        else:
+            state = "applied"
+        click.echo(f"{fname:45} {state}")
+
+
+# --- EXPLAIN every statement the app issues ---
+# f-string pieces the extractor knows how to fill in
+EXPLAIN_FRAGMENTS = {"placeholders": "%s", "where": "WHERE 1=1"}
+DATE_PARAM = re.compile(r"\b(\w*(?:date|_at|_on))\s*(=|<=|>=|<|>)\s*%s", re.I)
+
+
+def _sql_text(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for v in node.values:
+            if isinstance(v, ast.Constant):
+                parts.append(v.value)
+            elif isinstance(v.value, ast.Name) and v.value.id in EXPLAIN_FRAGMENTS:
+                parts.append(EXPLAIN_FRAGMENTS[v.value.id])
+            else:
+                return None
+        return "".join(parts)
+    return None
+
+
+def app_statements(path=__file__):
+    """
+    Yield (function, lineno, sql) for every cur.execute() / fan_out() query
+    in the source.
+    Queries built up in a local variable are reassembled from the string
+    literals assigned / += to it before the call; ones that cannot be are
+    yielded with sql=None so they show up as skipped.
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+
+    seen = set()
+    for func in ast.walk(tree):
+        if not isinstance(func, ast.FunctionDef):
+            continue
+
+        assigns = sorted(
+            (n for n in ast.walk(func) if isinstance(n, (ast.Assign, ast.AugAssign))),
+            key=lambda n: n.lineno
+        )
+
+        for node in ast.walk(func):
+            # fan_out({"name": ("SELECT ...", params, "one"), ...})
+            if (isinstance(node, ast.Call)
+                    and isinstance(node.func, ast.Name)
+                    and node.func.id == "fan_out"
+                    and node.args
+                    and isinstance(node.args[0], ast.Dict)):
+                for value in node.args[0].values:
+                    if isinstance(value, ast.Tuple) and value.elts and value.lineno not in seen:
+                        seen.add(value.lineno)
+                        yield func.name, value.lineno, _sql_text(value.elts[0])
+                continue
+
+            if not (isinstance(node, ast.Call)
+                    and isinstance(node.func, ast.Attribute)
+                    and node.func.attr == "execute"
+                    and node.args):
+                continue
+            if node.lineno in seen:
+                continue
+            seen.add(node.lineno)
+
+            arg = node.args[0]
+            if isinstance(arg, ast.Name):
+                sql = None
+                built_here = False
+                for a in assigns:
+                    if a.lineno >= node.lineno:
+                        break
+                    if isinstance(a, ast.Assign) and any(
+                        isinstance(t, ast.Name) and t.id == arg.id for t in a.targets
+                    ):
+                        built_here = True
+                        sql = _sql_text(a.value)
+                    elif (isinstance(a, ast.AugAssign) and sql is not None
+                          and isinstance(a.target, ast.Name) and a.target.id == arg.id):
+                        extra = _sql_text(a.value)
+                        if extra is not None:
+                            sql += extra
+                if not built_here:
+                    # statement passed in from elsewhere (loop variable, parameter)
+                    continue
+            elif isinstance(arg, (ast.Constant, ast.JoinedStr)):
+                sql = _sql_text(arg)
+            else:
+                continue
+
+            yield func.name, node.lineno, sql
+
+
+def explainable(sql):
+    """Replace %s params with literals of a plausible type."""
+    sql = DATE_PARAM.sub(lambda m: f"{m.group(1)} {m.group(2)} '2024-01-01'", sql)
+    return sql.replace("%s", "'1'")
+
+
+@db_cli.command("explain")
+@click.option("--fail-on-scan", is_flag=True, help="Exit non-zero if any full scan is found.")
+def db_explain(fail_on_scan):
+    """EXPLAIN every statement in app.py and report full table scans."""
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+
+    explained = skipped = 0
+    scans = []
+
+    for func, lineno, sql in app_statements():
+        where = f"{func}:{lineno}"
+        if sql is None:
+            click.echo(f"{where:40} skipped (built dynamically)")
+            skipped += 1
+            continue
+
+        verb = sql.strip().split(None, 1)[0].upper()
+        if verb not in ("SELECT", "UPDATE", "DELETE") and " SELECT " not in sql.upper():
+            continue
+
+        try:
+            cur.execute("EXPLAIN " + explainable(sql))
+            plan = cur.fetchall()
+        except Error as e:
+            click.echo(f"{where:40} error: {e.msg}")
+            continue
+        explained += 1
+
+        for row in plan:
+            if row.get("type") in ("ALL", "index"):
+                kind = "FULL SCAN" if row["type"] == "ALL" else "full index scan"
+                scans.append(where)
+                click.echo(
+                    f"{where:40} {kind:16} table={row.get('table')} "
+                    f"rows={row.get('rows')} key={row.get('key')} extra={row.get('Extra') or ''}"
+                )
+
+    cur.close()
+    conn.close()
+
+    click.echo(
+        f"\n{explained} statements explained, {skipped} skipped, "
+        f"{len(set(scans))} with full scans."
+    )
+    if fail_on_scan and scans:
+        raise SystemExit(1)
+# -------------------------------------------------------------------------
+
+
+
+# ---------- PASSWORD HASHING ----------
+# Hash checks are CPU-bound, so they run in a small process pool instead of
+# the request thread. At most PASSWORD_MAX_INFLIGHT logins hash (or queue)
+# at a time; beyond that a login waits for a slot and then gets a 503.
+class LoginBusy(Exception):
+    """Too many logins are already being verified."""
+
+
+_hash_executor = None
+_hash_executor_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(config.PASSWORD_MAX_INFLIGHT)
+
+
+def password_method():
+    """Method string for the configured scheme, as stored in the hash prefix."""
+    if config.PASSWORD_SCHEME == "bcrypt":
+        return f"bcrypt:{config.BCRYPT_ROUNDS}"
+    if config.PASSWORD_SCHEME == "pbkdf2":
+        return f"pbkdf2:sha256:{config.PBKDF2_ITERATIONS}"
+    return f"scrypt:{config.SCRYPT_N}:8:1"
+
+
+def _bcrypt_bytes(password):
+    # bcrypt only looks at the first 72 bytes (and newer versions refuse more)
+    return password.encode("utf-8")[:72]
+
+
+def _hash_password(password, method):
+    if method.startswith("bcrypt:"):
+        rounds = int(method.split(":")[1])
+        return bcrypt.hashpw(_bcrypt_bytes(password), bcrypt.gensalt(rounds)).decode()
+    return generate_password_hash(password, method=method)
+
+
+def _check_password(stored, password):
+    if stored.startswith("$2"):
+        try:
+            return bcrypt.checkpw(_bcrypt_bytes(password), stored.encode())
+        except ValueError:
+            return False
+    return check_password_hash(stored, password)
+
+
+def password_needs_rehash(stored):
+    """True if `stored` was made with another scheme or older parameters."""
+    if stored.startswith("$2"):
+        if config.PASSWORD_SCHEME != "bcrypt":
+            return True
+        return int(stored.split("$")[2]) != config.BCRYPT_ROUNDS
+    return stored.split("$", 1)[0] != password_method()
+
+
+def _run_hash_job(fn, *args):
+    global _hash_executor
+
+    if config.PASSWORD_WORKERS <= 0:
+        return fn(*args)
+
+    if not _hash_slots.acquire(timeout=config.PASSWORD_QUEUE_TIMEOUT):
+        raise LoginBusy()
+    try:
+        if _hash_executor is None:
+            with _hash_executor_lock:
+                if _hash_executor is None:
+                    _hash_executor = ProcessPoolExecutor(max_workers=config.PASSWORD_WORKERS)
+        return _hash_executor.submit(fn, *args).result()
+    finally:
+        _hash_slots.release()
+
+
+def hash_password(password):
+    return _run_hash_job(_hash_password, password, password_method())
+
+
+def verify_password(stored, password):
+    if not stored or not password:
+        return False
+    return _run_hash_job(_check_password, stored, password)
+
+
+@app.errorhandler(LoginBusy)
+def login_busy(e):
+    return "Too many people are signing in right now. Please try again in a few seconds.", 503, {"Retry-After": "5"}
+# -------------------------------------------------------------------------
+
+
+
+# ---------- SESSIONS ----------
+# Session data is kept server-side in a small file store; the cookie only
+# holds a signed session id. The same store caches each logged-in user's
+# "principal" (ids the routes keep needing), which is dropped whenever the
+# underlying users / parent_student / students rows change.
+class FileStore:
+    """On-disk key-value store, one file per key, with per-key expiry."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._file(key), "r", encoding="utf-8") as f:
+                expires = float(f.readline())
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+        if expires < time.time():
+            self.delete(key)
+            return None
+        return data
+
+    def set(self, key, value, ttl):
+        path = self._file(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f"{time.time() + ttl}\n{value}")
+        os.replace(tmp, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        now = time.time()
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    expired = float(f.readline()) < now
+                if expired:
+                    os.remove(path)
+            except (OSError, ValueError):
+                pass
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.old_sid = None
+        self.modified = False
+
+    def rotate(self):
+        """New session id (call on login to prevent session fixation)."""
+        self.old_sid = self.old_sid or self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class FileSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt="server-session")
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                data = self.store.get("session:" + sid)
+                if data is not None:
+                    return ServerSideSession(self.serializer.loads(data), sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.old_sid:
+            self.store.delete("session:" + session.old_sid)
+
+        if not session:
+            if session.modified:
+                self.store.delete("session:" + session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        ttl = (
+            int(app.permanent_session_lifetime.total_seconds())
+            if session.permanent else config.SESSION_TTL
+        )
+        self.store.set("session:" + session.sid, self.serializer.dumps(dict(session)), ttl)
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            domain=domain,
+            path=path,
+        )
+
+        # expired session files are cleaned up now and then
+        if secrets.randbelow(1000) == 0:
+            self.store.sweep()
+
+
+session_store = FileStore(config.SESSION_DIR)
+app.session_interface = FileSessionInterface(session_store)
+
+
+def load_principal(user_id):
+    """Build the principal for a user from the database (None if gone)."""
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+
+    cur.execute("SELECT id, username, role FROM users WHERE id=%s", (user_id,))
+    user = cur.fetchone()
+    if not user:
+        cur.close()
+        conn.close()
+        return None
+
+    principal = {
+        "user_id": user["id"],
+        "username": user["username"],
+        "role": user["role"],
+        "student_id": None,
+        "child_ids": [],
+        "class_ids": [],
+    }
+
+    if user["role"] == "student":
+        cur.execute("SELECT id, class_id FROM students WHERE user_id=%s", (user_id,))
+        student = cur.fetchone()
+        if student:
+            principal["student_id"] = student["id"]
+            principal["class_ids"] = [student["class_id"]] if student["class_id"] else []
+
+    elif user["role"] == "parent":
+        cur.execute("""
+            SELECT s.id, s.class_id
+            FROM parent_student ps
+            JOIN students s ON s.id = ps.student_id
+            WHERE ps.parent_user_id = %s
+            ORDER BY s.id
+        """, (user_id,))
+        children = cur.fetchall()
+        principal["child_ids"] = [c["id"] for c in children]
+        principal["class_ids"] = sorted({c["class_id"] for c in children if c["class_id"]})
+
+    cur.close()
+    conn.close()
+    return principal
+
+
+def current_principal():
+    """Cached principal of the logged-in user, or None."""
+    if "principal" in g:
+        return g.principal
+
+    user_id = session.get("user_id")
+    if not user_id:
+        return None
+
+    key = f"principal:{user_id}"
+    data = session_store.get(key)
+    if data is not None:
+        principal = json.loads(data)
+    else:
+        principal = load_principal(user_id)
+        if principal is not None:
+            session_store.set(key, json.dumps(principal), config.PRINCIPAL_TTL)
+
+    g.principal = principal
+    return principal
+
+
+def invalidate_principal(user_id):
+    if user_id:
+        session_store.delete(f"principal:{user_id}")
+    if "principal" in g and g.principal and g.principal["user_id"] == user_id:
+        g.pop("principal")
+
+
+def invalidate_student_principals(cur, student_id):
+    """Drop cached principals of a student's own account and linked parents."""
+    cur.execute("""
+        SELECT user_id AS uid FROM students WHERE id=%s
+        UNION
+        SELECT parent_user_id AS uid FROM parent_student WHERE student_id=%s
+    """, (student_id, student_id))
+    for row in cur.fetchall():
+        uid = row["uid"] if isinstance(row, dict) else row[0]
+        invalidate_principal(uid)
+
+
+@app.before_request
+def sync_principal():
+    """Keep session role/username in step with edits made by an admin."""
+    if "user_id" not in session:
+        return
+
+    principal = current_principal()
+    if principal is None:
+        # account was deleted
+        session.clear()
+        return
+
+    if session.get("role") != principal["role"]:
+        session["role"] = principal["role"]
+    if session.get("user") != principal["username"]:
+        session["user"] = principal["username"]
+    if principal["student_id"] and session.get("student_id") != principal["student_id"]:
+        session["student_id"] = principal["student_id"]
+# -------------------------------------------------------------------------
+
+
+
+# ---------- DASHBOARD COUNTERS ----------
+# dashboard_counters holds running totals for the admin / teacher
+# dashboards. Write paths call bump_counters() with the same cursor,
+# before their commit, so a counter changes in the same transaction as
+# the rows it counts. `flask --app app db rebuild-counters` recomputes
+# everything from scratch and reports any drift.
+COUNTER_QUERIES = {
+    "users": "SELECT COUNT(*) FROM users",
+    "teachers": "SELECT COUNT(*) FROM users WHERE role='teacher'",
+    "parents": "SELECT COUNT(*) FROM users WHERE role='parent'",
+    "students": "SELECT COUNT(*) FROM students",
+    "classes": "SELECT COUNT(*) FROM classes",
+    "assignments": "SELECT COUNT(*) FROM assignments",
+    "pending_submissions": """
+        SELECT COUNT(*)
+        FROM students s
+        JOIN assignments a ON a.class_id = s.class_id
+        LEFT JOIN assignment_submissions sub
+            ON sub.student_id = s.id
+            AND sub.assignment_id = a.id
+        WHERE sub.id IS NULL
+    """,
+}
+
+# users.role -> per-role counter
+ROLE_COUNTERS = {"teacher": "teachers", "parent": "parents"}
+
+
+def bump_counters(cur, **deltas):
+    """Add deltas to dashboard_counters inside the caller's transaction."""
+    rows = sorted((name, delta) for name, delta in deltas.items() if delta)
+    if not rows:
+        return
+    cur.execute(
+        "INSERT INTO dashboard_counters (name, value) VALUES "
+        + ", ".join(["(%s, %s)"] * len(rows))
+        + " ON DUPLICATE KEY UPDATE value = value + VALUES(value)",
+        [v for row in rows for v in row]
+    )
+
+
+def read_counters(cur, *names):
+    placeholders = ",".join(["%s"] * len(names))
+    cur.execute(
+        f"SELECT name, value FROM dashboard_counters WHERE name IN ({placeholders})",
+        names
+    )
+    values = dict.fromkeys(names, 0)
+    for row in cur.fetchall():
+        if isinstance(row, dict):
+            values[row["name"]] = row["value"]
+        else:
+            values[row[0]] = row[1]
+    return values
+
+
+def _scalar(cur):
+    row = cur.fetchone()
+    if row is None:
+        return 0
+    return list(row.values())[0] if isinstance(row, dict) else row[0]
+
+
+def pending_for_student(cur, student_id, class_id):
+    """Assignments of `class_id` the student has not submitted."""
+    if not class_id:
+        return 0
+    cur.execute("""
+        SELECT COUNT(*)
+        FROM assignments a
+        LEFT JOIN assignment_submissions sub
+            ON sub.assignment_id = a.id
+            AND sub.student_id = %s
+        WHERE a.class_id = %s
+          AND sub.id IS NULL
+    """, (student_id, class_id))
+    return _scalar(cur)
+
+
+@db_cli.command("rebuild-counters")
+def db_rebuild_counters():
+    """Recompute dashboard_counters from the base tables."""
+    conn = get_db()
+    cur = conn.cursor()
+
+    # lock the counter rows so concurrent writers queue behind the rebuild
+    old = {}
+    cur.execute("SELECT name, value FROM dashboard_counters FOR UPDATE")
+    for name, value in cur.fetchall():
+        old[name] = value
+
+    for name, sql in COUNTER_QUERIES.items():
+        cur.execute(sql)
+        value = cur.fetchone()[0]
+        cur.execute(
+            "REPLACE INTO dashboard_counters (name, value) VALUES (%s, %s)",
+            (name, value)
+        )
+        drift = value - old.get(name, 0)
+        click.echo(f"{name:22} {value:>10}" + (f"   (drift {drift:+})" if drift else ""))
+
+    conn.commit()
+    cur.close()
+    conn.close()
+# -------------------------------------------------------------------------
+
+
+# ---------- REFERENCE DATA ----------
+# Small lookup lists that almost every form needs (classes, ...) are cached
+# in each process. reference_versions holds one version per list: writers
+# bump it in the same transaction as their change and then call
+# reference_data.stale(). Other processes re-read the versions at most every
+# REFDATA_CHECK_SECONDS and reload a list only when its version moved, so in
+# steady state no request queries for them.
+REFERENCE_QUERIES = {
+    "classes": "SELECT id, name, section FROM classes ORDER BY name, section",
+    # the free-text students.class values; add/edit/delete_student bump it
+    "student_classes": (
+        "SELECT DISTINCT class FROM students"
+        " WHERE class IS NOT NULL AND class <> '' ORDER BY class"
+    ),
+}
+
+
+class ReferenceCache:
+    def __init__(self, queries, check_every):
+        self.queries = queries
+        self.check_every = check_every
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._data = {}   # name -> (version, rows)
+        self._checked_at = float("-inf")
+
+    def _fetch(self, sql):
+        # on the caller's own connection: the request usually holds one
+        # already, and waiting on the pool for a second (under the lock, at
+        # that) starves everyone once the pool is saturated
+        conn = get_db()
+        cur = conn.cursor(dictionary=True)
+        cur.execute(sql)
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+        return rows
+
+    def get(self, name):
+        """Cached rows for `name`; treat them as read-only."""
+        # queries run outside the lock; only the swap happens under it
+        now = time.monotonic()
+        with self._lock:
+            check = now - self._checked_at >= self.check_every
+            if check:
+                self._checked_at = now
+        if check:
+            rows = self._fetch("SELECT name, version FROM reference_versions")
+            with self._lock:
+                self._versions = {r["name"]: r["version"] for r in rows}
+
+        with self._lock:
+            version = self._versions.get(name, 0)
+            cached = self._data.get(name)
+        if cached is None or cached[0] != version:
+            cached = (version, self._fetch(self.queries[name]))
+            with self._lock:
+                self._data[name] = cached
+            print(f"REFDATA: loaded {name} v{version} ({len(cached[1])} rows)")
+        return cached[1]
+
+    def stale(self, name):
+        """Drop the local copy; call after committing a bump_reference()."""
+        with self._lock:
+            self._data.pop(name, None)
+            self._checked_at = float("-inf")
+
+
+reference_data = ReferenceCache(REFERENCE_QUERIES, config.REFDATA_CHECK_SECONDS)
+
+
+def bump_reference(cur, name):
+    """Move `name` to a new version inside the caller's transaction."""
+    cur.execute(
+        "INSERT INTO reference_versions (name, version) VALUES (%s, 1)"
+        " ON DUPLICATE KEY UPDATE version = version + 1",
+        (name,)
+    )
+# -------------------------------------------------------------------------
+
+
+# ---------- BULK WRITES ----------
+# Saving a whole class (attendance roster, marks) used to be one statement
+# per student. bulk_upsert() writes them as a few multi-row
+# INSERT ... ON DUPLICATE KEY UPDATE statements in the caller's transaction.
+def bulk_upsert(cur, table, key, columns, rows, update=None, chunk=None):
+    """
+    Upsert `rows` (tuples in `columns` order) into `table`.
+
+    key:    columns of the unique key the rows collide on
+    update: columns overwritten on a duplicate (default: all non-key columns),
+            or {column: SQL expression} for anything other than VALUES(column)
+
+    Returns {"inserted": n, "updated": n, "new": [key tuples that were inserted]}.
+    Each chunk first reads which keys already exist, so the split is exact
+    unless another request writes the same keys at the same moment.
+    """
+    update = update or [c for c in columns if c not in key]
+    chunk = chunk or config.BULK_UPSERT_CHUNK
+    key_pos = [columns.index(c) for c in key]
+
+    row_sql = "(" + ",".join(["%s"] * len(columns)) + ")"
+    key_sql = "(" + ",".join(["%s"] * len(key)) + ")"
+    result = {"inserted": 0, "updated": 0, "new": []}
+
+    for start in range(0, len(rows), chunk):
+        batch = rows[start:start + chunk]
+        keys = [tuple(row[i] for i in key_pos) for row in batch]
+
+        cur.execute(
+            f"SELECT {', '.join(key)} FROM {table}"
+            f" WHERE ({', '.join(key)}) IN ({','.join([key_sql] * len(keys))})",
+            [v for k in keys for v in k]
+        )
+        existing = set()
+        for r in cur.fetchall():
+            values = r.values() if isinstance(r, dict) else r
+            existing.add(tuple(str(v) for v in values))
+
+        cur.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+            + ",".join([row_sql] * len(batch))
+            + " ON DUPLICATE KEY UPDATE "
+            + ", ".join(
+                f"{c} = {update[c]}" if isinstance(update, dict) else f"{c} = VALUES({c})"
+                for c in update
+            ),
+            [v for row in batch for v in row]
+        )
+
+        for k in keys:
+            if tuple(str(v) for v in k) in existing:
+                result["updated"] += 1
+            else:
+                result["inserted"] += 1
+                result["new"].append(k)
+
+    return result
+
+
+def attendance_locked(day):
+    """True when `day` (a date) is past the ATTENDANCE_LOCK_DAYS edit window."""
+    return (date.today() - day).days > config.ATTENDANCE_LOCK_DAYS
+# -------------------------------------------------------------------------
+
+
+# ---------- ATTENDANCE BITMAPS ----------
+# attendance_bits holds one row per (student, month) with three 31-bit
+# masks: bit d-1 of present / absent / on_leave is set when the student had
+# that status on day d. Summaries are BIT_COUNT() over a few integers per
+# student instead of a scan of every attendance row they ever had. Write
+# paths call record_attendance_bits() with the same cursor, before their
+# commit; it also refreshes the matching attendance_monthly_rollup rows.
+# `flask --app app db backfill-attendance-bits` rebuilds the table.
+def _attendance_bucket(status):
+    status = (status or "").strip().lower()
+    # anything that is neither present nor leave counts as absent
+    return status if status in ("present", "leave") else "absent"
+
+
+def record_attendance_bits(cur, entries):
+    """entries: (student_id, date or "YYYY-MM-DD", status) for rows just written."""
+    rows = []
+    months = set()
+    for student_id, day, status in entries:
+        if isinstance(day, str):
+            day = datetime.strptime(day, "%Y-%m-%d").date()
+        bit = 1 << (day.day - 1)
+        bucket = _attendance_bucket(status)
+        months.add((int(student_id), day.replace(day=1)))
+        rows.append((
+            int(student_id), day.replace(day=1),
+            bit if bucket == "present" else 0,
+            bit if bucket == "absent" else 0,
+            bit if bucket == "leave" else 0,
+        ))
+    # same lock order in every transaction
+    rows.sort(key=lambda r: (r[0], r[1]))
+
+    # exactly one of the three new values carries the day's bit: clear it
+    # everywhere, then set it in the right mask
+    cleared = "(%s & ~(VALUES(present) | VALUES(absent) | VALUES(on_leave)))"
+    for start in range(0, len(rows), config.BULK_UPSERT_CHUNK):
+        batch = rows[start:start + config.BULK_UPSERT_CHUNK]
+        cur.execute(
+            "INSERT INTO attendance_bits (student_id, month, present, absent, on_leave) VALUES "
+            + ",".join(["(%s,%s,%s,%s,%s)"] * len(batch))
+            + " ON DUPLICATE KEY UPDATE "
+            + ", ".join(
+                f"{c} = {cleared % c} | VALUES({c})"
+                for c in ("present", "absent", "on_leave")
+            ),
+            [v for row in batch for v in row]
+        )
+
+    refresh_monthly_rollup(cur, months)
+    for student_id in {student_id for student_id, _ in months}:
+        pdf_cache.invalidate(student_id)
+
+
+@db_cli.command("backfill-attendance-bits")
+@click.option("--batch", default=500, show_default=True, help="Students per transaction.")
+def db_backfill_attendance_bits(batch):
+    """Rebuild attendance_bits from the attendance table."""
+    conn = get_db()
+    cur = conn.cursor()
+
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM students")
+    last_id = cur.fetchone()[0]
+    rows = 0
+
+    for first in range(1, last_id + 1, batch):
+        last = first + batch - 1
+        cur.execute(
+            "DELETE FROM attendance_bits WHERE student_id BETWEEN %s AND %s",
+            (first, last)
+        )
+        cur.execute("""
+            INSERT INTO attendance_bits (student_id, month, present, absent, on_leave)
+            SELECT
+                student_id,
+                DATE_SUB(date, INTERVAL DAY(date) - 1 DAY),
+                BIT_OR(IF(LOWER(status) = 'present', 1 << (DAY(date) - 1), 0)),
+                BIT_OR(IF(LOWER(status) NOT IN ('present', 'leave'), 1 << (DAY(date) - 1), 0)),
+                BIT_OR(IF(LOWER(status) = 'leave', 1 << (DAY(date) - 1), 0))
+            FROM attendance
+            WHERE student_id BETWEEN %s AND %s
+            GROUP BY student_id, DATE_SUB(date, INTERVAL DAY(date) - 1 DAY)
+        """, (first, last))
+        rows += cur.rowcount
+        conn.commit()
+        click.echo(f"students {first}-{last}: {rows} month rows so far")
+
+    cur.close()
+    conn.close()
+    click.echo(f"Done, {rows} month rows.")
+# -------------------------------------------------------------------------
+
+
+# ---------- ATTENDANCE ROLLUPS ----------
+# attendance_monthly_rollup: present / absent / leave / total per student
+# and month, with the student's class, for /attendance/monthly. The write
+# paths refresh the touched rows from attendance_bits (via
+# record_attendance_bits); `flask --app app db compact-rollups`, run daily,
+# rebuilds recent months of both tables from the attendance rows.
+def refresh_monthly_rollup(cur, keys):
+    """Recompute rollup rows for (student_id, month) keys from attendance_bits."""
+    keys = sorted(keys)
+    for start in range(0, len(keys), config.BULK_UPSERT_CHUNK):
+        batch = keys[start:start + config.BULK_UPSERT_CHUNK]
+        cur.execute(
+            """
+            INSERT INTO attendance_monthly_rollup
+                (student_id, class_id, month, present, absent, on_leave, total)
+            SELECT
+                b.student_id, s.class_id, b.month,
+                BIT_COUNT(b.present), BIT_COUNT(b.absent), BIT_COUNT(b.on_leave),
+                BIT_COUNT(b.present | b.absent | b.on_leave)
+            FROM attendance_bits b
+            JOIN students s ON s.id = b.student_id
+            WHERE (b.student_id, b.month) IN (""" + ",".join(["(%s,%s)"] * len(batch)) + """)
+            ON DUPLICATE KEY UPDATE
+                class_id = VALUES(class_id),
+                present = VALUES(present),
+                absent = VALUES(absent),
+                on_leave = VALUES(on_leave),
+                total = VALUES(total)
+            """,
+            [v for key in batch for v in key]
+        )
+
+
+def _rollup_rows(cur, month):
+    cur.execute("""
+        SELECT student_id, class_id, present, absent, on_leave, total
+        FROM attendance_monthly_rollup
+        WHERE month = %s
+    """, (month,))
+    return {row[0]: row[1:] for row in cur.fetchall()}
+
+
+@db_cli.command("compact-rollups")
+@click.option("--months", default=2, show_default=True, help="Recent months to rebuild, this one included.")
+def db_compact_rollups(months):
+    """Rebuild recent attendance_bits / attendance_monthly_rollup months from attendance."""
+    conn = get_db()
+    cur = conn.cursor()
+
+    first = date.today().replace(day=1)
+    for _ in range(months):
+        after = (first + timedelta(days=32)).replace(day=1)
+        old = _rollup_rows(cur, first)
+
+        cur.execute(
+            "DELETE FROM attendance_bits WHERE month = %s", (first,)
+        )
+        cur.execute("""
+            INSERT INTO attendance_bits (student_id, month, present, absent, on_leave)
+            SELECT
+                student_id,
+                %s,
+                BIT_OR(IF(LOWER(status) = 'present', 1 << (DAY(date) - 1), 0)),
+                BIT_OR(IF(LOWER(status) NOT IN ('present', 'leave'), 1 << (DAY(date) - 1), 0)),
+                BIT_OR(IF(LOWER(status) = 'leave', 1 << (DAY(date) - 1), 0))
+            FROM attendance
+            WHERE date >= %s AND date < %s
+            GROUP BY student_id
+        """, (first, first, after))
+
+        cur.execute(
+            "DELETE FROM attendance_monthly_rollup WHERE month = %s", (first,)
+        )
+        cur.execute("""
+            INSERT INTO attendance_monthly_rollup
+                (student_id, class_id, month, present, absent, on_leave, total)
+            SELECT
+                b.student_id, s.class_id, b.month,
+                BIT_COUNT(b.present), BIT_COUNT(b.absent), BIT_COUNT(b.on_leave),
+                BIT_COUNT(b.present | b.absent | b.on_leave)
+            FROM attendance_bits b
+            JOIN students s ON s.id = b.student_id
+            WHERE b.month = %s
+        """, (first,))
+
+        new = _rollup_rows(cur, first)
+        conn.commit()
+
+        drift = sum(1 for sid in old.keys() | new.keys() if old.get(sid) != new.get(sid))
+        click.echo(f"{first:%Y-%m}  {len(new):>8} rows" + (f"   (drift {drift})" if drift else ""))
+
+        first = (first - timedelta(days=1)).replace(day=1)
+
+    cur.close()
+    conn.close()
+# -------------------------------------------------------------------------
+
+
+
+# ---------- FEE ROLLUPS ----------
+# fees_monthly_rollup: fee count and amount per (class, month, status) for
+# the /fees/reports summary, so it reads classes x months rows instead of
+# every fee. A write path takes the fees it is about to change out of the
+# rollup and puts them back afterwards, in the same transaction:
+#   adjust_fee_rollup(cur, "f.id = %s", (fee_id,), -1)
+#   UPDATE fees ...
+#   adjust_fee_rollup(cur, "f.id = %s", (fee_id,), +1)
+# Students moving class or being deleted adjust their fees the same way.
+# `flask --app app db rebuild-fee-rollups` recomputes the table (e.g. after
+# fees were changed outside the app) and reports drift.
+FEE_ROLLUP_SELECT = """
+    SELECT
+        COALESCE(s.class_id, 0) AS class_id,
+        DATE_SUB(DATE(f.created_at), INTERVAL DAY(f.created_at) - 1 DAY) AS month,
+        f.status,
+        %s * COUNT(*) AS records,
+        %s * SUM(f.amount) AS amount
+    FROM fees f
+    LEFT JOIN students s ON s.id = f.student_id
+    WHERE {where}
+    GROUP BY 1, 2, 3
+"""
+
+
+def adjust_fee_rollup(cur, where, params, sign):
+    """Add (sign=1) or take out (sign=-1) the fees matching `where` (fees f, students s)."""
+    cur.execute(
+        "INSERT INTO fees_monthly_rollup (class_id, month, status, records, amount)"
+        + FEE_ROLLUP_SELECT.format(where=where)
+        + """
+        ON DUPLICATE KEY UPDATE
+            records = fees_monthly_rollup.records + VALUES(records),
+            amount = fees_monthly_rollup.amount + VALUES(amount)
+        """,
+        [sign, sign] + list(params)
+    )
+
+
+def _fee_rollup_rows(cur):
+    cur.execute("""
+        SELECT class_id, month, status, records, amount
+        FROM fees_monthly_rollup
+        WHERE records <> 0 OR amount <> 0
+    """)
+    return {tuple(row[:3]): tuple(row[3:]) for row in cur.fetchall()}
+
+
+@db_cli.command("rebuild-fee-rollups")
+def db_rebuild_fee_rollups():
+    """Recompute fees_monthly_rollup from the fees table."""
+    conn = get_db()
+    cur = conn.cursor()
+
+    old = _fee_rollup_rows(cur)
+    cur.execute("DELETE FROM fees_monthly_rollup")
+    cur.execute(
+        "INSERT INTO fees_monthly_rollup (class_id, month, status, records, amount)"
+        + FEE_ROLLUP_SELECT.format(where="1=1"),
+        (1, 1)
+    )
+    new = _fee_rollup_rows(cur)
+    conn.commit()
+
+    drift = sorted(k for k in old.keys() | new.keys() if old.get(k) != new.get(k))
+    for class_id, month, status in drift:
+        was = old.get((class_id, month, status), (0, 0))
+        now = new.get((class_id, month, status), (0, 0))
+        click.echo(f"  class {class_id} {month:%Y-%m} {status}: {was[0]} / {was[1]} -> {now[0]} / {now[1]}")
+    click.echo(f"{len(new)} rollup rows, {len(drift)} drifted.")
+
+    cur.close()
+    conn.close()
+# -------------------------------------------------------------------------
+
+
+
+# ---------- FEE BALANCES ----------
+# fee_balances: billed / paid / outstanding / unpaid count / last payment per
+# student, so receipts, profiles and the dues reports read one row instead
+# of summing the student's fees. Every fee write path calls
+# refresh_fee_balances() for the students it touched before committing, so
+# the balance changes in the same transaction as the fees. The recompute
+# is an INSERT ... SELECT, which locks the fees it reads, so two writes to
+# one student's fees queue up instead of racing.
+# `flask --app app db verify-fee-balances [--fix]` reports drift.
+FEE_BALANCE_SELECT = """
+    SELECT
+        s.id AS student_id,
+        COALESCE(SUM(f.amount), 0) AS billed,
+        COALESCE(SUM(CASE WHEN f.status = 'paid' THEN f.amount END), 0) AS paid,
+        COALESCE(SUM(CASE WHEN f.status = 'unpaid' THEN f.amount END), 0) AS outstanding,
+        COUNT(CASE WHEN f.status = 'unpaid' THEN 1 END) AS unpaid_count,
+        MAX(CASE WHEN f.status = 'paid' THEN f.paid_on END) AS last_payment
+    FROM students s
+    LEFT JOIN fees f ON f.student_id = s.id
+    WHERE {where}
+    GROUP BY s.id
+"""
+FEE_BALANCE_COLUMNS = ("billed", "paid", "outstanding", "unpaid_count", "last_payment")
+# what a student without a fee_balances row (no fees yet) stands for
+EMPTY_FEE_BALANCE = {"billed": 0, "paid": 0, "outstanding": 0, "unpaid_count": 0, "last_payment": None}
+
+
+def refresh_fee_balances(cur, student_ids):
+    """Recompute the fee_balances rows of `student_ids` from their fees."""
+    student_ids = sorted({int(sid) for sid in student_ids if sid})
+    for start in range(0, len(student_ids), config.BULK_UPSERT_CHUNK):
+        batch = student_ids[start:start + config.BULK_UPSERT_CHUNK]
+        cur.execute(
+            "INSERT INTO fee_balances (student_id, billed, paid, outstanding, unpaid_count, last_payment)"
+            + FEE_BALANCE_SELECT.format(where="s.id IN (" + ",".join(["%s"] * len(batch)) + ")")
+            + """
+            ON DUPLICATE KEY UPDATE
+                billed = VALUES(billed),
+                paid = VALUES(paid),
+                outstanding = VALUES(outstanding),
+                unpaid_count = VALUES(unpaid_count),
+                last_payment = VALUES(last_payment)
+            """,
+            batch
+        )
+
+
+@db_cli.command("verify-fee-balances")
+@click.option("--fix", is_flag=True, help="Rewrite the rows that drifted.")
+def db_verify_fee_balances(fix):
+    """Recompute fee_balances from the fees table and report drift."""
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+
+    cur.execute(FEE_BALANCE_SELECT.format(where="1=1"))
+    expected = {r["student_id"]: r for r in cur.fetchall()}
+    cur.execute(
+        "SELECT student_id, " + ", ".join(FEE_BALANCE_COLUMNS) + " FROM fee_balances"
+    )
+    stored = {r["student_id"]: r for r in cur.fetchall()}
+
+    drifted = []
+    for student_id in sorted(expected.keys() | stored.keys()):
+        want = expected.get(student_id)
+        have = stored.get(student_id, EMPTY_FEE_BALANCE)
+        if want is None:
+            # student deleted; the foreign key normally takes the row with it
+            continue
+        changed = [c for c in FEE_BALANCE_COLUMNS if have[c] != want[c]]
+        if changed:
+            drifted.append(student_id)
+            click.echo(f"  student {student_id}: " + ", ".join(
+                f"{c} {have[c]} -> {want[c]}" for c in changed
+            ))
+
+    if fix and drifted:
+        refresh_fee_balances(cur, drifted)
+        conn.commit()
+    click.echo(
+        f"{len(expected)} students, {len(drifted)} balances drifted"
+        + (", fixed." if fix and drifted else ".")
+    )
+    cur.close()
+    conn.close()
+    if drifted and not fix:
+        raise SystemExit(1)
+# -------------------------------------------------------------------------
+
+
+
+# ---------- REPORT CARD PDFs ----------
+# The drawing lives in pdf_render.py; this section loads the plain data it
+# takes (student row, term marks, attendance counts) and spreads class
+# batches over a process pool. A batch is cut into chunks of
+# REPORT_BATCH_CHUNK cards and each worker runs
+# pdf_render.render_report_card_chunk, which returns one PDF per card (for a
+# ZIP) or one multi-page PDF per chunk (joined here with pypdf for a merged
+# download). Classes above REPORT_BATCH_SYNC_MAX students are rendered by a
+# "report_cards" background job (see BACKGROUND JOBS).
+ATTENDANCE_LABELS = (("Present", "present"), ("Absent", "absent"), ("Leave", "on_leave"))
+
+
+def attendance_summary(counts):
+    """[{status, cnt}] from a row of present / absent / on_leave day counts."""
+    if not counts:
+        return []
+    return [
+        {"status": status, "cnt": int(counts[col])}
+        for status, col in ATTENDANCE_LABELS
+        if counts[col]
+    ]
+
+
+_pdf_executor = None
+_pdf_executor_lock = threading.Lock()
+
+
+def pdf_executor():
+    global _pdf_executor
+
+    if _pdf_executor is None:
+        with _pdf_executor_lock:
+            if _pdf_executor is None:
+                _pdf_executor = ProcessPoolExecutor(max_workers=config.REPORT_WORKERS)
+    return _pdf_executor
+
+
+def load_class_report_cards(cur, class_id, term):
+    """
+    Report card data for every student of a class, in two queries: students
+    with their term marks, then attendance counts. None if no such class.
+    """
+    cls = next((c for c in reference_data.get("classes") if c["id"] == class_id), None)
+    if cls is None:
+        return None
+
+    cur.execute("""
+        SELECT s.id, s.name, m.subject, m.marks, m.max_marks
+        FROM students s
+        LEFT JOIN marks m ON m.student_id = s.id AND m.exam = %s
+        WHERE s.class_id = %s
+        ORDER BY s.name, s.id, m.id
+    """, (term, class_id))
+
+    cards = {}
+    for row in cur.fetchall():
+        card = cards.get(row["id"])
+        if card is None:
+            card = cards[row["id"]] = {
+                "student": {
+                    "id": row["id"],
+                    "name": row["name"],
+                    "class_name": cls["name"],
+                    "section": cls["section"],
+                },
+                "term": term,
+                "results": [],
+                "attendance": [],
+            }
+        if row["subject"] is not None:
+            card["results"].append({
+                "subject": row["subject"],
+                "marks": row["marks"],
+                "max_marks": row["max_marks"],
+            })
+
+    cur.execute("""
+        SELECT
+            b.student_id,
+            SUM(BIT_COUNT(b.present)) AS present,
+            SUM(BIT_COUNT(b.absent)) AS absent,
+            SUM(BIT_COUNT(b.on_leave)) AS on_leave
+        FROM students s
+        JOIN attendance_bits b ON b.student_id = s.id
+        WHERE s.class_id = %s
+        GROUP BY b.student_id
+    """, (class_id,))
+    for row in cur.fetchall():
+        if row["student_id"] in cards:
+            cards[row["student_id"]]["attendance"] = attendance_summary(row)
+
+    return list(cards.values())
+
+
+def render_report_batch(cards, merged, progress=None):
+    """
+    Render `cards` across the PDF process pool and return ZIP bytes, or one
+    merged PDF when `merged`. progress(done, total) is called as chunks finish.
+    """
+    size = max(config.REPORT_BATCH_CHUNK, 1)
+    if merged and PdfWriter is None:
+        size = max(len(cards), 1)
+    chunks = [cards[i:i + size] for i in range(0, len(cards), size)]
+
+    if config.REPORT_WORKERS <= 0:
+        finished = ((n, render_report_card_chunk(chunk, merged)) for n, chunk in enumerate(chunks))
+    else:
+        executor = pdf_executor()
+        futures = {
+            executor.submit(render_report_card_chunk, chunk, merged): n
+            for n, chunk in enumerate(chunks)
+        }
+        finished = ((futures[f], f.result()) for f in as_completed(futures))
+
+    rendered = [None] * len(chunks)
+    done = 0
+    for n, result in finished:
+        rendered[n] = result
+        done += len(chunks[n])
+        if progress:
+            progress(done, len(cards))
+
+    if merged:
+        if len(rendered) == 1:
+            return rendered[0]
+        writer = PdfWriter()
+        for pdf in rendered:
+            writer.append(PdfReader(io.BytesIO(pdf)))
+        out = io.BytesIO()
+        writer.write(out)
+        return out.getvalue()
+
+    out = io.BytesIO()
+    # ReportLab already deflates page streams
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as zf:
+        for chunk in rendered:
+            for name, pdf in chunk:
+                zf.writestr(name, pdf)
+    return out.getvalue()
+# -------------------------------------------------------------------------
+
+
+
+# ---------- PDF CACHE ----------
+# Generated PDFs are kept on disk as PDF_CACHE_DIR/<student id>/<key>.pdf,
+# where the key is a SHA-256 of everything drawn on the page plus the
+# template version (pdf_cache_key). A hit can therefore never be out of date:
+# once marks, attendance or fees change, the next download hashes to a new
+# key. Write paths still call pdf_cache.invalidate(student_id) so superseded
+# files go at once instead of waiting for eviction. The key doubles as the
+# ETag, so a browser revalidating an unchanged PDF gets a 304 without a render.
+#
+# Hits bump the file's mtime; when the cache grows past PDF_CACHE_MAX_MB the
+# least recently used files are removed. Each process counts its own writes
+# between directory scans, so the cap can be overshot by a few files.
+PDF_TEMPLATE_VERSIONS = {
+    "report_card": 2,
+    "receipt": 1,
+    "receipt_full": 2,
+}
+
+
+def pdf_cache_key(kind, inputs):
+    blob = json.dumps([kind, PDF_TEMPLATE_VERSIONS[kind], inputs], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class PdfCache:
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None   # bytes on disk at the last scan + our writes since
+        os.makedirs(path, exist_ok=True)
+
+    def _dir(self, owner):
+        return os.path.join(self.path, str(owner or 0))
+
+    def open(self, owner, key):
+        """Open a cached PDF for reading (marking it recently used), or None."""
+        path = os.path.join(self._dir(owner), key + ".pdf")
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def put(self, owner, key, data):
+        if self.max_bytes <= 0:
+            return
+        folder = self._dir(owner)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, key + ".pdf")
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._size is None or self._size + len(data) > self.max_bytes:
+                self._size = self._evict()
+            else:
+                self._size += len(data)
+
+    def invalidate(self, owner):
+        """Drop every cached PDF of one student."""
+        try:
+            entries = list(os.scandir(self._dir(owner)))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Remove least recently used files down to 90% of the cap; returns bytes left."""
+        files = []
+        for folder in os.scandir(self.path):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if not entry.name.endswith(".pdf"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return total
 
+        evicted = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        print(f"PDF CACHE: evicted {evicted} files, {total // 1024} KiB left")
+        return total
 
-# ---- App & config ----
-app = Flask(__name__)
-app.secret_key = "super_secret_key_123"
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "static", "uploads")
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+pdf_cache = PdfCache(config.PDF_CACHE_DIR, config.PDF_CACHE_MAX_MB * 1024 * 1024)
 
-ALLOWED_EXT = {"png", "jpg", "jpeg", "gif"}
-MAX_FILE_SIZE = 2 * 1024 * 1024
 
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
-app.config["MAX_CONTENT_LENGTH"] = MAX_FILE_SIZE
+def pdf_download(kind, owner, inputs, filename, render):
+    """
+    Attachment response for the PDF drawn from `inputs`, served from the cache
+    when possible. render() only runs on a miss; a matching If-None-Match
+    gets a 304 without touching the cache at all.
+    """
+    key = pdf_cache_key(kind, inputs)
 
-def allowed_file(filename):
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXT
+    if key in request.if_none_match:
+        rv = Response(status=304)
+    else:
+        f = pdf_cache.open(owner, key)
+        if f is None:
+            data = render()
+            pdf_cache.put(owner, key, data)
+            f = io.BytesIO(data)
+        rv = send_file(
+            f,
+            mimetype="application/pdf",
+            as_attachment=True,
+            download_name=filename,
+            etag=False,
+            conditional=False
+        )
+
+    rv.set_etag(key)
+    rv.cache_control.private = True
+    rv.cache_control.no_cache = True
+    return rv
 # -------------------------------------------------------------------------
 
 
 
-# ---------- DATABASE CONNECTION ----------
-def get_db():
-    return mysql.connector.connect(
-        host="127.0.0.1",
-        user="school_user",
-        password="school123",
-        database="SMIPS",
-        auth_plugin="mysql_native_password"
-    )
+# ---------- BACKGROUND JOBS ----------
+# Long exports, class report card batches and bulk e-mails run outside the
+# web request: a route stores a row in `jobs` with enqueue_job() and
+# redirects to /jobs/<id>, which polls its progress. Separate worker
+# processes pick the rows up:
+#   flask --app app jobs work [--processes N]
+#   flask --app app jobs prune               (cron: drop old jobs + files)
+# Handlers are registered with @job_handler(kind) and called with
+# (ctx, params) inside an app context. ctx.progress() reports progress and
+# stops the job if an admin cancelled it; ctx.open_artifact() writes the
+# downloadable result to JOB_ARTIFACT_DIR, which must be shared by the web
+# and worker hosts. A handler that raises is retried with exponential
+# backoff up to max_attempts; JobFailed gives up straight away. Jobs queued
+# with max_attempts=1 are never run a second time once they have started.
+JOB_HANDLERS = {}
+JOB_LABELS = {}
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class JobFailed(Exception):
+    """Permanent job failure: not retried."""
+
+
+class JobAborted(Exception):
+    """The job was cancelled, or its lease lost, while it ran."""
+
+
+def job_handler(kind, label):
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        JOB_LABELS[kind] = label
+        return fn
+    return register
+
+
+def wants_background():
+    """True when a heavy route was asked to run as a job (?background=1)."""
+    return request.values.get("background") == "1"
+
+
+def enqueue_job(kind, params, user_id=None, max_attempts=None):
+    """
+    Queue a job and return its id. Uses its own connection and commits
+    straight away, so the job exists whatever the calling route does with
+    its transaction afterwards.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"unknown job kind: {kind}")
+    if user_id is None and has_request_context():
+        user_id = session.get("user_id")
+
+    conn = db_pool.acquire()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO jobs (kind, params, max_attempts, created_by) VALUES (%s, %s, %s, %s)",
+            (kind, json.dumps(params, default=str), max_attempts or config.JOB_MAX_ATTEMPTS, user_id)
+        )
+        job_id = cur.lastrowid
+        conn.commit()
+        cur.close()
+    finally:
+        db_pool.release(conn)
+
+    print(f"JOB {job_id}: queued {kind}")
+    return job_id
+
+
+def get_job(cur, job_id):
+    cur.execute("""
+        SELECT id, kind, state, attempts, max_attempts, run_after, progress_done,
+            progress_total, message, error, artifact, artifact_name, artifact_type,
+            created_by, created_at, started_at, finished_at
+        FROM jobs
+        WHERE id = %s
+    """, (job_id,))
+    return cur.fetchone()
+
+
+def job_artifact_path(artifact):
+    return os.path.join(config.JOB_ARTIFACT_DIR, artifact)
+
+
+def job_retry_delay(attempts):
+    """Seconds before retry number `attempts`: exponential, capped, with jitter."""
+    delay = min(config.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), config.JOB_RETRY_MAX_SECONDS)
+    return delay * (0.8 + 0.4 * secrets.randbelow(1000) / 1000)
+
+
+class JobContext:
+    """
+    Handed to a running job's handler. A heartbeat thread renews the
+    job's lease every JOB_LEASE_SECONDS / 3 and writes pending progress
+    about once a second; when the row is no longer ours (cancelled, or the
+    lease ran out and another worker took it) the next progress() call
+    raises JobAborted.
+    """
+
+    def __init__(self, job, worker_id):
+        self.job = job
+        self.id = job["id"]
+        self.worker_id = worker_id
+        self.aborted = None
+        self.artifact_name = None
+        self.artifact_type = None
+
+        self._done = 0
+        self._total = 0
+        self._message = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name=f"job-{self.id}", daemon=True)
+
+    @property
+    def part_path(self):
+        return job_artifact_path(f"{self.id}.part")
+
+    def progress(self, done, total=None, message=None):
+        if self.aborted:
+            raise JobAborted(self.aborted)
+        with self._lock:
+            self._done = done
+            if total is not None:
+                self._total = total
+            if message is not None:
+                self._message = message[:255]
+            self._dirty = True
+
+    def open_artifact(self, filename, mimetype, text=False):
+        """File to write the job's result to; it becomes downloadable once the job is done."""
+        os.makedirs(config.JOB_ARTIFACT_DIR, exist_ok=True)
+        self.artifact_name = filename
+        self.artifact_type = mimetype
+        if text:
+            return open(self.part_path, "w", newline="", encoding="utf-8")
+        return open(self.part_path, "wb")
+
+    def discard_artifact(self):
+        try:
+            os.remove(self.part_path)
+        except FileNotFoundError:
+            pass
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def snapshot(self):
+        with self._lock:
+            self._dirty = False
+            return self._done, self._total, self._message
+
+    def _heartbeat(self):
+        renew_every = max(config.JOB_LEASE_SECONDS / 3, 1)
+        renewed = time.monotonic()
+        conn = db_pool.acquire()
+        try:
+            cur = conn.cursor()
+            while not self._stop.wait(1.0):
+                if not self._dirty and time.monotonic() - renewed < renew_every:
+                    continue
+                done, total, message = self.snapshot()
+                cur.execute("""
+                    UPDATE jobs
+                    SET locked_until = NOW(3) + INTERVAL %s SECOND,
+                        progress_done = %s, progress_total = %s, message = %s
+                    WHERE id = %s AND state = 'running' AND locked_by = %s
+                """, (config.JOB_LEASE_SECONDS, done, total, message, self.id, self.worker_id))
+                conn.commit()
+                renewed = time.monotonic()
+                if cur.rowcount == 0:
+                    self.aborted = "cancelled or taken over by another worker"
+                    return
+            cur.close()
+        except Error as e:
+            # keep the job running; if the database stays away the lease
+            # runs out and the job is retried elsewhere
+            print(f"JOB {self.id}: heartbeat failed: {e}")
+        finally:
+            db_pool.release(conn)
+
+
+def _job_execute(sql, params):
+    """One statement on a pooled connection; returns the affected row count."""
+    conn = db_pool.acquire()
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        conn.commit()
+        count = cur.rowcount
+        cur.close()
+        return count
+    finally:
+        db_pool.release(conn)
+
+
+def claim_job(worker_id):
+    """Take the oldest due queued job, or None. SKIP LOCKED lets workers claim side by side."""
+    conn = db_pool.acquire()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+            SELECT id, kind, params, attempts, max_attempts
+            FROM jobs
+            WHERE state = 'queued' AND run_after <= NOW(3)
+            ORDER BY run_after, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """)
+        job = cur.fetchone()
+        if job is None:
+            conn.rollback()
+            cur.close()
+            return None
+
+        cur.execute("""
+            UPDATE jobs
+            SET state = 'running', attempts = attempts + 1, locked_by = %s,
+                locked_until = NOW(3) + INTERVAL %s SECOND,
+                started_at = COALESCE(started_at, NOW())
+            WHERE id = %s
+        """, (worker_id, config.JOB_LEASE_SECONDS, job["id"]))
+        conn.commit()
+        cur.close()
+    finally:
+        db_pool.release(conn)
+
+    job["attempts"] += 1
+    return job
+
+
+def requeue_expired_jobs():
+    """Jobs whose worker stopped renewing the lease go back to the queue (or fail)."""
+    count = _job_execute("""
+        UPDATE jobs
+        SET error = CONCAT('lease expired on ', COALESCE(locked_by, '?')),
+            finished_at = IF(attempts >= max_attempts, NOW(), NULL),
+            state = IF(attempts >= max_attempts, 'failed', 'queued'),
+            locked_by = NULL, locked_until = NULL
+        WHERE state = 'running' AND locked_until < NOW(3)
+    """, ())
+    if count:
+        print(f"JOB WORKER: {count} jobs with an expired lease requeued or failed")
+
+
+def run_job(job, worker_id):
+    ctx = JobContext(job, worker_id)
+    handler = JOB_HANDLERS.get(job["kind"])
+    where = "WHERE id = %s AND state = 'running' AND locked_by = %s"
+    started = time.perf_counter()
+
+    print(f"JOB {ctx.id}: {job['kind']} started (attempt {job['attempts']}/{job['max_attempts']})")
+    ctx.start()
+    try:
+        if handler is None:
+            raise JobFailed(f"no handler for job kind '{job['kind']}'")
+        with app.app_context():
+            handler(ctx, json.loads(job["params"]))
+        if ctx.aborted:
+            raise JobAborted(ctx.aborted)
+    except JobAborted as e:
+        ctx.stop()
+        ctx.discard_artifact()
+        print(f"JOB {ctx.id}: stopped: {e}")
+        return
+    except Exception as e:
+        ctx.stop()
+        ctx.discard_artifact()
+        error = f"{type(e).__name__}: {e}"
+        if isinstance(e, JobFailed) or job["attempts"] >= job["max_attempts"]:
+            _job_execute(f"""
+                UPDATE jobs
+                SET state = 'failed', error = %s, finished_at = NOW(),
+                    locked_by = NULL, locked_until = NULL
+                {where}
+            """, (error, ctx.id, worker_id))
+            print(f"JOB {ctx.id}: failed: {error}")
+        else:
+            delay = job_retry_delay(job["attempts"])
+            _job_execute(f"""
+                UPDATE jobs
+                SET state = 'queued', error = %s, run_after = NOW(3) + INTERVAL %s SECOND,
+                    locked_by = NULL, locked_until = NULL
+                {where}
+            """, (error, round(delay, 3), ctx.id, worker_id))
+            print(f"JOB {ctx.id}: {error}; retrying in {delay:.0f}s")
+        return
+    except BaseException:
+        # worker shut down mid-job: hand it back without using up an attempt,
+        # unless it must not run twice (it may have half done its work)
+        ctx.stop()
+        ctx.discard_artifact()
+        if job["max_attempts"] == 1:
+            _job_execute(f"""
+                UPDATE jobs
+                SET state = 'failed', error = 'interrupted by worker shutdown', finished_at = NOW(),
+                    locked_by = NULL, locked_until = NULL
+                {where}
+            """, (ctx.id, worker_id))
+            print(f"JOB {ctx.id}: interrupted, failed")
+        else:
+            _job_execute(f"""
+                UPDATE jobs
+                SET state = 'queued', attempts = attempts - 1, locked_by = NULL, locked_until = NULL
+                {where}
+            """, (ctx.id, worker_id))
+            print(f"JOB {ctx.id}: interrupted, requeued")
+        raise
+
+    ctx.stop()
+    done, total, message = ctx.snapshot()
+    artifact = None
+    if ctx.artifact_name is not None:
+        artifact = str(ctx.id)
+        os.replace(ctx.part_path, job_artifact_path(artifact))
+
+    finished = _job_execute(f"""
+        UPDATE jobs
+        SET state = 'done', progress_done = %s, progress_total = %s, message = %s,
+            error = NULL, artifact = %s, artifact_name = %s, artifact_type = %s,
+            finished_at = NOW(), locked_by = NULL, locked_until = NULL
+        {where}
+    """, (max(done, total), total, message, artifact, ctx.artifact_name, ctx.artifact_type,
+          ctx.id, worker_id))
+    if not finished and artifact:
+        # cancelled in the last second: nobody will download it
+        os.remove(job_artifact_path(artifact))
+    print(f"JOB {ctx.id}: done in {time.perf_counter() - started:.1f}s")
+
+
+def job_worker(worker_id=None, once=False):
+    """Claim and run jobs until interrupted (or, with once, until the queue is empty)."""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    print(f"JOB WORKER {worker_id}: started, handling {', '.join(sorted(JOB_HANDLERS))}")
+    next_sweep = 0
+    try:
+        while True:
+            try:
+                if time.monotonic() >= next_sweep:
+                    requeue_expired_jobs()
+                    next_sweep = time.monotonic() + config.JOB_LEASE_SECONDS
+                job = claim_job(worker_id)
+                if job is not None:
+                    run_job(job, worker_id)
+                    continue
+            except (Error, PoolTimeout) as e:
+                # a job left half-recorded is retried once its lease runs out
+                print(f"JOB WORKER {worker_id}: database unavailable: {e}")
+            if once:
+                return
+            time.sleep(config.JOB_POLL_SECONDS)
+    except KeyboardInterrupt:
+        print(f"JOB WORKER {worker_id}: stopped")
+
+
+jobs_cli = AppGroup("jobs", help="Background job workers.")
+app.cli.add_command(jobs_cli)
+
+
+@jobs_cli.command("work")
+@click.option("--processes", default=None, type=int, help="Worker processes (default JOB_WORKERS).")
+@click.option("--once", is_flag=True, help="Exit when no job is due instead of polling.")
+def jobs_work(processes, once):
+    """Run background jobs."""
+    processes = processes if processes is not None else config.JOB_WORKERS
+    if processes <= 1:
+        job_worker(once=once)
+        return
+
+    # spawn, not fork: each worker opens its own pools instead of sharing
+    # the parent's sockets and threads
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=job_worker, kwargs={"once": once}) for _ in range(processes)]
+    for w in workers:
+        w.start()
+    try:
+        for w in workers:
+            w.join()
+    except KeyboardInterrupt:
+        # the workers got the same Ctrl-C; wait for them to hand back their jobs
+        for w in workers:
+            w.join()
+
+
+@jobs_cli.command("prune")
+@click.option("--days", default=None, type=int, help="Keep finished jobs this many days (default JOB_KEEP_DAYS).")
+def jobs_prune(days):
+    """Delete old finished jobs and their artifacts."""
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT id, artifact FROM jobs
+        WHERE state IN ('done', 'failed', 'cancelled') AND finished_at < NOW() - INTERVAL %s DAY
+    """, (days if days is not None else config.JOB_KEEP_DAYS,))
+    old = cur.fetchall()
+
+    for job_id, artifact in old:
+        if artifact:
+            try:
+                os.remove(job_artifact_path(artifact))
+            except FileNotFoundError:
+                pass
+    for i in range(0, len(old), config.BULK_UPSERT_CHUNK):
+        ids = [job_id for job_id, _ in old[i:i + config.BULK_UPSERT_CHUNK]]
+        cur.execute(
+            "DELETE FROM jobs WHERE id IN (" + ", ".join(["%s"] * len(ids)) + ")", ids
+        )
+    conn.commit()
+    click.echo(f"Deleted {len(old)} jobs.")
+    cur.close()
+    conn.close()
 # -------------------------------------------------------------------------
 
 
@@ -114,14 +2567,24 @@ def login():
 
         print("USER FOUND:", user)
 
-        if not user or not check_password_hash(user["password"], password):
+        if not user or not verify_password(user["password"], password):
             flash("Invalid username or password")
             cur.close()
             conn.close()
             return redirect("/login")
 
-        # 2️⃣ Reset session
+        # upgrade hashes made with an old scheme / weaker parameters
+        if password_needs_rehash(user["password"]):
+            cur.execute(
+                "UPDATE users SET password=%s WHERE id=%s",
+                (hash_password(password), user["id"])
+            )
+            conn.commit()
+
+        # 2️⃣ Reset session (fresh id, fresh principal)
         session.clear()
+        session.rotate()
+        invalidate_principal(user["id"])
         session["user"] = user["username"]
         session["role"] = user["role"]
         session["user_id"] = user["id"]
@@ -182,6 +2645,7 @@ def dashboard():
         abort(403)
 
 @app.route("/admin/dashboard")
+@replica_ok
 def admin_dashboard():
     if "user" not in session or session.get("role") != "admin":
         abort(403)
@@ -189,35 +2653,22 @@ def admin_dashboard():
     conn = get_db()
     cur = conn.cursor()
 
-    # total users
-    cur.execute("SELECT COUNT(*) FROM users")
-    total_users = cur.fetchone()[0]
-
-    # ✅ total students (FROM students table)
-    cur.execute("SELECT COUNT(*) FROM students")
-    total_students = cur.fetchone()[0]
-
-    # teachers
-    cur.execute("SELECT COUNT(*) FROM users WHERE role='teacher'")
-    total_teachers = cur.fetchone()[0]
-
-    # parents
-    cur.execute("SELECT COUNT(*) FROM users WHERE role='parent'")
-    total_parents = cur.fetchone()[0]
+    counters = read_counters(cur, "users", "students", "teachers", "parents")
 
     cur.close()
     conn.close()
 
     stats = {
-        "total_users": total_users,
-        "total_students": total_students,
-        "total_teachers": total_teachers,
-        "total_parents": total_parents,
+        "total_users": counters["users"],
+        "total_students": counters["students"],
+        "total_teachers": counters["teachers"],
+        "total_parents": counters["parents"],
     }
 
     return render_template("dashboard_admin.html", stats=stats)
 
 @app.route("/teacher/dashboard")
+@replica_ok
 def teacher_dashboard():
     if "user" not in session:
         return redirect("/login")
@@ -228,38 +2679,17 @@ def teacher_dashboard():
     conn = get_db()
     cur = conn.cursor(dictionary=True)
 
-    # 1️⃣ Total classes
-    cur.execute("SELECT COUNT(*) AS cnt FROM classes")
-    classes_count = cur.fetchone()["cnt"]
-
-    # 2️⃣ Total students
-    cur.execute("SELECT COUNT(*) AS cnt FROM students")
-    students_count = cur.fetchone()["cnt"]
-
-    # 3️⃣ Total assignments
-    cur.execute("SELECT COUNT(*) AS cnt FROM assignments")
-    assignments_count = cur.fetchone()["cnt"]
-
-    # 4️⃣ Pending marks (students without submission)
-    cur.execute("""
-        SELECT COUNT(*) AS cnt
-        FROM students s
-        JOIN assignments a ON a.class_id = s.class_id
-        LEFT JOIN assignment_submissions sub
-            ON sub.student_id = s.id
-            AND sub.assignment_id = a.id
-        WHERE sub.id IS NULL
-    """)
-    pending_marks = cur.fetchone()["cnt"]
+    # classes / students / assignments / pending marks (students without submission)
+    counters = read_counters(cur, "classes", "students", "assignments", "pending_submissions")
 
     cur.close()
     conn.close()
 
     stats = {
-        "classes": classes_count,
-        "students": students_count,
-        "assignments": assignments_count,
-        "pending_marks": pending_marks
+        "classes": counters["classes"],
+        "students": counters["students"],
+        "assignments": counters["assignments"],
+        "pending_marks": counters["pending_submissions"]
     }
 
     return render_template(
@@ -269,6 +2699,7 @@ def teacher_dashboard():
     )
 
 @app.route("/student/dashboard")
+@replica_ok
 def student_dashboard():
     if "user" not in session or session.get("role") != "student":
         abort(403)
@@ -277,49 +2708,45 @@ def student_dashboard():
     if not student_id:
         return redirect("/logout")
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-
-    # Student + class
-    cur.execute("""
-        SELECT s.id, s.name, s.class_id, c.name AS class_name, c.section
-        FROM students s
-        LEFT JOIN classes c ON c.id = s.class_id
-        WHERE s.id = %s
-    """, (student_id,))
-    student = cur.fetchone()
-
+    r = fan_out({
+        # Student + class
+        "student": ("""
+            SELECT s.id, s.name, s.class_id, c.name AS class_name, c.section
+            FROM students s
+            LEFT JOIN classes c ON c.id = s.class_id
+            WHERE s.id = %s
+        """, (student_id,), "one"),
+
+        # Attendance %
+        "attendance": ("""
+            SELECT ROUND(SUM(BIT_COUNT(present)) / SUM(BIT_COUNT(present | absent | on_leave)) * 100, 0) AS pct
+            FROM attendance_bits
+            WHERE student_id = %s
+        """, (student_id,), "one"),
+
+        # Total assignments (BY CLASS)
+        "assignments": ("""
+            SELECT COUNT(*) AS cnt
+            FROM assignments a
+            JOIN students s ON s.class_id = a.class_id
+            WHERE s.id = %s
+        """, (student_id,), "one"),
+
+        # Completed assignments
+        "completed": ("""
+            SELECT COUNT(*) AS cnt
+            FROM assignment_submissions
+            WHERE student_id = %s
+        """, (student_id,), "one"),
+    })
+
+    student = r["student"]
     if not student:
-        cur.close()
-        conn.close()
         return redirect("/logout")
 
-    # Attendance %
-    cur.execute("""
-        SELECT ROUND((SUM(status='Present') / COUNT(*)) * 100, 0) AS pct
-        FROM attendance
-        WHERE student_id = %s
-    """, (student_id,))
-    attendance = cur.fetchone()["pct"] or 0
-
-    # Total assignments (BY CLASS)
-    cur.execute("""
-        SELECT COUNT(*) AS cnt
-        FROM assignments
-        WHERE class_id = %s
-    """, (student["class_id"],))
-    total_assignments = cur.fetchone()["cnt"]
-
-    # Completed assignments
-    cur.execute("""
-        SELECT COUNT(*) AS cnt
-        FROM assignment_submissions
-        WHERE student_id = %s
-    """, (student_id,))
-    completed = cur.fetchone()["cnt"]
-
-    cur.close()
-    conn.close()
+    attendance = r["attendance"]["pct"] or 0
+    total_assignments = r["assignments"]["cnt"]
+    completed = r["completed"]["cnt"]
 
     stats = {
         "attendance": attendance,
@@ -336,6 +2763,7 @@ def student_dashboard():
     )
 
 @app.route("/parent/dashboard")
+@replica_ok
 def parent_dashboard():
     if "user" not in session or session.get("role") != "parent":
         abort(403)
@@ -414,7 +2842,7 @@ def add_user():
             flash("Username and password are required.")
             return redirect(url_for("add_user"))
 
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
 
         conn = get_db()
         cur = conn.cursor()
@@ -431,6 +2859,10 @@ def add_user():
             "INSERT INTO users (username, password, role) VALUES (%s, %s, %s)",
             (username, hashed_password, role)
         )
+        deltas = {"users": 1}
+        if role in ROLE_COUNTERS:
+            deltas[ROLE_COUNTERS[role]] = 1
+        bump_counters(cur, **deltas)
         conn.commit()
         cur.close()
         conn.close()
@@ -475,7 +2907,15 @@ def edit_user(user_id):
             "UPDATE users SET username=%s, role=%s WHERE id=%s",
             (username, role, user_id)
         )
+        if role != user["role"]:
+            deltas = {}
+            if user["role"] in ROLE_COUNTERS:
+                deltas[ROLE_COUNTERS[user["role"]]] = -1
+            if role in ROLE_COUNTERS:
+                deltas[ROLE_COUNTERS[role]] = 1
+            bump_counters(cur, **deltas)
         conn.commit()
+        invalidate_principal(user_id)
 
         cur.close()
         conn.close()
@@ -503,8 +2943,17 @@ def delete_user(user_id):
     conn = get_db()
     cur = conn.cursor()
 
-    cur.execute("DELETE FROM users WHERE id=%s", (user_id,))
+    cur.execute("SELECT role FROM users WHERE id=%s FOR UPDATE", (user_id,))
+    row = cur.fetchone()
+
+    if row:
+        cur.execute("DELETE FROM users WHERE id=%s", (user_id,))
+        deltas = {"users": -1}
+        if row[0] in ROLE_COUNTERS:
+            deltas[ROLE_COUNTERS[row[0]]] = -1
+        bump_counters(cur, **deltas)
     conn.commit()
+    invalidate_principal(user_id)
 
     cur.close()
     conn.close()
@@ -554,12 +3003,7 @@ def add_student():
     cur = conn.cursor(dictionary=True)
 
     # ---------- LOAD CLASSES ----------
-    cur.execute("""
-        SELECT id, name, section
-        FROM classes
-        ORDER BY name, section
-    """)
-    classes = cur.fetchall()
+    classes = reference_data.get("classes")
 
     if request.method == "POST":
 
@@ -610,7 +3054,16 @@ def add_student():
             address, photo_filename
         ))
 
+        # a new student starts with every assignment of the class pending
+        bump_counters(
+            cur,
+            students=1,
+            pending_submissions=pending_for_student(cur, cur.lastrowid, class_id)
+        )
+        bump_reference(cur, "student_classes")
+
         conn.commit()
+        reference_data.stale("student_classes")
         cur.close()
         conn.close()
 
@@ -634,8 +3087,7 @@ def edit_student(student_id):
     student = cur.fetchone()
 
     # IMPORTANT — load classes for dropdown
-    cur.execute("SELECT id, name, section FROM classes ORDER BY name, section")
-    classes = cur.fetchall()
+    classes = reference_data.get("classes")
 
     if request.method == "POST":
         name = request.form.get("name", "").strip()
@@ -668,6 +3120,17 @@ def edit_student(student_id):
 
             cur.execute("UPDATE students SET photo=%s WHERE id=%s", (uniq, student_id))
 
+        # moving class swaps one class's pending assignments for another's
+        # (and moves their fees to the new class in the fee rollup)
+        old_class_id = student["class_id"] if student else None
+        class_changed = str(old_class_id or "") != str(class_id or "")
+        if class_changed:
+            bump_counters(cur, pending_submissions=(
+                pending_for_student(cur, student_id, class_id or None)
+                - pending_for_student(cur, student_id, old_class_id)
+            ))
+            adjust_fee_rollup(cur, "f.student_id = %s", (student_id,), -1)
+
         # update main fields
         cur.execute("""
             UPDATE students
@@ -675,8 +3138,13 @@ def edit_student(student_id):
                 phone=%s, parent_name=%s, parent_phone=%s, address=%s
             WHERE id=%s
         """, (name, class_id, section, dob, phone, parent_name, parent_phone, address, student_id))
+        if class_changed:
+            adjust_fee_rollup(cur, "f.student_id = %s", (student_id,), 1)
+        bump_reference(cur, "student_classes")
 
         conn.commit()
+        reference_data.stale("student_classes")
+        invalidate_student_principals(cur, student_id)
         cur.close()
         conn.close()
 
@@ -698,15 +3166,26 @@ def delete_student(student_id):
         return redirect("/")
     conn = get_db()
     cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT photo FROM students WHERE id=%s", (student_id,))
+    cur.execute("SELECT photo, class_id FROM students WHERE id=%s FOR UPDATE", (student_id,))
     r = cur.fetchone()
     if r and r.get("photo"):
         try:
             os.remove(os.path.join(app.config["UPLOAD_FOLDER"], r["photo"]))
         except Exception:
             pass
+    invalidate_student_principals(cur, student_id)
+    if r:
+        bump_counters(
+            cur,
+            students=-1,
+            pending_submissions=-pending_for_student(cur, student_id, r["class_id"])
+        )
+        # the student's fees go with them (ON DELETE CASCADE)
+        adjust_fee_rollup(cur, "f.student_id = %s", (student_id,), -1)
     cur.execute("DELETE FROM students WHERE id=%s", (student_id,))
+    bump_reference(cur, "student_classes")
     conn.commit()
+    reference_data.stale("student_classes")
     cur.close()
     conn.close()
     flash("Student deleted.")
@@ -749,51 +3228,46 @@ def student_profile(student_id):
     if "user" not in session:
         return redirect("/")
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-
-    # Student info
-    cur.execute("SELECT * FROM students WHERE id = %s", (student_id,))
-    student = cur.fetchone()
-
+    r = fan_out({
+        # Student info
+        "student": ("SELECT * FROM students WHERE id = %s", (student_id,), "one"),
+
+        # Fees history
+        "fees": ("""
+            SELECT amount, status, DATE(created_at) AS date, note
+            FROM fees
+            WHERE student_id = %s
+            ORDER BY created_at DESC
+        """, (student_id,), "all"),
+
+        # Fee summary (MAX: one row of zeros when the student has no balance yet)
+        "fee_summary": ("""
+            SELECT
+                COALESCE(MAX(paid), 0) AS total_paid,
+                COALESCE(MAX(outstanding), 0) AS total_due
+            FROM fee_balances
+            WHERE student_id = %s
+        """, (student_id,), "one"),
+
+        # Attendance summary
+        "attendance": ("""
+            SELECT
+                COALESCE(SUM(BIT_COUNT(present)), 0) AS present,
+                COALESCE(SUM(BIT_COUNT(absent)), 0) AS absent,
+                COALESCE(SUM(BIT_COUNT(present | absent | on_leave)), 0) AS total
+            FROM attendance_bits
+            WHERE student_id = %s
+        """, (student_id,), "one"),
+    })
+
+    student = r["student"]
     if not student:
-        cur.close()
-        conn.close()
         flash("Student not found")
         return redirect("/students")
 
-    # Fees history
-    cur.execute("""
-        SELECT amount, status, DATE(created_at) AS date, note
-        FROM fees
-        WHERE student_id = %s
-        ORDER BY created_at DESC
-    """, (student_id,))
-    fees = cur.fetchall()
-
-    # Fee summary
-    cur.execute("""
-        SELECT
-            COALESCE(SUM(CASE WHEN status='paid' THEN amount ELSE 0 END),0) AS total_paid,
-            COALESCE(SUM(CASE WHEN status='unpaid' THEN amount ELSE 0 END),0) AS total_due
-        FROM fees
-        WHERE student_id = %s
-    """, (student_id,))
-    fee_summary = cur.fetchone()
-
-    # Attendance summary
-    cur.execute("""
-        SELECT
-            SUM(CASE WHEN status='present' THEN 1 ELSE 0 END) AS present,
-            SUM(CASE WHEN status='absent' THEN 1 ELSE 0 END) AS absent,
-            COUNT(*) AS total
-        FROM attendance
-        WHERE student_id = %s
-    """, (student_id,))
-    attendance = cur.fetchone()
-
-    cur.close()
-    conn.close()
+    fees = r["fees"]
+    fee_summary = r["fee_summary"]
+    attendance = r["attendance"]
 
     return render_template(
         "student_profile.html",
@@ -803,24 +3277,6 @@ def student_profile(student_id):
         attendance=attendance
     )
 
-def get_parent_students(parent_username):
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-
-    cur.execute("""
-        SELECT s.id, s.name, s.class_id
-        FROM parent_student ps
-        JOIN users u ON u.id = ps.parent_user_id
-        JOIN students s ON s.id = ps.student_id
-        WHERE u.username = %s
-    """, (parent_username,))
-
-    students = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    return students
-
 @app.route("/parents/link", methods=["GET", "POST"])
 def link_parent_student():
     if "user" not in session:
@@ -854,12 +3310,21 @@ def link_parent_student():
         student_id = request.form.get("student_id")
 
         if parent_id and student_id:
+            # parent_user_id is what the parent routes look children up by
             cur.execute("""
-                INSERT IGNORE INTO parent_student (parent_id, student_id)
-                VALUES (%s, %s)
-            """, (parent_id, student_id))
+                INSERT IGNORE INTO parent_student (parent_id, parent_user_id, student_id)
+                SELECT p.id, p.user_id, %s
+                FROM parents p
+                WHERE p.id = %s
+            """, (student_id, parent_id))
 
             conn.commit()
+
+            cur.execute("SELECT user_id FROM parents WHERE id=%s", (parent_id,))
+            parent = cur.fetchone()
+            if parent:
+                invalidate_principal(parent["user_id"])
+
             flash("Parent linked to student successfully 🔗")
 
     cur.close()
@@ -879,9 +3344,7 @@ def parent_some_page():
     if session.get("role") != "parent":
         abort(403)
 
-    students = get_parent_students(session["user"])
-
-    if not students:
+    if not current_principal()["child_ids"]:
         flash("No student linked to this parent.")
         return redirect("/dashboard")
 # -------------------------------------------------------------------------
@@ -891,18 +3354,7 @@ def parent_some_page():
 # ---------- CLASSES MODULE ----------
 @app.route("/classes")
 def classes():
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-
-    cur.execute("""
-        SELECT id, name, section
-        FROM classes
-        ORDER BY name, section
-    """)
-    classes = cur.fetchall()
-
-    cur.close()
-    conn.close()
+    classes = reference_data.get("classes")
 
     return render_template("classes.html", classes=classes)
 
@@ -920,7 +3372,10 @@ def classes_add():
                 "INSERT INTO classes (name, section) VALUES (%s, %s)",
                 (name, section)
             )
+            bump_counters(cur, classes=1)
+            bump_reference(cur, "classes")
             conn.commit()
+            reference_data.stale("classes")
         except Exception as e:
             conn.rollback()
             flash("Class already exists or invalid data.")
@@ -945,7 +3400,9 @@ def classes_edit(class_id):
             "UPDATE classes SET name=%s, section=%s WHERE id=%s",
             (name, section, class_id)
         )
+        bump_reference(cur, "classes")
         conn.commit()
+        reference_data.stale("classes")
 
         cur.close()
         conn.close()
@@ -982,8 +3439,7 @@ def add_notice():
     cur = conn.cursor(dictionary=True)
 
     # load classes for dropdown
-    cur.execute("SELECT id, name FROM classes ORDER BY name")
-    classes = cur.fetchall()
+    classes = reference_data.get("classes")
 
     if request.method == "POST":
         title = request.form.get("title", "").strip()
@@ -994,11 +3450,7 @@ def add_notice():
             flash("Title and message are required.")
             return redirect(url_for("add_notice"))
 
-        cur.execute(
-            "SELECT id FROM users WHERE username=%s",
-            (session["user"],)
-        )
-        user_id = cur.fetchone()["id"]
+        user_id = current_principal()["user_id"]
 
         cur.execute(
             """
@@ -1056,8 +3508,7 @@ def add_assignment():
     conn = get_db()
     cur = conn.cursor(dictionary=True)
 
-    cur.execute("SELECT id, name FROM classes ORDER BY name")
-    classes = cur.fetchall()
+    classes = reference_data.get("classes")
 
     if request.method == "POST":
         title = request.form.get("title", "").strip()
@@ -1065,17 +3516,17 @@ def add_assignment():
         class_id = request.form.get("class_id")
         due_date = request.form.get("due_date")
 
-        cur.execute(
-            "SELECT id FROM users WHERE username=%s",
-            (session["user"],)
-        )
-        user_id = cur.fetchone()["id"]
+        user_id = current_principal()["user_id"]
 
         cur.execute("""
             INSERT INTO assignments (title, description, class_id, due_date, created_by)
             VALUES (%s,%s,%s,%s,%s)
         """, (title, description, class_id, due_date, user_id))
 
+        # every student of the class now owes one more submission
+        cur.execute("SELECT COUNT(*) AS cnt FROM students WHERE class_id=%s", (class_id,))
+        bump_counters(cur, assignments=1, pending_submissions=cur.fetchone()["cnt"])
+
         conn.commit()
         flash("Assignment created successfully 📄")
         return redirect(url_for("list_assignments"))
@@ -1120,11 +3571,7 @@ def submit_assignment(assignment_id):
     cur = conn.cursor(dictionary=True)
 
     # get student id
-    cur.execute("""
-        SELECT s.id FROM students s
-        JOIN users u ON u.username=%s
-    """, (session["user"],))
-    student = cur.fetchone()
+    student = {"id": current_principal()["student_id"]}
 
     if request.method == "POST":
         submission_text = request.form.get("submission_text", "").strip()
@@ -1137,6 +3584,16 @@ def submit_assignment(assignment_id):
             submitted_at=CURRENT_TIMESTAMP
         """, (assignment_id, student["id"], submission_text))
 
+        # rowcount 1 = first submission (2 = resubmission)
+        if cur.rowcount == 1:
+            cur.execute("""
+                SELECT COUNT(*) AS cnt
+                FROM assignments a
+                JOIN students s ON s.class_id = a.class_id
+                WHERE a.id = %s AND s.id = %s
+            """, (assignment_id, student["id"]))
+            bump_counters(cur, pending_submissions=-cur.fetchone()["cnt"])
+
         conn.commit()
         flash("Assignment submitted ✅")
         return redirect(url_for("list_assignments"))
@@ -1217,12 +3674,12 @@ def parent_assignments():
     if session.get("role") != "parent":
         abort(403)
 
-    students = get_parent_students(session["user"])
-    if not students:
+    # 🔒 linked children come from the cached principal
+    student_ids = current_principal()["child_ids"]
+    if not student_ids:
         flash("No student linked.")
         return redirect("/parent/dashboard")
 
-    student_ids = [s["id"] for s in students]
     placeholders = ",".join(["%s"] * len(student_ids))
 
     conn = get_db()
@@ -1275,8 +3732,7 @@ def add_book():
     cur = conn.cursor(dictionary=True)
 
     # load classes
-    cur.execute("SELECT id, name FROM classes ORDER BY name")
-    classes = cur.fetchall()
+    classes = reference_data.get("classes")
 
     if request.method == "POST":
         title = request.form.get("title", "").strip()
@@ -1298,11 +3754,7 @@ def add_book():
         file.save(save_path)
 
         # get uploader id
-        cur.execute(
-            "SELECT id FROM users WHERE username=%s",
-            (session["user"],)
-        )
-        user_id = cur.fetchone()["id"]
+        user_id = current_principal()["user_id"]
 
         cur.execute("""
             INSERT INTO books (title, subject, description, class_id, file_path, uploaded_by)
@@ -1359,8 +3811,7 @@ def add_homework():
     conn = get_db()
     cur = conn.cursor(dictionary=True)
 
-    cur.execute("SELECT id, name FROM classes ORDER BY name")
-    classes = cur.fetchall()
+    classes = reference_data.get("classes")
 
     if request.method == "POST":
         title = request.form.get("title", "").strip()
@@ -1372,11 +3823,7 @@ def add_homework():
             flash("All fields are required.")
             return redirect(url_for("add_homework"))
 
-        cur.execute(
-            "SELECT id FROM users WHERE username=%s",
-            (session["user"],)
-        )
-        user_id = cur.fetchone()["id"]
+        user_id = current_principal()["user_id"]
 
         cur.execute(
             """
@@ -1428,12 +3875,12 @@ def parent_homework():
     if session.get("role") != "parent":
         abort(403)
 
-    students = get_parent_students(session["user"])
-    if not students:
+    # 🔒 linked children come from the cached principal
+    student_ids = current_principal()["child_ids"]
+    if not student_ids:
         flash("No student linked.")
         return redirect("/parent/dashboard")
 
-    student_ids = [s["id"] for s in students]
     placeholders = ",".join(["%s"] * len(student_ids))
 
     conn = get_db()
@@ -1467,12 +3914,8 @@ def parent_homework():
 def attendance_classes_json():
     if "user" not in session:
         return jsonify([]), 401
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT DISTINCT class FROM students WHERE class IS NOT NULL AND class <> '' ORDER BY class")
-    rows = [r[0] for r in cur.fetchall()]
-    cur.close()
-    conn.close()
+    # the free-text students.class values, not classes.name
+    rows = [r["class"] for r in reference_data.get("student_classes")]
     return jsonify(rows)
 
 # --- 1) attendance ---
@@ -1483,18 +3926,7 @@ def attendance():
     if "user" not in session:
         return redirect("/login")
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-
-    cur.execute("""
-        SELECT id, name, section
-        FROM classes
-        ORDER BY name, section
-    """)
-    classes = cur.fetchall()
-
-    cur.close()
-    conn.close()
+    classes = reference_data.get("classes")
 
     return render_template(
         "attendance.html",
@@ -1514,12 +3946,7 @@ def attendance_roster():
     # --------------------------------
     # LOAD CLASSES
     # --------------------------------
-    cur.execute("""
-        SELECT id, name, section
-        FROM classes
-        ORDER BY name, section
-    """)
-    classes = cur.fetchall()
+    classes = reference_data.get("classes")
 
     # --------------------------------
     # HANDLE POST (SAVE ATTENDANCE)
@@ -1538,22 +3965,26 @@ def attendance_roster():
             flash("Invalid date")
             return redirect(url_for("attendance_roster"))
 
+        ts = _sync_timestamp()
+        rows = []
         for key, value in request.form.items():
             if key.startswith("status_"):
                 student_id = key.replace("status_", "")
-                status = value
+                if not student_id.isdigit():
+                    continue
                 remarks = request.form.get(f"remarks_{student_id}", "")
-
-                cur.execute("""
-                    INSERT INTO attendance (student_id, class_id, date, status, remarks)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        status = VALUES(status),
-                        remarks = VALUES(remarks)
-                """, (student_id, class_id, d, status, remarks))
-
+                rows.append((int(student_id), class_id, d, value, remarks, ts))
+
+        res = bulk_upsert(
+            cur, "attendance",
+            key=("student_id", "date"),
+            columns=("student_id", "class_id", "date", "status", "remarks", "client_ts"),
+            rows=rows,
+            update=("status", "remarks", "client_ts")
+        )
+        record_attendance_bits(cur, [(r[0], r[2], r[3]) for r in rows])
         conn.commit()
-        flash("Attendance saved successfully ✅")
+        flash(f"Attendance saved successfully ✅ ({res['inserted']} added, {res['updated']} updated)")
 
         # ✅ safer redirect
         return redirect(url_for("attendance_roster", class_id=class_id, date=d))
@@ -1638,19 +4069,27 @@ def attendance_save():
 
     conn = get_db()
     cur = conn.cursor()
-    insert_sql = """
-        INSERT INTO attendance (student_id, date, status, remarks, created_at)
-        VALUES (%s, %s, %s, %s, NOW())
-        ON DUPLICATE KEY UPDATE status = VALUES(status), remarks = VALUES(remarks), created_at = NOW()
-    """
+    ts = _sync_timestamp()
     params = []
     for sid in student_ids:
         status = request.form.get(f"status_{sid}", "absent")
         remarks = request.form.get(f"remarks_{sid}", "")
-        params.append((sid, d, status, remarks))
+        params.append((sid, d, status, remarks, ts))
 
     try:
-        cur.executemany(insert_sql, params)
+        bulk_upsert(
+            cur, "attendance",
+            key=("student_id", "date"),
+            columns=("student_id", "date", "status", "remarks", "client_ts"),
+            rows=params,
+            update={
+                "status": "VALUES(status)",
+                "remarks": "VALUES(remarks)",
+                "created_at": "NOW()",
+                "client_ts": "VALUES(client_ts)",
+            }
+        )
+        record_attendance_bits(cur, [(sid, d, status) for sid, d, status, _, _ in params])
         conn.commit()
         flash("Attendance saved.")
     except Exception as e:
@@ -1661,49 +4100,189 @@ def attendance_save():
         cur.close()
         conn.close()
 
-    return redirect(url_for("attendance_roster", **{"class": cls, "date": d}))
+    return redirect(url_for("attendance_roster", **{"class": cls, "date": d}))
+
+# --- 4) attendance export ---
+import csv
+from flask import Response
+
+def attendance_export_query(args):
+    """
+    (sql, params) for an attendance export. Filters: class_id, student_id,
+    from / to (YYYY-MM-DD). ValueError on a malformed date.
+    """
+    class_id = args.get("class_id", type=int)
+    student_id = args.get("student_id", type=int)
+    from_date = args.get("from", "").strip()
+    to_date = args.get("to", "").strip()
+
+    for value in (from_date, to_date):
+        if value:
+            datetime.strptime(value, "%Y-%m-%d")
+
+    sql = """
+        SELECT s.name, a.date, a.status, a.class_id
+        FROM attendance a
+        JOIN students s ON s.id = a.student_id
+    """
+    where = []
+    params = []
+
+    if class_id:
+        where.append("a.class_id = %s")
+        params.append(class_id)
+
+    if student_id:
+        where.append("a.student_id = %s")
+        params.append(student_id)
+
+    if from_date:
+        where.append("a.date >= %s")
+        params.append(from_date)
+
+    if to_date:
+        where.append("a.date <= %s")
+        params.append(to_date)
+
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql, params
+
 
-# --- 4) attendance export ---
-import csv
-from flask import Response
+def attendance_csv_chunks(cur, compress, progress=None):
+    """
+    Encoded CSV (gzipped when `compress`) of an executed export query,
+    fetched EXPORT_CHUNK_ROWS rows at a time. progress(rows) after each fetch.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    gz = zlib.compressobj(wbits=31) if compress else None   # gzip container
+    total = 0
+
+    writer.writerow(["Name", "Date", "Status", "Class"])
+    while True:
+        rows = cur.fetchmany(config.EXPORT_CHUNK_ROWS)
+        writer.writerows(rows)
+        total += len(rows)
+        if progress:
+            progress(total)
+
+        data = buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+
+        if gz is not None:
+            data = gz.compress(data) + (b"" if rows else gz.flush())
+        if data:
+            yield data
+        if not rows:
+            break
+
+
+@job_handler("attendance_export", "Attendance export")
+def attendance_export_job(ctx, params):
+    sql, args = attendance_export_query(MultiDict(params))
+    compress = params.get("gzip") == "1"
+
+    conn = get_db(readonly=True)
+    cur = conn.cursor(buffered=False)
+    cur.execute(sql, args)
+    with ctx.open_artifact(
+        "attendance.csv" + (".gz" if compress else ""),
+        "application/gzip" if compress else "text/csv"
+    ) as f:
+        for data in attendance_csv_chunks(cur, compress, lambda n: ctx.progress(n, message=f"{n} rows")):
+            f.write(data)
+    cur.close()
+    conn.close()
 
 @app.route("/attendance/export")
+@replica_ok
 def export_attendance():
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
+    if "user" not in session:
+        return redirect("/login")
 
-    cur.execute("""
-        SELECT s.name, a.date, a.status, a.class_id
-        FROM attendance a
-        JOIN students s ON s.id = a.student_id
-    """)
-    rows = cur.fetchall()
+    if session.get("role") not in ("admin", "teacher"):
+        abort(403)
+
+    # filters: ?class_id=&student_id=&from=YYYY-MM-DD&to=YYYY-MM-DD, ?gzip=1,
+    # ?background=1 to build the file in a job
+    compress = request.args.get("gzip") == "1"
+    try:
+        sql, params = attendance_export_query(request.args)
+    except ValueError:
+        abort(400)
+
+    if wants_background():
+        params = request.args.to_dict()
+        params.pop("background")
+        job_id = enqueue_job("attendance_export", params)
+        return redirect(url_for("job_status", job_id=job_id))
+
+    # Own connection, unbuffered cursor: rows are pulled EXPORT_CHUNK_ROWS at
+    # a time while the response is written, so memory stays flat however
+    # big the export is. The connection goes back to the pool when the
+    # response is closed (finished or client gone).
+    pool = replica_pool if _use_replica(None) else db_pool
+    conn = pool.acquire()
+    cur = conn.cursor(buffered=False)
+
+    def release():
+        try:
+            cur.close()
+        except Error:
+            pass
+        pool.release(conn)
 
-    def generate():
-        yield "Name,Date,Status,Class\n"
-        for r in rows:
-            yield f"{r['name']},{r['date']},{r['status']},{r['class_id']}\n"
+    try:
+        cur.execute(sql, params)
+    except Exception:
+        release()
+        raise
 
-    return Response(
-        generate(),
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment;filename=attendance.csv"}
+    response = Response(
+        attendance_csv_chunks(cur, compress),
+        mimetype="application/gzip" if compress else "text/csv",
+        headers={
+            "Content-Disposition": "attachment;filename=attendance.csv" + (".gz" if compress else "")
+        }
     )
+    response.call_on_close(release)
+    return response
 
 # --- 5) attendance history ---
 @app.route("/attendance/history", methods=["GET", "POST"])
+@replica_ok
 def attendance_history():
     if "user" not in session:
         return redirect("/")
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-
-    class_id = request.form.get("class_id")
-    date = request.form.get("date")
+    args = request.values
+    class_id = args.get("class_id", type=int)
+    student_id = args.get("student_id", type=int)
+    from_date = args.get("from", "").strip()
+    to_date = args.get("to", "").strip()
+    # old single-day filter
+    day = args.get("date", "").strip()
+    if day:
+        from_date = to_date = day
+    limit = min(max(args.get("limit", config.HISTORY_PAGE_SIZE, type=int), 1), 500)
+
+    # keyset cursor "YYYY-MM-DD:id" = last row of the previous page
+    after = args.get("after", "").strip()
+    try:
+        for value in (from_date, to_date):
+            if value:
+                datetime.strptime(value, "%Y-%m-%d")
+        if after:
+            after_date, after_id = after.split(":")
+            datetime.strptime(after_date, "%Y-%m-%d")
+            after_id = int(after_id)
+    except ValueError:
+        abort(400)
 
     query = """
-        SELECT a.id, s.name, a.status, a.date, a.class_id
+        SELECT a.id, a.date, a.status, a.class_id, s.name AS student_name
         FROM attendance a
         JOIN students s ON s.id = a.student_id
         WHERE 1=1
@@ -1711,55 +4290,140 @@ def attendance_history():
     params = []
 
     if class_id:
-        query += " AND a.class_id=%s"
+        query += " AND a.class_id = %s"
         params.append(class_id)
-    if date:
-        query += " AND a.date=%s"
-        params.append(date)
+    if student_id:
+        query += " AND a.student_id = %s"
+        params.append(student_id)
+    if from_date:
+        query += " AND a.date >= %s"
+        params.append(from_date)
+    if to_date:
+        query += " AND a.date <= %s"
+        params.append(to_date)
+    if after:
+        query += " AND a.date <= %s AND (a.date < %s OR a.id < %s)"
+        params += [after_date, after_date, after_id]
 
-    query += " ORDER BY a.date DESC"
+    # one extra row tells us whether there is a next page
+    query += " ORDER BY a.date DESC, a.id DESC LIMIT %s"
+    params.append(limit + 1)
 
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
     cur.execute(query, params)
-    data = cur.fetchall()
-
+    records = cur.fetchall()
     cur.close()
     conn.close()
 
-    return render_template("attendance_history.html", data=data)
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = f"{records[-1]['date']}:{records[-1]['id']}"
+
+    classes = reference_data.get("classes")
+    class_names = {c["id"]: c["name"] for c in classes}
+    for r in records:
+        r["class_name"] = class_names.get(r["class_id"])
+
+    if args.get("format") == "json":
+        return jsonify({
+            "records": [dict(r, date=r["date"].isoformat()) for r in records],
+            "next": next_cursor,
+        })
+
+    filters = {
+        k: v for k, v in (
+            ("class_id", class_id), ("student_id", student_id),
+            ("from", from_date), ("to", to_date), ("limit", limit)
+        ) if v
+    }
+    return render_template(
+        "attendance_history.html",
+        records=records,
+        classes=classes,
+        selected_class=class_id,
+        selected_student=student_id,
+        from_date=from_date,
+        to_date=to_date,
+        next_url=url_for("attendance_history", after=next_cursor, **filters) if next_cursor else None,
+        first_url=url_for("attendance_history", **filters) if after else None
+    )
 
 # --- 6) attendance monthly_data ---
 @app.route("/attendance/monthly", methods=["GET"])
+@replica_ok
 def attendance_monthly():
     if "user" not in session:
         return redirect("/")
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
+    classes = reference_data.get("classes")
 
-    # Monthly attendance summary per student
-    cur.execute("""
-        SELECT 
-            s.id AS student_id,
-            s.name,
-            COUNT(a.id) AS total_days,
-            SUM(a.status = 'Present') AS present_days,
-            SUM(a.status = 'Absent') AS absent_days,
-            SUM(a.status = 'Leave') AS leave_days
-        FROM students s
-        LEFT JOIN attendance a ON s.id = a.student_id
-        GROUP BY s.id, s.name
-        ORDER BY s.name
-    """)
+    month = request.args.get("month") or date.today().strftime("%Y-%m")
+    try:
+        first = datetime.strptime(month, "%Y-%m").date()
+    except ValueError:
+        flash("Invalid month")
+        return redirect(url_for("attendance_monthly"))
 
-    data = cur.fetchall()
+    class_id = request.args.get("class_id", type=int) or (classes[0]["id"] if classes else None)
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", config.MONTHLY_PAGE_SIZE, type=int), 1), 200)
 
-    cur.close()
-    conn.close()
+    students = []
+    summary = {"n": 0, "working_days": 0, "class_average": 0}
+
+    if class_id:
+        conn = get_db()
+        cur = conn.cursor(dictionary=True)
+
+        # whole-class figures, not just this page
+        cur.execute("""
+            SELECT
+                COUNT(*) AS n,
+                COALESCE(MAX(total), 0) AS working_days,
+                COALESCE(ROUND(SUM(present) / SUM(total) * 100, 1), 0) AS class_average
+            FROM attendance_monthly_rollup
+            WHERE month = %s AND class_id = %s
+        """, (first, class_id))
+        summary = cur.fetchone()
 
-    return render_template("attendance_monthly.html", data=data)
+        cur.execute("""
+            SELECT
+                s.id AS student_id,
+                s.name,
+                r.present,
+                r.absent,
+                r.on_leave AS `leave`,
+                r.total AS total_days,
+                ROUND(r.present / r.total * 100, 1) AS percentage
+            FROM attendance_monthly_rollup r
+            JOIN students s ON s.id = r.student_id
+            WHERE r.month = %s AND r.class_id = %s
+            ORDER BY s.name, s.id
+            LIMIT %s OFFSET %s
+        """, (first, class_id, per_page, (page - 1) * per_page))
+        students = cur.fetchall()
+
+        cur.close()
+        conn.close()
+
+    return render_template(
+        "attendance_monthly.html",
+        classes=classes,
+        selected_class=class_id,
+        selected_month=month,
+        students=students,
+        working_days=summary["working_days"],
+        class_average=summary["class_average"],
+        page=page,
+        pages=max(1, (summary["n"] + per_page - 1) // per_page),
+        per_page=per_page
+    )
 
 # --- 7) attendance report ---
 @app.route("/attendance/report")
+@replica_ok
 def attendance_report():
     if "user" not in session:
         return redirect("/login")
@@ -1769,11 +4433,11 @@ def attendance_report():
 
     cur.execute("""
         SELECT s.name,
-               COUNT(a.id) AS total,
-               SUM(a.status='Present') AS present,
-               ROUND((SUM(a.status='Present')/COUNT(a.id))*100,2) AS percentage
-        FROM attendance a
-        JOIN students s ON s.id = a.student_id
+               SUM(BIT_COUNT(b.present | b.absent | b.on_leave)) AS total,
+               SUM(BIT_COUNT(b.present)) AS present,
+               ROUND(SUM(BIT_COUNT(b.present)) / SUM(BIT_COUNT(b.present | b.absent | b.on_leave)) * 100, 2) AS percentage
+        FROM attendance_bits b
+        JOIN students s ON s.id = b.student_id
         GROUP BY s.id
     """)
     data = cur.fetchall()
@@ -1809,11 +4473,12 @@ def mark_attendance():
 
     # ✅ INSERT ONLY IF NOT DUPLICATE
     cur.execute("""
-        INSERT INTO attendance (student_id, date, status)
-        VALUES (%s, %s, %s)
-    """, (student_id, date, status))
+        INSERT INTO attendance (student_id, date, status, client_ts)
+        VALUES (%s, %s, %s, %s)
+    """, (student_id, date, status, _sync_timestamp()))
+    record_attendance_bits(cur, [(student_id, date, status)])
 
-    mysql.connection.commit()
+    conn.commit()
     cur.close()
     conn.close()
 
@@ -1826,7 +4491,7 @@ def bulk_attendance():
     if "user" not in session:
         return redirect("/")
 
-    date = request.form.get("date")
+    d = request.form.get("date")
     class_id = request.form.get("class_id")
     student_ids = request.form.getlist("student_ids")
 
@@ -1834,49 +4499,39 @@ def bulk_attendance():
         flash("Please select a class", "warning")
         return redirect("/attendance")
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-
-    inserted = 0
-    updated = 0
-
-    for sid in student_ids:
-        status = request.form.get(f"status_{sid}")
-
-        cur.execute("""
-            SELECT id FROM attendance
-            WHERE student_id=%s AND class_id=%s AND date=%s
-        """, (sid, class_id, date))
-
-        if cur.fetchone():
-            cur.execute("""
-                UPDATE attendance
-                SET status=%s
-                WHERE student_id=%s AND class_id=%s AND date=%s
-            """, (status, sid, class_id, date))
-            updated += 1
-        else:
-            cur.execute("""
-                INSERT INTO attendance (student_id, class_id, date, status)
-                VALUES (%s, %s, %s, %s)
-            """, (sid, class_id, date, status))
-            inserted += 1
+    try:
+        attendance_date = datetime.strptime(d or "", "%Y-%m-%d").date()
+    except ValueError:
+        flash("Invalid date", "danger")
+        return redirect("/attendance")
 
-        from datetime import date
+    # checked once for the whole batch, before anything is written
+    if attendance_locked(attendance_date):
+        flash("Attendance locked for this date", "danger")
+        return redirect("/attendance")
 
-        LOCK_DAYS = 3
+    ts = _sync_timestamp()
+    rows = [
+        (int(sid), class_id, d, request.form.get(f"status_{sid}"), ts)
+        for sid in student_ids if sid.isdigit()
+    ]
 
-        attendance_date = datetime.strptime(date, "%Y-%m-%d").date()
-        if (datetime.today().date() - attendance_date).days > LOCK_DAYS:
-            flash("Attendance locked for this date", "danger")
-            return redirect("/attendance")
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
 
+    res = bulk_upsert(
+        cur, "attendance",
+        key=("student_id", "date"),
+        columns=("student_id", "class_id", "date", "status", "client_ts"),
+        rows=rows
+    )
+    record_attendance_bits(cur, [(r[0], r[2], r[3]) for r in rows])
 
     conn.commit()
     cur.close()
     conn.close()
 
-    flash(f"{inserted} added, {updated} updated", "success")
+    flash(f"{res['inserted']} added, {res['updated']} updated", "success")
     return redirect("/attendance")
 
 # --- 10) Edit attendance record ---
@@ -1887,7 +4542,14 @@ def edit_attendance(id):
 
     if request.method == "POST":
         status = request.form.get("status")
-        cur.execute("UPDATE attendance SET status=%s WHERE id=%s", (status, id))
+        cur.execute(
+            "UPDATE attendance SET status=%s, client_ts=%s WHERE id=%s",
+            (status, _sync_timestamp(), id)
+        )
+        cur.execute("SELECT student_id, date FROM attendance WHERE id=%s", (id,))
+        row = cur.fetchone()
+        if row:
+            record_attendance_bits(cur, [(row["student_id"], row["date"], status)])
         conn.commit()
         cur.close()
         conn.close()
@@ -1907,6 +4569,300 @@ def edit_attendance(id):
 
     return render_template("attendance_edit.html", record=record)
 
+# --- 11) Batch sync from teacher devices ---
+# POST /attendance/sync
+#   {
+#     "key": "<idempotency key>",           (or an Idempotency-Key header)
+#     "class_id": 4, "date": "2026-03-10",  (defaults for every change)
+#     "client_ts": "2026-03-10T09:01:22Z",  (ISO 8601 or epoch ms)
+#     "default_status": "Present",          (optional: everyone in the class
+#                                            not listed in changes gets this)
+#     "changes": [{"student_id": 12, "status": "Absent", "remarks": "",
+#                  "class_id": .., "date": .., "client_ts": ..}, ...]
+#   }
+# All changes go in one transaction. Per (student, date) the change with the
+# newest client_ts wins, against the database too. The ack lists only the
+# exceptions: stale (a newer change was already stored), locked and
+# rejected entries.
+SYNC_STATUSES = {"present": "Present", "absent": "Absent", "leave": "Leave"}
+# the web forms stamp client_ts with the server clock (rows older than that
+# have none), so a late offline change cannot overwrite a correction made since
+SYNC_NEWER = "VALUES(client_ts) >= COALESCE(client_ts, '1000-01-01')"
+
+
+def _sync_timestamp(value=None):
+    """Naive UTC DATETIME(3) for a device timestamp, or for now when None."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if value is None:
+        ts = now
+    elif isinstance(value, (int, float)):
+        ts = datetime.fromtimestamp(value / 1000, timezone.utc).replace(tzinfo=None)
+    else:
+        ts = datetime.fromisoformat(str(value))
+        if ts.tzinfo is not None:
+            ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    # a device clock running ahead would otherwise win every later edit
+    ts = min(ts, now + timedelta(seconds=config.SYNC_MAX_CLOCK_SKEW_SECONDS))
+    # DATETIME(3)
+    return ts.replace(microsecond=ts.microsecond // 1000 * 1000)
+
+
+@app.route("/attendance/sync", methods=["POST"])
+def attendance_sync():
+    if "user" not in session:
+        return jsonify({"error": "login required"}), 401
+
+    if session.get("role") not in ("admin", "teacher"):
+        abort(403)
+
+    body = request.get_json(silent=True) or {}
+    key = str(request.headers.get("Idempotency-Key") or body.get("key") or "").strip()
+    changes = body.get("changes") or []
+
+    if not key or len(key) > 64:
+        return jsonify({"error": "an idempotency key of 1-64 characters is required"}), 400
+    if not isinstance(changes, list):
+        return jsonify({"error": "changes must be a list"}), 400
+    if len(changes) > config.SYNC_MAX_CHANGES:
+        return jsonify({"error": f"at most {config.SYNC_MAX_CHANGES} changes per batch"}), 413
+
+    user_id = current_principal()["user_id"]
+
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+
+    # claim the key; a retry of a batch that already committed gets its ack back
+    try:
+        cur.execute(
+            "INSERT INTO attendance_sync_keys (user_id, idem_key) VALUES (%s, %s)",
+            (user_id, key)
+        )
+    except Error as e:
+        if e.errno != 1062:
+            raise
+        conn.rollback()
+        cur.execute(
+            "SELECT response FROM attendance_sync_keys WHERE user_id = %s AND idem_key = %s",
+            (user_id, key)
+        )
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+        return Response(row["response"], mimetype="application/json")
+
+    ack = {"key": key, "applied": 0, "stale": [], "locked": [], "rejected": []}
+    latest = {}
+    origin = {}
+
+    def add(index, change, status):
+        try:
+            student_id = int(change["student_id"])
+            class_id = change.get("class_id", body.get("class_id"))
+            class_id = int(class_id) if class_id is not None else None
+            day = datetime.strptime(str(change.get("date") or body.get("date")), "%Y-%m-%d").date()
+            ts = _sync_timestamp(change.get("client_ts", body.get("client_ts")))
+            status = SYNC_STATUSES[str(status).strip().lower()]
+        except (KeyError, TypeError, ValueError) as e:
+            ack["rejected"].append([index, f"invalid change: {e}"])
+            return
+        if attendance_locked(day):
+            ack["locked"].append([student_id, day.isoformat()])
+            return
+
+        row = (student_id, class_id, day, status, str(change.get("remarks") or "")[:255], ts)
+        # several changes to the same student and day: the newest wins
+        old = latest.get((student_id, day))
+        if old is None or ts >= old[5]:
+            latest[(student_id, day)] = row
+            origin[(student_id, day)] = index
+
+    listed = set()
+    for index, change in enumerate(changes):
+        if not isinstance(change, dict):
+            ack["rejected"].append([index, "not an object"])
+            continue
+        add(index, change, change.get("status"))
+        listed.add(str(change.get("student_id")))
+
+    # "everyone present except ..." - fill in the rest of the class
+    if body.get("default_status") is not None:
+        try:
+            class_id = int(body.get("class_id"))
+        except (TypeError, ValueError):
+            class_id = None
+        if class_id is None:
+            ack["rejected"].append(["default_status", "class_id is required"])
+        elif str(body["default_status"]).strip().lower() not in SYNC_STATUSES:
+            ack["rejected"].append(["default_status", "unknown status"])
+        else:
+            cur.execute("SELECT id FROM students WHERE class_id = %s", (class_id,))
+            for r in cur.fetchall():
+                if str(r["id"]) not in listed:
+                    add("default_status", {"student_id": r["id"]}, body["default_status"])
+
+    # a deleted or mistyped student would fail the whole batch on the foreign key
+    student_ids = sorted({k[0] for k in latest})
+    if student_ids:
+        cur.execute(
+            f"SELECT id FROM students WHERE id IN ({','.join(['%s'] * len(student_ids))})",
+            student_ids
+        )
+        known = {r["id"] for r in cur.fetchall()}
+        for k in sorted(k for k in latest if k[0] not in known):
+            ack["rejected"].append([origin[k], f"unknown student {k[0]}"])
+            del latest[k]
+
+    rows = sorted(latest.values(), key=lambda r: (r[0], r[2]))
+    if rows:
+        bulk_upsert(
+            cur, "attendance",
+            key=("student_id", "date"),
+            columns=("student_id", "class_id", "date", "status", "remarks", "client_ts"),
+            rows=rows,
+            # client_ts last: the other columns compare against the stored value
+            update={
+                "status": f"IF({SYNC_NEWER}, VALUES(status), status)",
+                "remarks": f"IF({SYNC_NEWER}, VALUES(remarks), remarks)",
+                "class_id": f"IF({SYNC_NEWER}, VALUES(class_id), class_id)",
+                "client_ts": f"IF({SYNC_NEWER}, VALUES(client_ts), client_ts)",
+            }
+        )
+
+        # what is stored now decides the ack and the derived tables
+        pairs = ",".join(["(%s,%s)"] * len(rows))
+        cur.execute(f"""
+            SELECT student_id, date, status, client_ts
+            FROM attendance
+            WHERE (student_id, date) IN ({pairs})
+        """, [v for r in rows for v in (r[0], r[2])])
+        stored = {(r["student_id"], r["date"]): r for r in cur.fetchall()}
+
+        for student_id, _, day, status, _, ts in rows:
+            now = stored.get((student_id, day))
+            if now and now["client_ts"] == ts and now["status"] == status:
+                ack["applied"] += 1
+            else:
+                ack["stale"].append([student_id, day.isoformat()])
+
+        record_attendance_bits(
+            cur, [(r["student_id"], r["date"], r["status"]) for r in stored.values()]
+        )
+
+    response = json.dumps(ack, separators=(",", ":"))
+    cur.execute(
+        "UPDATE attendance_sync_keys SET response = %s WHERE user_id = %s AND idem_key = %s",
+        (response, user_id, key)
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return Response(response, mimetype="application/json")
+
+
+@db_cli.command("prune-sync-keys")
+@click.option("--days", default=None, type=int, help="Keep keys this many days (default SYNC_KEY_TTL_DAYS).")
+def db_prune_sync_keys(days):
+    """Delete expired attendance sync idempotency keys."""
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute(
+        "DELETE FROM attendance_sync_keys WHERE created_at < NOW() - INTERVAL %s DAY",
+        (days if days is not None else config.SYNC_KEY_TTL_DAYS,)
+    )
+    conn.commit()
+    click.echo(f"Deleted {cur.rowcount} sync keys.")
+    cur.close()
+    conn.close()
+
+# --- 12) Absenteeism analytics ---
+# Chronic absentees, ongoing absence streaks and classes whose attendance
+# is dropping, computed by analytics.py on students x days arrays unpacked
+# from attendance_bits. ?format=json returns the same report.
+@app.route("/reports/absenteeism")
+@replica_ok
+def absenteeism_report():
+    if "user" not in session:
+        return redirect("/login")
+
+    if session.get("role") != "admin":
+        abort(403)
+
+    if analytics is None:
+        return "Absenteeism analytics need NumPy: pip install numpy", 503
+
+    try:
+        to_date = datetime.strptime(request.args.get("to") or date.today().isoformat(), "%Y-%m-%d").date()
+        from_date = request.args.get("from")
+        from_date = (
+            datetime.strptime(from_date, "%Y-%m-%d").date() if from_date
+            else to_date - timedelta(days=364)
+        )
+    except ValueError:
+        abort(400)
+    if from_date > to_date:
+        abort(400)
+    class_id = request.args.get("class_id", type=int)
+
+    query = """
+        SELECT b.student_id, s.class_id, b.month, b.present, b.absent, b.on_leave
+        FROM attendance_bits b
+        JOIN students s ON s.id = b.student_id
+        WHERE b.month BETWEEN %s AND %s
+    """
+    params = [from_date.replace(day=1), to_date]
+    if class_id:
+        query += " AND s.class_id = %s"
+        params.append(class_id)
+
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute(query, params)
+    win = analytics.AttendanceWindow.from_bits(from_date, to_date, cur.fetchall())
+
+    report = analytics.summarize(
+        win,
+        chronic_pct=config.ANALYTICS_CHRONIC_PCT,
+        streak_days=config.ANALYTICS_STREAK_DAYS,
+        rolling_days=config.ANALYTICS_ROLLING_DAYS,
+        drop_pp=config.ANALYTICS_DROP_PP
+    )
+
+    # names only for the students that made it into the report
+    ids = sorted({r["student_id"] for r in report["chronic"] + report["streaks"]})
+    names = {}
+    if ids:
+        placeholders = ",".join(["%s"] * len(ids))
+        cur.execute(f"SELECT id, name FROM students WHERE id IN ({placeholders})", ids)
+        names = dict(cur.fetchall())
+    cur.close()
+    conn.close()
+
+    classes = reference_data.get("classes")
+    class_names = {c["id"]: f"{c['name']} {c['section'] or ''}".strip() for c in classes}
+    for r in report["chronic"] + report["streaks"]:
+        r["name"] = names.get(r["student_id"])
+        r["class_name"] = class_names.get(r["class_id"])
+    for r in report["dropping_classes"]:
+        r["class_name"] = class_names.get(r["class_id"])
+
+    report["from"] = from_date.isoformat()
+    report["to"] = to_date.isoformat()
+    report["class_id"] = class_id
+
+    if request.args.get("format") == "json":
+        return jsonify(report)
+
+    return render_template(
+        "absenteeism_report.html",
+        report=report,
+        classes=classes,
+        chronic_pct=config.ANALYTICS_CHRONIC_PCT,
+        streak_days=config.ANALYTICS_STREAK_DAYS,
+        rolling_days=config.ANALYTICS_ROLLING_DAYS
+    )
+
+
 @app.route("/parent/attendance")
 def parent_attendance():
     if "user" not in session:
@@ -1915,12 +4871,12 @@ def parent_attendance():
     if session.get("role") != "parent":
         abort(403)
 
-    students = get_parent_students(session["user"])
-    if not students:
+    # 🔒 linked children come from the cached principal
+    student_ids = current_principal()["child_ids"]
+    if not student_ids:
         flash("No student linked to this parent.")
         return redirect("/parent/dashboard")
 
-    student_ids = [s["id"] for s in students]
     placeholders = ",".join(["%s"] * len(student_ids))
 
     conn = get_db()
@@ -1962,8 +4918,7 @@ def marks_entry():
     cur = conn.cursor(dictionary=True)
 
     # Load classes
-    cur.execute("SELECT id, name, section FROM classes ORDER BY name, section")
-    classes = cur.fetchall()
+    classes = reference_data.get("classes")
 
     class_id = request.args.get("class_id")
     assignment_id = request.args.get("assignment_id")
@@ -2001,23 +4956,36 @@ def marks_entry():
     if request.method == "POST":
         assignment_id = request.form.get("assignment_id")
 
+        rows = []
         for key, value in request.form.items():
             if key.startswith("marks_"):
                 student_id = key.replace("marks_", "")
-                marks = value or None
+                if not student_id.isdigit():
+                    continue
                 remarks = request.form.get(f"remarks_{student_id}", "")
+                rows.append((assignment_id, int(student_id), value or None, remarks))
 
-                cur.execute("""
-                    INSERT INTO assignment_submissions
-                    (assignment_id, student_id, marks, remarks)
-                    VALUES (%s,%s,%s,%s)
-                    ON DUPLICATE KEY UPDATE
-                        marks=VALUES(marks),
-                        remarks=VALUES(remarks)
-                """, (assignment_id, student_id, marks, remarks))
+        res = bulk_upsert(
+            cur, "assignment_submissions",
+            key=("assignment_id", "student_id"),
+            columns=("assignment_id", "student_id", "marks", "remarks"),
+            rows=rows
+        )
+        created = [student_id for _, student_id in res["new"]]
+
+        # new submission rows clear pending marks for students of that class
+        if created:
+            placeholders = ",".join(["%s"] * len(created))
+            cur.execute(f"""
+                SELECT COUNT(*) AS cnt
+                FROM assignments a
+                JOIN students s ON s.class_id = a.class_id
+                WHERE a.id = %s AND s.id IN ({placeholders})
+            """, tuple([assignment_id] + created))
+            bump_counters(cur, pending_submissions=-cur.fetchone()["cnt"])
 
         conn.commit()
-        flash("Marks saved successfully ✅")
+        flash(f"Marks saved successfully ✅ ({res['inserted']} added, {res['updated']} updated)")
         return redirect(request.url)
 
     cur.close()
@@ -2054,6 +5022,7 @@ def reports():
     return render_template("reports.html", students=students)
 
 @app.route("/reports/students")
+@replica_ok
 def reports_students():
     if "user" not in session:
         return redirect("/login")
@@ -2078,7 +5047,8 @@ def reports_students():
 
     return render_template(
         "reports_students.html",
-        students=students
+        students=students,
+        classes=reference_data.get("classes")
     )
 
 @app.route("/report-card/full/<int:student_id>")
@@ -2093,9 +5063,7 @@ def report_card_full(student_id):
         abort(403)
 
     if role == "parent":
-        students = get_parent_students(session["user"])
-        allowed_ids = [s["id"] for s in students]
-        if student_id not in allowed_ids:
+        if student_id not in current_principal()["child_ids"]:
             abort(403)
 
     # ✅ TERM / EXAM
@@ -2129,100 +5097,86 @@ def report_card_full(student_id):
 
     # ---------------- ATTENDANCE SUMMARY ----------------
     cur.execute("""
-        SELECT status, COUNT(*) AS cnt
-        FROM attendance
+        SELECT
+            COALESCE(SUM(BIT_COUNT(present)), 0) AS present,
+            COALESCE(SUM(BIT_COUNT(absent)), 0) AS absent,
+            COALESCE(SUM(BIT_COUNT(on_leave)), 0) AS on_leave
+        FROM attendance_bits
         WHERE student_id = %s
-        GROUP BY status
     """, (student_id,))
-    attendance = cur.fetchall()
+    attendance = attendance_summary(cur.fetchone())
 
     cur.close()
     conn.close()
 
-    # ---------------- CALCULATIONS ----------------
-    total_marks = sum(r["marks"] for r in results if r["marks"] is not None)
-    max_marks = sum(r["max_marks"] for r in results if r["max_marks"] is not None)
-    percentage = (total_marks / max_marks * 100) if max_marks else 0
+    return pdf_download(
+        "report_card",
+        student_id,
+        {"student": student, "term": term, "results": results, "attendance": attendance},
+        report_card_filename(student, term),
+        lambda: render_report_card(student, term, results, attendance)
+    )
 
-    if percentage >= 90:
-        grade = "A+"
-    elif percentage >= 75:
-        grade = "A"
-    elif percentage >= 60:
-        grade = "B"
-    elif percentage >= 40:
-        grade = "C"
-    else:
-        grade = "F"
-
-    # ---------------- PDF ----------------
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    margin = 20 * mm
-    x = margin
-    y = height - margin
-
-    p.setFont("Helvetica-Bold", 18)
-    p.drawCentredString(width / 2, y, "School Report Card")
-    y -= 20
-    p.setFont("Helvetica", 12)
-    p.drawCentredString(width / 2, y, term)
-    p.line(margin, y - 10, width - margin, y - 10)
-
-    # Student info
-    y -= 40
-    p.setFont("Helvetica", 11)
-    p.drawString(x, y, f"Name: {student['name']}")
-    y -= 15
-    p.drawString(x, y, f"Class: {student['class_name']} {student['section']}")
-
-    # Marks
-    y -= 30
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(x, y, "Academic Performance")
-    y -= 18
-
-    p.setFont("Helvetica", 10)
-    for r in results:
-        p.drawString(x + 10, y, r["subject"])
-        p.drawRightString(
-            width - margin,
-            y,
-            f"{r['marks']} / {r['max_marks']}"
-        )
-        y -= 14
-
-        if y < 120:
-            p.showPage()
-            y = height - margin
-
-    # Summary
-    y -= 20
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(x, y, "Result Summary")
-    y -= 16
-    p.setFont("Helvetica", 10)
-    p.drawString(x + 10, y, f"Total Marks: {total_marks} / {max_marks}")
-    y -= 14
-    p.drawString(x + 10, y, f"Percentage: {percentage:.2f}%")
-    y -= 14
-    p.drawString(x + 10, y, f"Grade: {grade}")
-
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-
-    safe_name = student["name"].replace(" ", "_")
+def report_cards_filename(card, term, merged):
+    student = card["student"]
+    return secure_filename(
+        f"report_cards_{student['class_name']}_{student['section'] or ''}_{term}"
+    ) + (".pdf" if merged else ".zip")
+
+
+@job_handler("report_cards", "Class report cards")
+def report_cards_job(ctx, params):
+    conn = get_db(readonly=True)
+    cur = conn.cursor(dictionary=True)
+    cards = load_class_report_cards(cur, params["class_id"], params["term"])
+    cur.close()
+    conn.close()
+    if not cards:
+        raise JobFailed("no students in this class")
+
+    merged = params["merged"]
+    ctx.progress(0, len(cards), "rendering report cards")
+    data = render_report_batch(cards, merged, ctx.progress)
+    with ctx.open_artifact(
+        report_cards_filename(cards[0], params["term"], merged),
+        "application/pdf" if merged else "application/zip"
+    ) as f:
+        f.write(data)
+
+@app.route("/report-card/class")
+@replica_ok
+def report_card_class():
+    if "user" not in session:
+        return redirect("/login")
+
+    if session.get("role") not in ("admin", "teacher"):
+        abort(403)
+
+    class_id = request.args.get("class_id", type=int)
+    term = request.args.get("term", "Term 1")
+    merged = request.args.get("format", "zip") == "pdf"
+    if not class_id:
+        abort(400)
+
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    cards = load_class_report_cards(cur, class_id, term)
+    cur.close()
+    conn.close()
+
+    if not cards:
+        abort(404)
 
+    # big classes are drawn by a job worker instead of tying up this one
+    if wants_background() or len(cards) > config.REPORT_BATCH_SYNC_MAX:
+        job_id = enqueue_job("report_cards", {"class_id": class_id, "term": term, "merged": merged})
+        return redirect(url_for("job_status", job_id=job_id))
+
+    filename = report_cards_filename(cards[0], term, merged)
     return Response(
-        buffer.getvalue(),
-        mimetype="application/pdf",
-        headers={
-            "Content-Disposition":
-            f"attachment; filename=report_card_{safe_name}_{term}.pdf"
-        }
+        render_report_batch(cards, merged),
+        mimetype="application/pdf" if merged else "application/zip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
 @app.route("/reports/<int:student_id>")
@@ -2237,8 +5191,7 @@ def marks_page():   # 👈 different name
     conn = get_db()
     cur = conn.cursor(dictionary=True)
 
-    cur.execute("SELECT id, name, section FROM classes ORDER BY name, section")
-    classes = cur.fetchall()
+    classes = reference_data.get("classes")
 
     students = []
     class_id = request.args.get("class_id")
@@ -2266,6 +5219,7 @@ def marks_page():   # 👈 different name
         """, (student_id, subject, marks, max_marks, exam))
 
         conn.commit()
+        pdf_cache.invalidate(student_id)
         flash("Marks saved successfully ✅")
 
     cur.close()
@@ -2284,134 +5238,214 @@ def marks_page():   # 👈 different name
 
 # ---------- FEES MODULE ----------
 # --- 1) fees list with filters ---
+# Newest first, FEES_PAGE_SIZE rows a page with a (created_at, id) keyset
+# cursor; totals of the whole filtered set come back in the same statement.
+# ?format=json returns the same page for the frontend.
+def fee_page_cursor(row):
+    """Keyset cursor "YYYY-MM-DDTHH:MM:SS:id" for the last fee of a page."""
+    return f"{row['created_at']:%Y-%m-%dT%H:%M:%S}:{row['id']}"
+
+
+def parse_fee_page_cursor(after):
+    """(created_at, id) from fee_page_cursor(); ValueError if malformed."""
+    created_at, fee_id = after.rsplit(":", 1)
+    return datetime.strptime(created_at, "%Y-%m-%dT%H:%M:%S"), int(fee_id)
+
+
+FEE_PAGE_AFTER = "f.created_at <= %s AND (f.created_at < %s OR f.id < %s)"
+
 @app.route("/fees")
+@replica_ok
 def fees_list():
     if "user" not in session:
         return redirect("/")
 
-    # filters
-    class_filter = request.args.get("class", "").strip()
-    status_filter = request.args.get("status", "").strip()
-    from_date = request.args.get("from", "").strip()
-    to_date = request.args.get("to", "").strip()
+    # filters: ?class_id= (or the old ?class=), ?status=, ?q=student name,
+    # ?from=YYYY-MM-DD&to=YYYY-MM-DD
+    args = request.args
+    class_id = args.get("class_id", type=int) or args.get("class", type=int)
+    status = args.get("status", "").strip()
+    query = args.get("q", "").strip()
+    from_date = args.get("from", "").strip()
+    to_date = args.get("to", "").strip()
+    limit = min(max(args.get("limit", config.FEES_PAGE_SIZE, type=int), 1), 500)
+
+    # keyset cursor = last row of the previous page
+    after = args.get("after", "").strip()
+    try:
+        if from_date:
+            from_day = datetime.strptime(from_date, "%Y-%m-%d")
+        if to_date:
+            to_day = datetime.strptime(to_date, "%Y-%m-%d")
+        if after:
+            after_at, after_id = parse_fee_page_cursor(after)
+    except ValueError:
+        abort(400)
 
     where = []
     params = []
 
-    if class_filter:
-        where.append("c.id = %s")
-        params.append(class_filter)
+    if class_id:
+        where.append("s.class_id = %s")
+        params.append(class_id)
 
-    if status_filter:
+    if status in ("paid", "unpaid"):
         where.append("f.status = %s")
-        params.append(status_filter)
+        params.append(status)
+
+    if query:
+        where.append("s.name LIKE %s")
+        params.append("%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
 
+    # half-open range on the bare column, so idx_fees_list can be used
     if from_date:
         where.append("f.created_at >= %s")
-        params.append(from_date + " 00:00:00")
+        params.append(from_day)
 
     if to_date:
-        where.append("f.created_at <= %s")
-        params.append(to_date + " 23:59:59")
-
-    sql = """
+        where.append("f.created_at < %s")
+        params.append(to_day + timedelta(days=1))
+
+    where_sql = " AND ".join(where) or "1=1"
+    page_where_sql = where_sql
+    page_params = list(params)
+    if after:
+        page_where_sql += " AND " + FEE_PAGE_AFTER
+        page_params += [after_at, after_at, after_id]
+
+    # one row per fee on the page, each carrying the totals (or just the
+    # totals when the page is empty); one extra row tells us whether there
+    # is a next page
+    sql = f"""
         SELECT
-            f.id,
-            f.student_id,
-            s.name AS student_name,
-            c.name AS class_name,
-            c.section,
-            f.amount,
-            f.status,
-            f.paid_on,
-            f.note,
-            f.created_at
-        FROM fees f
-        LEFT JOIN students s ON s.id = f.student_id
-        LEFT JOIN classes c ON c.id = s.class_id
-    """
-
-    if where:
-        sql += " WHERE " + " AND ".join(where)
-
-    sql += " ORDER BY f.created_at DESC"
+            t.total_records, t.total_amount, t.total_paid, t.total_unpaid,
+            p.id, p.student_id, p.student_name, p.class_id, p.amount,
+            p.status, p.paid_on, p.note, p.created_at
+        FROM (
+            SELECT
+                COUNT(*) AS total_records,
+                COALESCE(SUM(f.amount), 0) AS total_amount,
+                COALESCE(SUM(CASE WHEN f.status = 'paid' THEN f.amount END), 0) AS total_paid,
+                COALESCE(SUM(CASE WHEN f.status = 'unpaid' THEN f.amount END), 0) AS total_unpaid
+            FROM fees f
+            {"JOIN students s ON s.id = f.student_id" if class_id or query else ""}
+            WHERE {where_sql}
+        ) t
+        LEFT JOIN (
+            SELECT
+                f.id, f.student_id, s.name AS student_name, s.class_id,
+                f.amount, f.status, f.paid_on, f.note, f.created_at
+            FROM fees f
+            LEFT JOIN students s ON s.id = f.student_id
+            WHERE {page_where_sql}
+            ORDER BY f.created_at DESC, f.id DESC
+            LIMIT %s
+        ) p ON TRUE
+        ORDER BY p.created_at DESC, p.id DESC
+    """
 
     conn = get_db()
     cur = conn.cursor(dictionary=True)
-    cur.execute(sql, tuple(params))
+    cur.execute(sql, params + page_params + [limit + 1])
     rows = cur.fetchall()
     cur.close()
     conn.close()
 
-    # class dropdown (from classes table, NOT students)
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("""
-        SELECT id, name, section
-        FROM classes
-        ORDER BY name, section
-    """)
-    classes = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    from datetime import date
+    totals = {k: rows[0][k] for k in ("total_records", "total_amount", "total_paid", "total_unpaid")}
+    fees = [r for r in rows if r["id"] is not None]
+
+    next_cursor = None
+    if len(fees) > limit:
+        fees = fees[:limit]
+        next_cursor = fee_page_cursor(fees[-1])
+
+    classes = reference_data.get("classes")
+    class_by_id = {c["id"]: c for c in classes}
+    for r in fees:
+        for k in totals:
+            del r[k]
+        cls = class_by_id.get(r["class_id"])
+        r["class_name"] = cls["name"] if cls else None
+        r["section"] = cls["section"] if cls else None
+
+    if args.get("format") == "json":
+        return jsonify({
+            "fees": [
+                dict(
+                    r,
+                    amount=float(r["amount"]),
+                    paid_on=r["paid_on"].isoformat() if r["paid_on"] else None,
+                    created_at=r["created_at"].isoformat()
+                )
+                for r in fees
+            ],
+            "totals": {
+                "records": totals["total_records"],
+                "amount": float(totals["total_amount"]),
+                "paid": float(totals["total_paid"]),
+                "unpaid": float(totals["total_unpaid"]),
+            },
+            "next": next_cursor,
+        })
+
+    filters = {
+        k: v for k, v in (
+            ("class_id", class_id), ("status", status), ("q", query),
+            ("from", from_date), ("to", to_date), ("limit", args.get("limit", type=int))
+        ) if v
+    }
     return render_template(
         "fees.html",
-        fees=rows,
+        fees=fees,
+        totals=totals,
         classes=classes,
         date=date.today(),
-        class_filter=class_filter,
-        status_filter=status_filter,
+        selected_class=class_id,
+        status=status,
+        query=query,
         from_date=from_date,
-        to_date=to_date
+        to_date=to_date,
+        next_url=url_for("fees_list", after=next_cursor, **filters) if next_cursor else None,
+        first_url=url_for("fees_list", **filters) if after else None
     )
 
 # --- 1) fees dashboard ---
 @app.route("/fees/dashboard")
 def fees_dashboard():
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-
-    cur.execute("SELECT COUNT(DISTINCT student_id) AS total_students FROM fees")
-    total_students = cur.fetchone()["total_students"]
-
-    cur.execute("SELECT COALESCE(SUM(amount),0) AS total_collected FROM fees WHERE status='paid'")
-    total_collected = cur.fetchone()["total_collected"]
-
-    cur.execute("SELECT COALESCE(SUM(amount),0) AS total_pending FROM fees WHERE status='unpaid'")
-    total_pending = cur.fetchone()["total_pending"]
-
-    cur.execute("SELECT COUNT(*) AS pending_records FROM fees WHERE status='unpaid'")
-    pending_records = cur.fetchone()["pending_records"]
-
-    cur.close()
-    conn.close()
+    r = fan_out({
+        "students": ("SELECT COUNT(DISTINCT student_id) AS total_students FROM fees", (), "one"),
+        "paid": ("SELECT COALESCE(SUM(amount),0) AS total_collected FROM fees WHERE status='paid'", (), "one"),
+        "unpaid": ("""
+            SELECT COALESCE(SUM(amount),0) AS total_pending, COUNT(*) AS pending_records
+            FROM fees
+            WHERE status='unpaid'
+        """, (), "one"),
+    })
 
     stats = {
-        "total_students": total_students,
-        "total_collected": total_collected,
-        "total_pending": total_pending,
-        "pending_records": pending_records
+        "total_students": r["students"]["total_students"],
+        "total_collected": r["paid"]["total_collected"],
+        "total_pending": r["unpaid"]["total_pending"],
+        "pending_records": r["unpaid"]["pending_records"]
     }
 
     return render_template("fees_dashboard.html", stats=stats)
 
 # --- 2) outstanding report: unpaid grouped by class ---
 @app.route("/fees/outstanding")
+@replica_ok
 def fees_outstanding():
     if "user" not in session:
         return redirect("/")
     conn = get_db()
     cur = conn.cursor(dictionary=True)
-    # group unpaid by class and student
+    # students with unpaid fees, by class
     cur.execute("""
         SELECT s.class as student_class, s.id as student_id, s.name as student_name,
-               SUM(f.amount) as total_due, COUNT(f.id) as invoices
-        FROM fees f
-        JOIN students s ON s.id = f.student_id
-        WHERE f.status = 'unpaid'
-        GROUP BY s.class, s.id, s.name
+               b.outstanding as total_due, b.unpaid_count as invoices
+        FROM fee_balances b
+        JOIN students s ON s.id = b.student_id
+        WHERE b.unpaid_count > 0
         ORDER BY s.class, s.name
     """)
     rows = cur.fetchall()
@@ -2435,11 +5469,11 @@ def fees_dues():
             s.id,
             s.name AS student_name,
             c.name AS class_name,
-            SUM(f.amount) AS due_amount
-        FROM fees f
-        JOIN students s ON s.id = f.student_id
+            b.outstanding AS due_amount
+        FROM fee_balances b
+        JOIN students s ON s.id = b.student_id
         LEFT JOIN classes c ON s.class_id = c.id
-        WHERE f.status = 'unpaid'
+        WHERE b.outstanding > 0
     """
     params = []
 
@@ -2447,11 +5481,7 @@ def fees_dues():
         sql += " AND c.name = %s"
         params.append(cls)
 
-    sql += """
-        GROUP BY s.id, s.name, c.name
-        HAVING due_amount > 0
-        ORDER BY c.name, s.name
-    """
+    sql += " ORDER BY c.name, s.name"
 
     cur.execute(sql, params)
     dues = cur.fetchall()
@@ -2470,13 +5500,12 @@ def parent_fees():
     if session.get("role") != "parent":
         abort(403)
 
-    # 🔒 derive linked students
-    students = get_parent_students(session["user"])
-    if not students:
+    # 🔒 linked children come from the cached principal
+    student_ids = current_principal()["child_ids"]
+    if not student_ids:
         flash("No student linked to this parent.")
         return redirect("/parent/dashboard")
 
-    student_ids = [s["id"] for s in students]
     placeholders = ",".join(["%s"] * len(student_ids))
 
     conn = get_db()
@@ -2502,12 +5531,11 @@ def parent_fees():
     cur.execute(f"""
         SELECT
             s.name AS student_name,
-            SUM(f.amount) AS total_due
-        FROM fees f
-        JOIN students s ON s.id = f.student_id
-        WHERE f.student_id IN ({placeholders})
-          AND f.status = 'unpaid'
-        GROUP BY s.id
+            b.outstanding AS total_due
+        FROM fee_balances b
+        JOIN students s ON s.id = b.student_id
+        WHERE b.student_id IN ({placeholders})
+          AND b.unpaid_count > 0
     """, tuple(student_ids))
 
     dues = cur.fetchall()
@@ -2522,87 +5550,134 @@ def parent_fees():
     )
 
 # --- 5) fees reports ---
+# Filters: ?class_id=, ?month=YYYY-MM, ?status=. The summary is read from
+# fees_monthly_rollup; the records are paged like /fees, with the month as
+# a created_at range so idx_fees_list / idx_fees_status_list apply.
 @app.route("/fees/reports")
+@replica_ok
 def fees_reports():
     if "user" not in session:
         return redirect("/")
 
-    cls = request.args.get("class")
-    month = request.args.get("month")  # YYYY-MM
+    args = request.args
+    class_id = args.get("class_id", type=int)
+    month = args.get("month", "").strip()  # YYYY-MM
+    status = args.get("status", "").strip()
+    if status not in ("paid", "unpaid"):
+        status = ""
+    limit = min(max(args.get("limit", config.FEES_PAGE_SIZE, type=int), 1), 500)
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
+    after = args.get("after", "").strip()
+    try:
+        if month:
+            first = datetime.strptime(month, "%Y-%m").date()
+        if after:
+            after_at, after_id = parse_fee_page_cursor(after)
+    except ValueError:
+        abort(400)
 
-    where = "WHERE 1=1"
+    rollup_where = []
+    rollup_params = []
+    where = []
     params = []
 
-    if cls:
-        where += " AND s.class = %s"
-        params.append(cls)
+    if class_id:
+        rollup_where.append("class_id = %s")
+        rollup_params.append(class_id)
+        where.append("s.class_id = %s")
+        params.append(class_id)
 
     if month:
-        where += " AND DATE_FORMAT(f.created_at, '%Y-%m') = %s"
-        params.append(month)
+        rollup_where.append("month = %s")
+        rollup_params.append(first)
+        where.append("f.created_at >= %s AND f.created_at < %s")
+        params += [first, (first + timedelta(days=32)).replace(day=1)]
 
-    # Records table
-    cur.execute("""
+    if status:
+        rollup_where.append("status = %s")
+        rollup_params.append(status)
+        where.append("f.status = %s")
+        params.append(status)
+
+    if after:
+        where.append(FEE_PAGE_AFTER)
+        params += [after_at, after_at, after_id]
+
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+
+    # Summary: classes x months rows at most
+    cur.execute(f"""
+        SELECT status, SUM(records) AS records, SUM(amount) AS amount
+        FROM fees_monthly_rollup
+        WHERE {" AND ".join(rollup_where) or "1=1"}
+        GROUP BY status
+    """, rollup_params)
+    by_status = {r["status"]: r for r in cur.fetchall()}
+
+    # Records: one page, one extra row tells us whether there is a next page
+    cur.execute(f"""
         SELECT
             f.id,
+            f.student_id,
             s.name AS student_name,
-            c.name AS class_name,
+            s.class_id,
             f.amount,
             f.status,
             f.due_date,
+            f.note,
             f.created_at
         FROM fees f
-        JOIN students s ON f.student_id = s.id
-        LEFT JOIN classes c ON s.class_id = c.id
-        ORDER BY f.created_at DESC
-    """)
-
+        LEFT JOIN students s ON f.student_id = s.id
+        WHERE {" AND ".join(where) or "1=1"}
+        ORDER BY f.created_at DESC, f.id DESC
+        LIMIT %s
+    """, params + [limit + 1])
     records = cur.fetchall()
 
-    # Summary
-    cur.execute(f"""
-        SELECT
-            COALESCE(SUM(CASE WHEN f.status='paid' THEN f.amount ELSE 0 END), 0) AS total_paid,
-            COALESCE(SUM(CASE WHEN f.status='unpaid' THEN f.amount ELSE 0 END), 0) AS total_unpaid,
-            COUNT(*) AS total_records
-        FROM fees f
-        JOIN students s ON s.id = f.student_id
-        {where}
-    """, params)
-
-    summary = cur.fetchone()
-
     cur.close()
     conn.close()
 
-    # SAFETY: summary is ALWAYS defined
-    if not summary:
-        summary = {
-            "total_paid": 0,
-            "total_unpaid": 0,
-            "total_records": 0
-        }
+    paid = by_status.get("paid") or {"records": 0, "amount": 0}
+    unpaid = by_status.get("unpaid") or {"records": 0, "amount": 0}
+    summary = {
+        "total_collected": paid["amount"],
+        "total_pending": unpaid["amount"],
+        "total_records": int(paid["records"] + unpaid["records"]),
+        "paid_records": int(paid["records"]),
+    }
 
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = fee_page_cursor(records[-1])
+
+    classes = reference_data.get("classes")
+    class_names = {c["id"]: c["name"] for c in classes}
+    for r in records:
+        r["class_name"] = class_names.get(r["class_id"])
+
+    filters = {
+        k: v for k, v in (
+            ("class_id", class_id), ("month", month), ("status", status),
+            ("limit", args.get("limit", type=int))
+        ) if v
+    }
     return render_template(
         "fees_reports.html",
         records=records,
-        summary=summary
+        summary=summary,
+        classes=classes,
+        selected_class=class_id,
+        month=month,
+        status=status,
+        next_url=url_for("fees_reports", after=next_cursor, **filters) if next_cursor else None,
+        first_url=url_for("fees_reports", **filters) if after else None
     )
 
 # --- 6) fees export ---
-@app.route("/fees/export")
-def fees_export():
-    if "user" not in session:
-        return redirect("/")
-
-    status = request.args.get("status")
-
-    conn = get_db()
-    cur = conn.cursor()
-
+def write_fees_csv(cur, status, out):
+    """Fee records (optionally only one status) as CSV into `out`; returns the row count."""
     sql = """
         SELECT s.name, s.class, f.amount, f.status, f.created_at
         FROM fees f
@@ -2617,13 +5692,41 @@ def fees_export():
     cur.execute(sql, params)
     rows = cur.fetchall()
 
+    writer = csv.writer(out)
+    writer.writerow(["Student", "Class", "Amount", "Status", "Date"])
+    writer.writerows(rows)
+    return len(rows)
+
+
+@job_handler("fees_export", "Fees export")
+def fees_export_job(ctx, params):
+    conn = get_db(readonly=True)
+    cur = conn.cursor()
+    with ctx.open_artifact("fees_export.csv", "text/csv", text=True) as f:
+        rows = write_fees_csv(cur, params.get("status"), f)
+    ctx.progress(rows, rows, f"{rows} rows")
     cur.close()
     conn.close()
 
+@app.route("/fees/export")
+def fees_export():
+    if "user" not in session:
+        return redirect("/")
+
+    status = request.args.get("status")
+
+    if wants_background():
+        job_id = enqueue_job("fees_export", {"status": status})
+        return redirect(url_for("job_status", job_id=job_id))
+
+    conn = get_db()
+    cur = conn.cursor()
+
     output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Student", "Class", "Amount", "Status", "Date"])
-    writer.writerows(rows)
+    write_fees_csv(cur, status, output)
+
+    cur.close()
+    conn.close()
 
     return Response(
         output.getvalue(),
@@ -2658,34 +5761,13 @@ def fees_receipt(fee_id):
         flash("Receipt available only for paid fees.")
         return redirect(url_for("fees_list"))
 
-    # require reportlab
-    if reportlab is None:
-        flash("PDF generation library not installed. Run: pip install reportlab")
-        return redirect(url_for("fees_list"))
-
-    # create PDF in memory
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    # Simple receipt layout
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(50, height - 80, "School App — Fee Receipt")
-    p.setFont("Helvetica", 11)
-    p.drawString(50, height - 110, f"Receipt ID: {r['id']}")
-    p.drawString(50, height - 130, f"Student: {r.get('student_name') or '-'} (ID: {r.get('student_id') or '-'})")
-    p.drawString(50, height - 150, f"Class: {r.get('student_class') or '-'}")
-    p.drawString(50, height - 170, f"Amount Paid: {r.get('amount')}")
-    p.drawString(50, height - 190, f"Paid On: {r.get('paid_on') or r.get('created_at')}")
-    p.drawString(50, height - 210, f"Note: {r.get('note') or ''}")
-    p.drawString(50, height - 250, "Thank you for your payment.")
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-
-    filename = f"receipt_fee_{fee_id}.pdf"
-    return Response(buffer.getvalue(), mimetype="application/pdf",
-                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+    return pdf_download(
+        "receipt",
+        r["student_id"],
+        r,
+        f"receipt_fee_{fee_id}.pdf",
+        lambda: render_fee_receipt(r)
+    )
 
 # --- 8) Email reminders (outline + send route) ---
 def send_email(to_email: str, subject: str, body: str):
@@ -2714,11 +5796,61 @@ def send_email(to_email: str, subject: str, body: str):
         s.login(SMTP_USER, SMTP_PASS)
         s.send_message(msg)
 
+def unpaid_fee_reminders(cur, cls):
+    """Students (optionally of one class) with unpaid fees and how much they owe."""
+    sql = """
+        SELECT s.id as student_id, s.name as student_name, s.email, b.outstanding as total_due
+        FROM fee_balances b
+        JOIN students s ON s.id = b.student_id
+        WHERE b.outstanding > 0
+    """
+    params = []
+    if cls:
+        sql += " AND s.class = %s"
+        params.append(cls)
+
+    cur.execute(sql, tuple(params))
+    return cur.fetchall()
+
+
+def send_fee_reminder(r):
+    """E-mail one reminder; returns None when sent, else why not."""
+    email = r.get("email")
+    if not email:
+        return "no email"
+    body = f"Dear {r.get('student_name')},\n\nOur records show outstanding fees of {r.get('total_due')}. Please pay at your earliest convenience.\n\nThanks."
+    subject = "Fee reminder — outstanding payment"
+    try:
+        send_email(email, subject, body)
+    except Exception as e:
+        return str(e)
+    return None
+
+
+@job_handler("fee_reminders", "Fee reminders")
+def fee_reminders_job(ctx, params):
+    conn = get_db(readonly=True)
+    cur = conn.cursor(dictionary=True)
+    rows = unpaid_fee_reminders(cur, params.get("class"))
+    cur.close()
+    conn.close()
+
+    sent = 0
+    with ctx.open_artifact("fee_reminders.csv", "text/csv", text=True) as f:
+        writer = csv.writer(f)
+        writer.writerow(["Student ID", "Student", "Email", "Due", "Result"])
+        for n, r in enumerate(rows, 1):
+            error = send_fee_reminder(r)
+            sent += error is None
+            writer.writerow([r["student_id"], r["student_name"], r.get("email"), r["total_due"], error or "sent"])
+            ctx.progress(n, len(rows), f"sent {sent}, failed {n - sent}")
+
 @app.route("/fees/send_reminders", methods=["POST"])
 def fees_send_reminders():
     """
     Send unpaid reminders for a class (or all). POST form fields:
       class (optional) — send reminders for this class only
+      background (optional) — 1 to send them from a job worker
     This will attempt to send one email per student with unpaid fees.
     """
     if "user" not in session:
@@ -2726,40 +5858,25 @@ def fees_send_reminders():
 
     cls = request.form.get("class", "").strip()  # optional
 
+    if wants_background():
+        # not retried: a second attempt would e-mail everyone again
+        job_id = enqueue_job("fee_reminders", {"class": cls}, max_attempts=1)
+        return redirect(url_for("job_status", job_id=job_id))
+
     conn = get_db()
     cur = conn.cursor(dictionary=True)
-
-    sql = """
-        SELECT s.id as student_id, s.name as student_name, s.email, SUM(f.amount) as total_due
-        FROM fees f
-        JOIN students s ON s.id = f.student_id
-        WHERE f.status = 'unpaid'
-    """
-    params = []
-    if cls:
-        sql += " AND s.class = %s"
-        params.append(cls)
-    sql += " GROUP BY s.id, s.name, s.email HAVING total_due > 0"
-
-    cur.execute(sql, tuple(params))
-    rows = cur.fetchall()
+    rows = unpaid_fee_reminders(cur, cls)
     cur.close()
     conn.close()
 
     sent = 0
     failed = []
     for r in rows:
-        email = r.get("email")
-        if not email:
-            failed.append((r.get("student_id"), "no email"))
-            continue
-        body = f"Dear {r.get('student_name')},\n\nOur records show outstanding fees of {r.get('total_due')}. Please pay at your earliest convenience.\n\nThanks."
-        subject = "Fee reminder — outstanding payment"
-        try:
-            send_email(email, subject, body)
+        error = send_fee_reminder(r)
+        if error is None:
             sent += 1
-        except Exception as e:
-            failed.append((r.get("student_id"), str(e)))
+        else:
+            failed.append((r.get("student_id"), error))
 
     flash(f"Reminders sent: {sent}. Failed: {len(failed)}.")
     return redirect(url_for("fees_list"))
@@ -2818,34 +5935,11 @@ def add_fee():
             "INSERT INTO fees (student_id, amount, status, paid_on, note, created_at) VALUES (%s,%s,%s,%s,%s,NOW())",
             (student_id, str(amount), status, paid_on, note)
         )
+        adjust_fee_rollup(cur2, "f.id = %s", (cur2.lastrowid,), 1)
+        refresh_fee_balances(cur2, [student_id])
         conn.commit()
         cur2.close()
-        flash("Fee record added.")
-        cur.close()
-        conn.close()
-        return redirect(url_for("fees_list"))
-
-        student_id = request.form.get("student_id") or None
-        amount_raw = request.form.get("amount", "0").strip()
-        note = request.form.get("note", "").strip()
-        try:
-            amount = Decimal(amount_raw)
-        except Exception:
-            flash("Invalid amount.")
-            cur.close()
-            conn.close()
-            return redirect(url_for("add_fee"))
-
-        status = request.form.get("status", "unpaid")
-        paid_on = request.form.get("paid_on") if status == "paid" else None
-
-        cur2 = conn.cursor()
-        cur2.execute(
-            "INSERT INTO fees (student_id, amount, status, paid_on, note, created_at) VALUES (%s,%s,%s,%s,%s,NOW())",
-            (student_id, str(amount), status, paid_on, note)
-        )
-        conn.commit()
-        cur2.close()
+        pdf_cache.invalidate(student_id)
         flash("Fee record added.")
         cur.close()
         conn.close()
@@ -2864,8 +5958,16 @@ def fees_mark_paid(fee_id):
     conn = get_db()
     cur = conn.cursor()
     try:
+        cur.execute("SELECT student_id FROM fees WHERE id=%s FOR UPDATE", (fee_id,))
+        row = cur.fetchone()
+        adjust_fee_rollup(cur, "f.id = %s", (fee_id,), -1)
         cur.execute("UPDATE fees SET status=%s, paid_on=%s WHERE id=%s", ("paid", paid_on, fee_id))
+        adjust_fee_rollup(cur, "f.id = %s", (fee_id,), 1)
+        if row:
+            refresh_fee_balances(cur, [row[0]])
         conn.commit()
+        if row:
+            pdf_cache.invalidate(row[0])
         flash("Marked as paid.")
     except Exception as e:
         conn.rollback()
@@ -2884,8 +5986,15 @@ def fees_delete(fee_id):
     conn = get_db()
     cur = conn.cursor()
     try:
+        cur.execute("SELECT student_id FROM fees WHERE id=%s FOR UPDATE", (fee_id,))
+        row = cur.fetchone()
+        adjust_fee_rollup(cur, "f.id = %s", (fee_id,), -1)
         cur.execute("DELETE FROM fees WHERE id=%s", (fee_id,))
+        if row:
+            refresh_fee_balances(cur, [row[0]])
         conn.commit()
+        if row:
+            pdf_cache.invalidate(row[0])
         flash("Fee record deleted.")
     except Exception as e:
         conn.rollback()
@@ -2904,330 +6013,235 @@ def fees_receipt_full(fee_id):
 
     conn = get_db()
     cur = conn.cursor(dictionary=True)
+    # the student's totals come from their fee_balances row
     cur.execute("""
         SELECT f.id as fee_id, f.student_id, f.amount, f.status, f.paid_on, f.note, f.created_at,
-               s.name as student_name, s.parent_name, s.class as student_class, s.id as student_db_id
+               s.name as student_name, s.parent_name, s.class as student_class, s.id as student_db_id,
+               b.paid AS balance_paid, b.outstanding AS balance_outstanding
         FROM fees f
         LEFT JOIN students s ON s.id = f.student_id
+        LEFT JOIN fee_balances b ON b.student_id = f.student_id
         WHERE f.id = %s
     """, (fee_id,))
     fee = cur.fetchone()
+    cur.close()
+    conn.close()
     if not fee:
-        cur.close(); conn.close()
         flash("Fee record not found.")
         return redirect(url_for("fees_list"))
 
     student_id = fee["student_id"]
 
-    # totals for this student
-    cur.execute("SELECT COALESCE(SUM(amount),0) AS total_paid FROM fees WHERE student_id=%s AND status='paid'", (student_id,))
-    tp = cur.fetchone()
-    total_paid = float(tp["total_paid"] or 0)
-
-    cur.execute("SELECT COALESCE(SUM(amount),0) AS total_unpaid FROM fees WHERE student_id=%s AND status='unpaid'", (student_id,))
-    tu = cur.fetchone()
-    total_unpaid = float(tu["total_unpaid"] or 0)
-
+    total_paid = float(fee.pop("balance_paid") or 0)
+    total_unpaid = float(fee.pop("balance_outstanding") or 0)
     paid_now = float(fee["amount"] or 0)
 
-    cur.close()
-    conn.close()
-
     # include this payment in display total if needed
     if fee.get("status") == "paid":
         display_total_paid = total_paid
     else:
         display_total_paid = total_paid + paid_now
 
-    remaining_after_payment = max(0.0, total_unpaid - paid_now)
-
-    # PDF
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    margin = 20 * mm
-    x = margin
-    y = height - margin
-
-    # header: school info
-    school_name = os.environ.get("SCHOOL_NAME", "Shree Manas International Public School")
-    p.setFont("Helvetica-Bold", 18)
-    p.drawString(x, y, school_name)
-    p.setFont("Helvetica", 10)
-    p.drawString(x, y - 16, "Address: " + os.environ.get(
-        "SCHOOL_ADDRESS",
-        "118, Sector 8 Main Rd, Sector 8, Raipur, Chhattisgarh 492014"
-    ))
-    p.drawString(x, y - 30, "Phone: " + os.environ.get("SCHOOL_PHONE", "+91-7000225026"))
-
-    # receipt title + date
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(width - margin - 160, y, "                    FEE RECEIPT")
-    p.setFont("Helvetica", 10)
-    p.drawString(width - margin - 160, y - 16, f"Receipt ID: {fee['fee_id']}")
-
-    paid_on_val = fee.get("paid_on") or fee.get("created_at") or datetime.utcnow().date()
-    if isinstance(paid_on_val, datetime):
-        paid_on_str = paid_on_val.strftime("%Y-%m-%d")
-    else:
-        paid_on_str = str(paid_on_val) if paid_on_val else date.today().isoformat()
-    p.drawString(width - margin - 160, y - 30, "Date: " + paid_on_str)
-
-    # student details
-    y -= 70
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(x, y, "Student Details")
-    p.setFont("Helvetica", 10)
-    y -= 16
-    p.drawString(x, y, f"Student: {fee.get('student_name') or '-'} (ID: {fee.get('student_db_id') or '-'})")
-    y -= 14
-    p.drawString(x, y, f"Parent: {fee.get('parent_name') or '-'}")
-    y -= 14
-    p.drawString(x, y, f"Class: {fee.get('student_class') or '-'}")
-
-    # payment table
-    y -= 28
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(x, y, "Payment Details")
-    y -= 16
-
-    table_x = x
-    table_w = width - 2 * margin
-    row_h = 16
-
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(table_x + 4, y, "Particulars")
-    p.drawString(table_x + table_w/2, y, "Amount (INR)")
-    y -= row_h
-
-    p.setFont("Helvetica", 10)
-    p.drawString(table_x + 4, y, "Total paid (all records)")
-    p.drawString(table_x + table_w/2, y, f"{total_paid:.2f}")
-    y -= row_h
-
-    p.drawString(table_x + 4, y, "Paid now")
-    p.drawString(table_x + table_w/2, y, f"{paid_now:.2f}")
-    y -= row_h
-
-    p.drawString(table_x + 4, y, "Remaining before payment")
-    p.drawString(table_x + table_w/2, y, f"{total_unpaid:.2f}")
-    y -= row_h
-
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(table_x + 4, y, "TOTAL PAID (including now)")
-    p.drawString(table_x + table_w/2, y, f"{display_total_paid:.2f}")
-    y -= (row_h + 6)
-
-    # note
-    p.setFont("Helvetica", 9)
-    p.drawString(table_x + 4, y, "Note: " + (fee.get("note") or ""))
-    y -= (row_h + 10)
-
-    # remaining box
-    box_x = table_x
-    box_w = 170 * mm
-    box_h = 30 * mm
-    p.setStrokeColor(colors.gray)
-    p.rect(box_x, y - box_h + 8, box_w, box_h, stroke=1, fill=0)
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(box_x + 6, y - 12, f"Remaining balance (after this payment): {remaining_after_payment:.2f}")
-    p.setFont("Helvetica", 9)
-    p.drawString(box_x + 6, y - 26, "Please clear dues at the school office.")
-
-    # signature area
-    sig_x = table_x + table_w - 80*mm
-    sig_y = y - 6
-    p.setFont("Helvetica", 10)
-    p.drawString(sig_x, sig_y, "Received by:")
-    p.line(sig_x, sig_y - 18, sig_x + 70*mm, sig_y - 18)
-    p.drawString(sig_x, sig_y - 30, "Authorized signatory")
-
-    sig_img_path = os.path.join(BASE_DIR, "static", "signature.png")
-    if os.path.exists(sig_img_path):
-        try:
-            p.drawImage(sig_img_path, sig_x, sig_y - 8 - 8,
-                        width=50*mm, preserveAspectRatio=True, mask='auto')
-        except Exception as e:
-            print("signature embed failed:", e)
+    totals = {
+        "total_paid": total_paid,
+        "total_unpaid": total_unpaid,
+        "paid_now": paid_now,
+        "display_total_paid": display_total_paid,
+        "remaining_after_payment": max(0.0, total_unpaid - paid_now),
+    }
+    school = school_details()
+    issued_on = date.today().isoformat()
+    signature = os.path.getmtime(SIGNATURE_PATH) if os.path.exists(SIGNATURE_PATH) else None
+
+    return pdf_download(
+        "receipt_full",
+        student_id,
+        {"fee": fee, "totals": totals, "school": school, "issued_on": issued_on, "signature": signature},
+        f"receipt_full_fee_{fee_id}.pdf",
+        lambda: render_fee_receipt_full(fee, totals, school, issued_on)
+    )
+# -------------------------------------------------------------------------
 
-    # footer
-    p.setFont("Helvetica-Oblique", 9)
-    p.drawString(margin, 30, "Thank you. This is a computer generated receipt and does not require a physical stamp.")
-    p.drawString(margin, 16, f"Issued on: {date.today().isoformat()}")
 
-    p.showPage()
-    p.save()
-    buffer.seek(0)
 
-    filename = f"receipt_full_fee_{fee_id}.pdf"
-    return Response(buffer.getvalue(), mimetype="application/pdf",
-                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+# ---------- JOBS MODULE ----------
+JOBS_PAGE_SIZE = 50
+
+
+def job_view(job):
+    """The JSON / template shape of a job row."""
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "label": JOB_LABELS.get(job["kind"], job["kind"]),
+        "state": job["state"],
+        "attempts": job["attempts"],
+        "max_attempts": job["max_attempts"],
+        "done": job["progress_done"],
+        "total": job["progress_total"],
+        "message": job["message"],
+        "error": job["error"],
+        "created_at": job["created_at"].isoformat(sep=" ") if job["created_at"] else None,
+        "finished_at": job["finished_at"].isoformat(sep=" ") if job["finished_at"] else None,
+        "download": (
+            url_for("job_download", job_id=job["id"])
+            if job["state"] == "done" and job["artifact"] else None
+        ),
+    }
 
-    if "user" not in session:
-        return redirect("/")
 
+def load_job_for_user(job_id):
     conn = get_db()
     cur = conn.cursor(dictionary=True)
-    cur.execute("""
-        SELECT f.id as fee_id, f.student_id, f.amount, f.status, f.paid_on, f.note, f.created_at,
-               s.name as student_name, s.parent_name, s.class as student_class, s.id as student_db_id
-        FROM fees f
-        LEFT JOIN students s ON s.id = f.student_id
-        WHERE f.id = %s
-    """, (fee_id,))
-    fee = cur.fetchone()
-    if not fee:
-        cur.close(); conn.close()
-        flash("Fee record not found.")
-        return redirect(url_for("fees_list"))
+    job = get_job(cur, job_id)
+    cur.close()
+    conn.close()
 
-    student_id = fee["student_id"]
+    if job is None:
+        abort(404)
+    if job["created_by"] != session.get("user_id") and session.get("role") != "admin":
+        abort(403)
+    return job
+
+@app.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    if "user" not in session:
+        return redirect("/login")
 
-    # totals for this student
-    cur.execute("SELECT COALESCE(SUM(amount),0) AS total_paid FROM fees WHERE student_id=%s AND status='paid'", (student_id,))
-    tp = cur.fetchone()
-    total_paid = float(tp["total_paid"] or 0)
+    job = job_view(load_job_for_user(job_id))
+    if request.args.get("format") == "json":
+        return jsonify(job)
 
-    cur.execute("SELECT COALESCE(SUM(amount),0) AS total_unpaid FROM fees WHERE student_id=%s AND status='unpaid'", (student_id,))
-    tu = cur.fetchone()
-    total_unpaid = float(tu["total_unpaid"] or 0)
+    return render_template("job.html", job=job)
 
-    paid_now = float(fee["amount"] or 0)
+@app.route("/jobs/<int:job_id>/download")
+def job_download(job_id):
+    if "user" not in session:
+        return redirect("/login")
+
+    job = load_job_for_user(job_id)
+    if job["state"] != "done" or not job["artifact"]:
+        abort(404)
+
+    path = job_artifact_path(job["artifact"])
+    if not os.path.exists(path):
+        abort(410)
+    return send_file(
+        path,
+        mimetype=job["artifact_type"],
+        as_attachment=True,
+        download_name=job["artifact_name"]
+    )
+
+@app.route("/admin/jobs")
+def admin_jobs():
+    if "user" not in session:
+        return redirect("/login")
 
+    if session.get("role") != "admin":
+        abort(403)
+
+    # filters: ?state=&kind=; pages go back from ?before=<id>
+    state = request.args.get("state", "")
+    kind = request.args.get("kind", "")
+    before = request.args.get("before", type=int)
+
+    sql = """
+        SELECT j.id, j.kind, j.state, j.attempts, j.max_attempts, j.progress_done,
+            j.progress_total, j.message, j.error, j.artifact, j.created_at,
+            j.finished_at, u.username
+        FROM jobs j
+        LEFT JOIN users u ON u.id = j.created_by
+    """
+    where = []
+    params = []
+
+    if state in JOB_STATES:
+        where.append("j.state = %s")
+        params.append(state)
+
+    if kind in JOB_HANDLERS:
+        where.append("j.kind = %s")
+        params.append(kind)
+
+    if before:
+        where.append("j.id < %s")
+        params.append(before)
+
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY j.id DESC LIMIT %s"
+    params.append(JOBS_PAGE_SIZE + 1)
+
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    cur.execute("SELECT state, COUNT(*) AS cnt FROM jobs GROUP BY state")
+    counts = {r["state"]: r["cnt"] for r in cur.fetchall()}
     cur.close()
     conn.close()
 
-    # display totals – include this payment if needed
-    if fee.get("status") == "paid":
-        display_total_paid = total_paid
-    else:
-        display_total_paid = total_paid + paid_now
+    more = len(rows) > JOBS_PAGE_SIZE
+    rows = rows[:JOBS_PAGE_SIZE]
+    jobs = []
+    for r in rows:
+        job = job_view(r)
+        job["username"] = r["username"]
+        jobs.append(job)
 
-    remaining_after_payment = max(0.0, total_unpaid - paid_now)
-
-    # PDF
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    margin = 20 * mm
-    x = margin
-    y = height - margin
-
-    # header: school info
-    school_name = os.environ.get("SCHOOL_NAME", "Shree Manas International Public School")
-    p.setFont("Helvetica-Bold", 18)
-    p.drawString(x, y, school_name)
-    p.setFont("Helvetica", 10)
-    p.drawString(x, y - 16, "Address: " + os.environ.get(
-        "SCHOOL_ADDRESS",
-        "118, Sector 8 Main Rd, Sector 8, Raipur, Chhattisgarh 492014"
-    ))
-    p.drawString(x, y - 30, "Phone: " + os.environ.get("SCHOOL_PHONE", "+91-7000225026"))
-
-    # receipt title + date
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(width - margin - 160, y, "FEE RECEIPT")
-    p.setFont("Helvetica", 10)
-    p.drawString(width - margin - 160, y - 16, f"Receipt ID: {fee['fee_id']}")
-
-    paid_on_val = fee.get("paid_on") or fee.get("created_at") or datetime.utcnow().date()
-    if isinstance(paid_on_val, datetime):
-        paid_on_str = paid_on_val.strftime("%Y-%m-%d")
-    else:
-        paid_on_str = str(paid_on_val) if paid_on_val else date.today().isoformat()
-    p.drawString(width - margin - 160, y - 30, "Date: " + paid_on_str)
-
-    # student details
-    y -= 70
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(x, y, "Student Details")
-    p.setFont("Helvetica", 10)
-    y -= 16
-    p.drawString(x, y, f"Student: {fee.get('student_name') or '-'} (ID: {fee.get('student_db_id') or '-'})")
-    y -= 14
-    p.drawString(x, y, f"Parent: {fee.get('parent_name') or '-'}")
-    y -= 14
-    p.drawString(x, y, f"Class: {fee.get('student_class') or '-'}")
-
-    # payment table
-    y -= 28
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(x, y, "Payment Details")
-    y -= 16
-
-    table_x = x
-    table_w = width - 2 * margin
-    row_h = 16
-
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(table_x + 4, y, "Particulars")
-    p.drawString(table_x + table_w/2, y, "Amount (INR)")
-    y -= row_h
-
-    p.setFont("Helvetica", 10)
-    p.drawString(table_x + 4, y, "Total paid (all records)")
-    p.drawString(table_x + table_w/2, y, f"{total_paid:.2f}")
-    y -= row_h
-
-    p.drawString(table_x + 4, y, "Paid now")
-    p.drawString(table_x + table_w/2, y, f"{paid_now:.2f}")
-    y -= row_h
-
-    p.drawString(table_x + 4, y, "Remaining before payment")
-    p.drawString(table_x + table_w/2, y, f"{total_unpaid:.2f}")
-    y -= row_h
-
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(table_x + 4, y, "TOTAL PAID (including now)")
-    p.drawString(table_x + table_w/2, y, f"{display_total_paid:.2f}")
-    y -= (row_h + 6)
-
-    # note
-    p.setFont("Helvetica", 9)
-    p.drawString(table_x + 4, y, "Note: " + (fee.get("note") or ""))
-    y -= (row_h + 10)
-
-    # remaining box
-    box_x = table_x
-    box_w = 120 * mm
-    box_h = 30 * mm
-    p.setStrokeColor(colors.gray)
-    p.rect(box_x, y - box_h + 8, box_w, box_h, stroke=1, fill=0)
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(box_x + 6, y - 12, f"Remaining balance (after this payment): {remaining_after_payment:.2f}")
-    p.setFont("Helvetica", 9)
-    p.drawString(box_x + 6, y - 26, "Please clear dues at the school office.")
-
-    # signature area
-    sig_x = table_x + table_w - 8*mm
-    sig_y = y - 6
-    p.setFont("Helvetica", 10)
-    p.drawString(sig_x, sig_y, "Received by:")
-    p.line(sig_x, sig_y - 18, sig_x + 70*mm, sig_y - 18)
-    p.drawString(sig_x, sig_y - 3, "Authorized signatory")
-
-    sig_img_path = os.path.join(BASE_DIR, "static", "signature.png")
-    if os.path.exists(sig_img_path):
-        try:
-            p.drawImage(sig_img_path, sig_x, sig_y - 18 - 40,
-                        width=50*mm, preserveAspectRatio=True, mask='auto')
-        except Exception as e:
-            print("signature embed failed:", e)
+    return render_template(
+        "admin_jobs.html",
+        jobs=jobs,
+        counts=counts,
+        states=JOB_STATES,
+        kinds=JOB_LABELS,
+        state=state,
+        kind=kind,
+        next_before=rows[-1]["id"] if more else None
+    )
+
+@app.route("/admin/jobs/<int:job_id>/cancel", methods=["POST"])
+def admin_job_cancel(job_id):
+    if "user" not in session or session.get("role") != "admin":
+        abort(403)
 
-    # footer
-    p.setFont("Helvetica-Oblique", 9)
-    p.drawString(margin, 30, "Thank you. This is a computer generated receipt and does require a physical stamp.")
-    p.drawString(margin, 16, f"Issued on: {date.today().isoformat()}")
+    conn = get_db()
+    cur = conn.cursor()
+    # a running job notices at its next heartbeat and stops
+    cur.execute("""
+        UPDATE jobs SET state = 'cancelled', finished_at = NOW()
+        WHERE id = %s AND state IN ('queued', 'running')
+    """, (job_id,))
+    conn.commit()
+    flash(f"Job {job_id} cancelled." if cur.rowcount else f"Job {job_id} has already finished.")
+    cur.close()
+    conn.close()
+
+    return redirect(request.referrer or url_for("admin_jobs"))
+
+@app.route("/admin/jobs/<int:job_id>/retry", methods=["POST"])
+def admin_job_retry(job_id):
+    if "user" not in session or session.get("role") != "admin":
+        abort(403)
 
-    p.showPage()
-    p.save()
-    buffer.seek(0)
+    conn = get_db()
+    cur = conn.cursor()
+    # single-attempt jobs (fee reminders) that already started may have done
+    # part of their work; running them again would repeat it
+    cur.execute("""
+        UPDATE jobs
+        SET state = 'queued', attempts = 0, run_after = NOW(3), error = NULL,
+            progress_done = 0, progress_total = 0, message = NULL, finished_at = NULL
+        WHERE id = %s AND state IN ('failed', 'cancelled')
+          AND (max_attempts > 1 OR attempts = 0)
+    """, (job_id,))
+    conn.commit()
+    flash(f"Job {job_id} queued again." if cur.rowcount else f"Job {job_id} can't be retried.")
+    cur.close()
+    conn.close()
 
-    filename = f"reciept_full_fee_{fee_id}.pdf" 
-    return Response(buffer.getvalue(), mimetype="application/pdf",
-                    headers = {"content-Disposition" : f"attachment; filename={filename}"})
+    return redirect(request.referrer or url_for("admin_jobs"))
 # -------------------------------------------------------------------------
 
 
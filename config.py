@@ -0,0 +1,151 @@
+# config.py
+# Runtime settings, read from the environment with local-dev defaults.
+import os
+
+# ---- Database ----
+DB_HOST = os.environ.get("DB_HOST", "127.0.0.1")
+DB_PORT = int(os.environ.get("DB_PORT", "3306"))
+DB_USER = os.environ.get("DB_USER", "school_user")
+DB_PASS = os.environ.get("DB_PASS", "school123")
+DB_NAME = os.environ.get("DB_NAME", "SMIPS")
+
+# ---- Connection pool ----
+# max connections held open by one app process
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+# seconds a request waits for a free connection before giving up (503)
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+# idle connections older than this are pinged before being handed out
+DB_POOL_PING_AFTER = float(os.environ.get("DB_POOL_PING_AFTER", "30"))
+
+# ---- Read replica ----
+# Leave DB_REPLICA_HOST empty to send every query to the primary. For local
+# testing any second MySQL instance works, including the primary itself on
+# another host alias (e.g. DB_REPLICA_HOST=localhost).
+DB_REPLICA_HOST = os.environ.get("DB_REPLICA_HOST", "")
+DB_REPLICA_PORT = int(os.environ.get("DB_REPLICA_PORT", str(DB_PORT)))
+DB_REPLICA_USER = os.environ.get("DB_REPLICA_USER", DB_USER)
+DB_REPLICA_PASS = os.environ.get("DB_REPLICA_PASS", DB_PASS)
+DB_REPLICA_POOL_SIZE = int(os.environ.get("DB_REPLICA_POOL_SIZE", str(DB_POOL_SIZE)))
+# after a session commits a write, its reads stay on the primary this long
+# so it never sees the replica lag behind its own change
+DB_READ_YOUR_WRITES_SECONDS = float(os.environ.get("DB_READ_YOUR_WRITES_SECONDS", "10"))
+
+# ---- SQL instrumentation ----
+SQL_INSTRUMENT = os.environ.get("SQL_INSTRUMENT", "1") == "1"
+# statements slower than this (ms) are printed to the slow-query log
+SQL_SLOW_MS = float(os.environ.get("SQL_SLOW_MS", "200"))
+# the same statement shape run this many times in one request is flagged as N+1
+SQL_REPEAT_THRESHOLD = int(os.environ.get("SQL_REPEAT_THRESHOLD", "5"))
+
+# ---- Password hashing ----
+# scheme for new hashes: "scrypt" (werkzeug default), "pbkdf2" or "bcrypt".
+# Hashes made with another scheme or older parameters are upgraded on the
+# user's next successful login.
+PASSWORD_SCHEME = os.environ.get("PASSWORD_SCHEME", "scrypt")
+SCRYPT_N = int(os.environ.get("SCRYPT_N", "32768"))
+PBKDF2_ITERATIONS = int(os.environ.get("PBKDF2_ITERATIONS", "600000"))
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# hash checks run in this many worker processes (0 = inline in the request thread)
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", str(os.cpu_count() or 2)))
+# at most this many logins are hashing or queued at once; the rest wait up
+# to PASSWORD_QUEUE_TIMEOUT seconds and then get a 503
+PASSWORD_MAX_INFLIGHT = int(os.environ.get("PASSWORD_MAX_INFLIGHT", str(PASSWORD_WORKERS * 4 or 8)))
+PASSWORD_QUEUE_TIMEOUT = float(os.environ.get("PASSWORD_QUEUE_TIMEOUT", "10"))
+
+# ---- Sessions ----
+# sessions live on disk; the cookie only carries a signed session id
+SESSION_DIR = os.environ.get(
+    "SESSION_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "sessions")
+)
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(12 * 3600)))
+# cached principal (user id, role, student / children / class ids)
+PRINCIPAL_TTL = int(os.environ.get("PRINCIPAL_TTL", "3600"))
+
+# ---- Query fan-out ----
+# threads shared by all requests for running independent dashboard queries
+FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", "16"))
+# max queries one request runs at the same time, each on a pool connection
+# that is free at the time (otherwise they run one by one on the request's own)
+FANOUT_PER_REQUEST = int(os.environ.get("FANOUT_PER_REQUEST", "4"))
+FANOUT_TIMEOUT = float(os.environ.get("FANOUT_TIMEOUT", "10"))
+
+# ---- Reference data ----
+# classes (and other small lookup lists) are cached in each process; this is
+# how often (seconds) a process checks whether another one changed them
+REFDATA_CHECK_SECONDS = float(os.environ.get("REFDATA_CHECK_SECONDS", "5"))
+
+# ---- Bulk writes ----
+# rows per multi-row INSERT ... ON DUPLICATE KEY UPDATE statement
+BULK_UPSERT_CHUNK = int(os.environ.get("BULK_UPSERT_CHUNK", "500"))
+# attendance older than this many days can no longer be changed in bulk
+ATTENDANCE_LOCK_DAYS = int(os.environ.get("ATTENDANCE_LOCK_DAYS", "3"))
+
+# ---- Attendance reports ----
+# rows per page on /attendance/monthly
+MONTHLY_PAGE_SIZE = int(os.environ.get("MONTHLY_PAGE_SIZE", "50"))
+
+# ---- Exports ----
+# rows pulled from MySQL per fetchmany() while streaming a CSV export
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "2000"))
+# rows per page on /attendance/history (and its JSON variant)
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "50"))
+
+# ---- Fees ----
+# rows per page on /fees (and its JSON variant)
+FEES_PAGE_SIZE = int(os.environ.get("FEES_PAGE_SIZE", "50"))
+
+# ---- Attendance sync API ----
+# max changes accepted in one POST /attendance/sync batch
+SYNC_MAX_CHANGES = int(os.environ.get("SYNC_MAX_CHANGES", "2000"))
+# idempotency keys (and their stored acks) are kept this many days
+SYNC_KEY_TTL_DAYS = int(os.environ.get("SYNC_KEY_TTL_DAYS", "7"))
+# device client_ts further ahead of the server clock than this is clamped
+SYNC_MAX_CLOCK_SKEW_SECONDS = int(os.environ.get("SYNC_MAX_CLOCK_SKEW_SECONDS", "120"))
+
+# ---- Absenteeism analytics ----
+# students under this attendance % are flagged as chronically absent
+ANALYTICS_CHRONIC_PCT = float(os.environ.get("ANALYTICS_CHRONIC_PCT", "75"))
+# an ongoing run of this many absent school days is flagged
+ANALYTICS_STREAK_DAYS = int(os.environ.get("ANALYTICS_STREAK_DAYS", "3"))
+# trailing window (days) for rolling % and for class trend slopes
+ANALYTICS_ROLLING_DAYS = int(os.environ.get("ANALYTICS_ROLLING_DAYS", "30"))
+# a class whose daily rate falls at least this many points per window is "dropping"
+ANALYTICS_DROP_PP = float(os.environ.get("ANALYTICS_DROP_PP", "5"))
+
+# ---- Report cards ----
+# worker processes drawing class batches of report card PDFs (0 = inline)
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", str(os.cpu_count() or 2)))
+# report cards handed to a worker at a time
+REPORT_BATCH_CHUNK = int(os.environ.get("REPORT_BATCH_CHUNK", "8"))
+# classes bigger than this are queued as a background job with a progress page
+REPORT_BATCH_SYNC_MAX = int(os.environ.get("REPORT_BATCH_SYNC_MAX", "60"))
+
+# ---- PDF cache ----
+# generated report cards and receipts, keyed by a hash of their contents
+PDF_CACHE_DIR = os.environ.get(
+    "PDF_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "pdf_cache")
+)
+# least recently used PDFs are evicted beyond this size (0 = don't cache)
+PDF_CACHE_MAX_MB = int(os.environ.get("PDF_CACHE_MAX_MB", "256"))
+
+# ---- Background jobs ----
+# results of finished jobs (exports, report card batches) are written here
+JOB_ARTIFACT_DIR = os.environ.get(
+    "JOB_ARTIFACT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "job_artifacts")
+)
+# worker processes started by `flask --app app jobs work`
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# how often (seconds) an idle worker looks for queued jobs
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "2"))
+# a running job's lease; the worker's heartbeat renews it every third of this,
+# and a job whose lease ran out (worker died) is retried
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# retry n waits JOB_RETRY_BASE_SECONDS * 2^(n-1), at most JOB_RETRY_MAX_SECONDS
+JOB_RETRY_BASE_SECONDS = float(os.environ.get("JOB_RETRY_BASE_SECONDS", "30"))
+JOB_RETRY_MAX_SECONDS = float(os.environ.get("JOB_RETRY_MAX_SECONDS", "1800"))
+# finished jobs and their artifacts are deleted after this many days
+JOB_KEEP_DAYS = int(os.environ.get("JOB_KEEP_DAYS", "7"))
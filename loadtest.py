@@ -0,0 +1,277 @@
+# loadtest.py
+# Replays role-based user journeys against a running app and reports
+# per-route latency percentiles, throughput and error rates.
+#
+#   python loadtest.py --base-url http://127.0.0.1:5000 --users 50 --ramp 30 --duration 120
+#   python loadtest.py ... --save runs/before_term.json
+#   python loadtest.py ... --baseline runs/before_term.json     # exit 1 on regression
+#
+# Logins use the accounts created by seed_data.py (teacherNNNN,
+# parentNNNNN, admin; password "password123").
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date
+from http.cookiejar import CookieJar
+
+STATUS_FIELD = re.compile(r'name="status_(\d+)"')
+CLASS_OPTION = re.compile(r'<option value="(\d+)"')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Keep 302s visible so each hop is timed as its own request."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.started = time.time()
+
+    def add(self, route, ms, ok):
+        with self.lock:
+            self.samples.setdefault(route, []).append((ms, ok))
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+class Client:
+    """One virtual user: own cookie jar (Flask session cookie), timed requests."""
+
+    def __init__(self, base_url, recorder, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect()
+        )
+
+    def request(self, method, path, form=None, label=None):
+        route = f"{method} {label or path.split('?', 1)[0]}"
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+
+        started = time.perf_counter()
+        status, body, location = 0, b"", ""
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                status = resp.status
+                body = resp.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+            location = e.headers.get("Location", "")
+            body = e.read()
+        except Exception:
+            status = 0
+        ms = (time.perf_counter() - started) * 1000
+
+        ok = 200 <= status < 400 and not location.endswith("/login")
+        self.recorder.add(route, ms, ok)
+        return status, body.decode("utf-8", "replace"), location
+
+    def login(self, username, password):
+        status, _, location = self.request("POST", "/login", {"username": username, "password": password})
+        return status == 302 and not location.endswith("/login")
+
+
+# ---------- journeys ----------
+def teacher_journey(client, rng, args):
+    if not client.login(f"teacher{rng.randint(1, args.teachers):04d}", args.password):
+        return
+    _, html, _ = client.request("GET", "/attendance")
+    class_ids = CLASS_OPTION.findall(html) or [str(rng.randint(1, args.classes))]
+    today = date.today().isoformat()
+
+    for _ in range(args.iterations):
+        class_id = rng.choice(class_ids)
+        _, html, _ = client.request("GET", f"/attendance/roster?class_id={class_id}&date={today}")
+        form = {"class_id": class_id, "date": today}
+        for sid in STATUS_FIELD.findall(html):
+            form[f"status_{sid}"] = "Present" if rng.random() < 0.9 else "Absent"
+            form[f"remarks_{sid}"] = ""
+        client.request("POST", "/attendance/roster", form)
+        think(rng, args)
+
+
+def parent_journey(client, rng, args):
+    if not client.login(f"parent{rng.randint(1, args.parents):05d}", args.password):
+        return
+    for _ in range(args.iterations):
+        client.request("GET", "/parent/dashboard")
+        client.request("GET", "/parent/fees")
+        client.request("GET", "/parent/attendance")
+        think(rng, args)
+
+
+def admin_journey(client, rng, args):
+    if not client.login("admin", args.password):
+        return
+    for _ in range(args.iterations):
+        client.request("GET", "/fees/reports")
+        client.request("GET", "/attendance/export")
+        think(rng, args)
+
+
+JOURNEYS = {"teacher": teacher_journey, "parent": parent_journey, "admin": admin_journey}
+
+
+def think(rng, args):
+    if args.think_ms:
+        time.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000)
+
+
+def virtual_user(n, role, deadline, recorder, args):
+    rng = random.Random(args.seed * 100003 + n)
+    while time.time() < deadline:
+        JOURNEYS[role](Client(args.base_url, recorder, args.timeout), rng, args)
+        # also keeps a user whose login failed from hammering /login
+        think(rng, args)
+
+
+# ---------- report ----------
+def summarize(recorder, elapsed):
+    report = {}
+    for route, samples in sorted(recorder.samples.items()):
+        times = sorted(ms for ms, _ in samples)
+        errors = sum(1 for _, ok in samples if not ok)
+        report[route] = {
+            "count": len(samples),
+            "errors": errors,
+            "error_rate": round(errors / len(samples), 4),
+            "rps": round(len(samples) / elapsed, 2),
+            "p50": round(percentile(times, 50), 1),
+            "p95": round(percentile(times, 95), 1),
+            "p99": round(percentile(times, 99), 1),
+        }
+    return report
+
+
+def print_report(report, elapsed, baseline=None, tolerance=0.2, slo_p95=None, slo_p99=None, max_error_rate=0.01):
+    total = sum(r["count"] for r in report.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)\n")
+    print(f"{'route':36} {'count':>7} {'rps':>7} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8}  notes")
+
+    failures = []
+    for route, r in report.items():
+        notes = []
+        if slo_p95 and r["p95"] > slo_p95:
+            notes.append(f"p95 > SLO {slo_p95:g}ms")
+        if slo_p99 and r["p99"] > slo_p99:
+            notes.append(f"p99 > SLO {slo_p99:g}ms")
+        if r["error_rate"] > max_error_rate:
+            notes.append(f"errors > {max_error_rate:.0%}")
+
+        if baseline and route in baseline:
+            b = baseline[route]
+            if b["p95"] and r["p95"] > b["p95"] * (1 + tolerance):
+                notes.append(f"REGRESSION p95 {b['p95']:g} -> {r['p95']:g}ms")
+            elif b["p95"]:
+                notes.append(f"p95 {(r['p95'] - b['p95']) / b['p95']:+.0%} vs baseline")
+
+        if any(n.startswith(("REGRESSION", "p95 >", "p99 >", "errors")) for n in notes):
+            failures.append(route)
+
+        print(
+            f"{route:36} {r['count']:>7} {r['rps']:>7} {r['error_rate'] * 100:>5.1f}% "
+            f"{r['p50']:>7.1f} {r['p95']:>7.1f} {r['p99']:>7.1f}   {'; '.join(notes)}"
+        )
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Role-based load test for the school app.")
+    ap.add_argument("--base-url", default="http://127.0.0.1:5000")
+    ap.add_argument("--users", type=int, default=20, help="peak concurrent virtual users")
+    ap.add_argument("--ramp", type=float, default=10, help="seconds to reach --users")
+    ap.add_argument("--duration", type=float, default=60, help="seconds at full load after ramp")
+    ap.add_argument("--mix", default="teacher=3,parent=6,admin=1", help="role weights")
+    ap.add_argument("--iterations", type=int, default=3, help="journey loops per login")
+    ap.add_argument("--think-ms", type=float, default=500, help="mean pause between journey steps")
+    ap.add_argument("--timeout", type=float, default=30)
+    ap.add_argument("--password", default="password123")
+    ap.add_argument("--teachers", type=int, default=900, help="teacher accounts to pick from")
+    ap.add_argument("--parents", type=int, default=17000, help="parent accounts to pick from")
+    ap.add_argument("--classes", type=int, default=600, help="fallback class id range")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--save", help="write results JSON here")
+    ap.add_argument("--baseline", help="compare against a saved results JSON")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth vs baseline")
+    ap.add_argument("--slo-p95", type=float, help="per-route p95 budget in ms")
+    ap.add_argument("--slo-p99", type=float, help="per-route p99 budget in ms")
+    ap.add_argument("--max-error-rate", type=float, default=0.01)
+    args = ap.parse_args()
+
+    weights = {}
+    for part in args.mix.split(","):
+        role, _, w = part.partition("=")
+        if role.strip() not in JOURNEYS:
+            ap.error(f"unknown role in --mix: {role}")
+        weights[role.strip()] = float(w or 1)
+
+    roles = []
+    rng = random.Random(args.seed)
+    for _ in range(args.users):
+        roles.append(rng.choices(list(weights), weights=list(weights.values()))[0])
+
+    recorder = Recorder()
+    deadline = time.time() + args.ramp + args.duration
+    threads = []
+    print(f"Ramping to {args.users} users over {args.ramp:g}s, then {args.duration:g}s at full load")
+    for n, role in enumerate(roles):
+        t = threading.Thread(target=virtual_user, args=(n, role, deadline, recorder, args), daemon=True)
+        t.start()
+        threads.append(t)
+        if args.users > 1:
+            time.sleep(args.ramp / args.users)
+
+    for t in threads:
+        t.join(timeout=max(0, deadline - time.time()) + args.timeout)
+
+    elapsed = time.time() - recorder.started
+    report = summarize(recorder, elapsed)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["routes"]
+
+    failures = print_report(
+        report, elapsed, baseline, args.tolerance,
+        args.slo_p95, args.slo_p99, args.max_error_rate
+    )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "started": recorder.started,
+                "elapsed": elapsed,
+                "users": args.users,
+                "mix": weights,
+                "routes": report,
+            }, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if failures:
+        print(f"\n{len(failures)} route(s) failed SLO / baseline checks.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+-- 0001_baseline.sql
+-- Schema as used by app.py before migrations existed. Every statement is
+-- IF NOT EXISTS so it can be applied on top of an existing database.
+
+CREATE TABLE IF NOT EXISTS users (
+    id          INT AUTO_INCREMENT PRIMARY KEY,
+    username    VARCHAR(100) NOT NULL,
+    password    VARCHAR(255) NOT NULL,
+    role        ENUM('admin', 'teacher', 'student', 'parent') NOT NULL,
+    created_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_users_username (username)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS classes (
+    id       INT AUTO_INCREMENT PRIMARY KEY,
+    name     VARCHAR(50) NOT NULL,
+    section  VARCHAR(10) NULL,
+    UNIQUE KEY uq_classes_name_section (name, section)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS students (
+    id            INT AUTO_INCREMENT PRIMARY KEY,
+    user_id       INT NULL,
+    name          VARCHAR(150) NOT NULL,
+    admission_no  VARCHAR(50) NULL,
+    roll_no       VARCHAR(20) NULL,
+    class_id      INT NULL,
+    class         VARCHAR(50) NULL,
+    section       VARCHAR(10) NULL,
+    dob           DATE NULL,
+    phone         VARCHAR(20) NULL,
+    email         VARCHAR(150) NULL,
+    parent_name   VARCHAR(150) NULL,
+    parent_phone  VARCHAR(20) NULL,
+    address       TEXT NULL,
+    photo         VARCHAR(255) NULL,
+    created_at    DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_students_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL,
+    CONSTRAINT fk_students_class FOREIGN KEY (class_id) REFERENCES classes(id) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS parents (
+    id       INT AUTO_INCREMENT PRIMARY KEY,
+    user_id  INT NOT NULL,
+    name     VARCHAR(150) NOT NULL,
+    phone    VARCHAR(20) NULL,
+    CONSTRAINT fk_parents_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS parent_student (
+    id              INT AUTO_INCREMENT PRIMARY KEY,
+    parent_id       INT NULL,
+    parent_user_id  INT NULL,
+    student_id      INT NOT NULL,
+    UNIQUE KEY uq_parent_student (parent_id, student_id),
+    CONSTRAINT fk_ps_student FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS attendance (
+    id          INT AUTO_INCREMENT PRIMARY KEY,
+    student_id  INT NOT NULL,
+    class_id    INT NULL,
+    date        DATE NOT NULL,
+    status      VARCHAR(10) NOT NULL,
+    remarks     VARCHAR(255) NULL,
+    created_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_attendance_student_date (student_id, date),
+    CONSTRAINT fk_attendance_student FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS fees (
+    id          INT AUTO_INCREMENT PRIMARY KEY,
+    student_id  INT NULL,
+    amount      DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    status      ENUM('paid', 'unpaid') NOT NULL DEFAULT 'unpaid',
+    due_date    DATE NULL,
+    paid_on     DATE NULL,
+    note        VARCHAR(255) NULL,
+    created_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_fees_student FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS marks (
+    id          INT AUTO_INCREMENT PRIMARY KEY,
+    student_id  INT NOT NULL,
+    subject     VARCHAR(100) NOT NULL,
+    marks       DECIMAL(6, 2) NULL,
+    max_marks   DECIMAL(6, 2) NOT NULL DEFAULT 100,
+    exam        VARCHAR(50) NOT NULL,
+    CONSTRAINT fk_marks_student FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS assignments (
+    id           INT AUTO_INCREMENT PRIMARY KEY,
+    title        VARCHAR(200) NOT NULL,
+    description  TEXT NULL,
+    class_id     INT NOT NULL,
+    due_date     DATE NULL,
+    created_by   INT NULL,
+    created_at   DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_assignments_class FOREIGN KEY (class_id) REFERENCES classes(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS assignment_submissions (
+    id               INT AUTO_INCREMENT PRIMARY KEY,
+    assignment_id    INT NOT NULL,
+    student_id       INT NOT NULL,
+    submission_text  TEXT NULL,
+    file_path        VARCHAR(255) NULL,
+    marks            DECIMAL(6, 2) NULL,
+    remarks          VARCHAR(255) NULL,
+    submitted_at     DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_submission (assignment_id, student_id),
+    CONSTRAINT fk_sub_assignment FOREIGN KEY (assignment_id) REFERENCES assignments(id) ON DELETE CASCADE,
+    CONSTRAINT fk_sub_student FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS homework (
+    id           INT AUTO_INCREMENT PRIMARY KEY,
+    title        VARCHAR(200) NOT NULL,
+    description  TEXT NULL,
+    class_id     INT NOT NULL,
+    due_date     DATE NULL,
+    created_by   INT NULL,
+    created_at   DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_homework_class FOREIGN KEY (class_id) REFERENCES classes(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS notices (
+    id          INT AUTO_INCREMENT PRIMARY KEY,
+    title       VARCHAR(200) NOT NULL,
+    message     TEXT NOT NULL,
+    class_id    INT NULL,
+    created_by  INT NULL,
+    created_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS books (
+    id           INT AUTO_INCREMENT PRIMARY KEY,
+    title        VARCHAR(200) NOT NULL,
+    subject      VARCHAR(100) NOT NULL,
+    description  TEXT NULL,
+    class_id     INT NOT NULL,
+    file_path    VARCHAR(255) NOT NULL,
+    uploaded_by  INT NULL,
+    uploaded_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,30 @@
+-- 0002_hot_query_indexes.sql
+-- Composite / covering indexes for the filters app.py runs on every page.
+-- Already-present indexes with the same name are skipped by the runner.
+
+-- attendance WHERE student_id=? AND date=?            -> uq_attendance_student_date
+-- attendance WHERE date=? AND student_id IN (...)     -> uq_attendance_student_date
+-- per-student summaries: SUM(status='Present') WHERE student_id=?  (covering)
+CREATE INDEX idx_attendance_student_status ON attendance (student_id, status);
+-- history / bulk save: WHERE class_id=? AND date=?
+CREATE INDEX idx_attendance_class_date ON attendance (class_id, date);
+
+-- fees WHERE student_id=? AND status=? with SUM(amount)  (covering)
+CREATE INDEX idx_fees_student_status ON fees (student_id, status, amount);
+-- fees ORDER BY created_at DESC, optionally filtered by status
+CREATE INDEX idx_fees_created ON fees (created_at);
+CREATE INDEX idx_fees_status_created ON fees (status, created_at);
+
+-- assignment_submissions (assignment_id, student_id)   -> uq_submission
+-- student dashboard: COUNT(*) WHERE student_id=?
+CREATE INDEX idx_submissions_student ON assignment_submissions (student_id, assignment_id);
+
+-- marks WHERE student_id=? AND exam=?
+CREATE INDEX idx_marks_student_exam ON marks (student_id, exam);
+
+-- parent_student WHERE parent_user_id=?
+CREATE INDEX idx_ps_parent_user ON parent_student (parent_user_id, student_id);
+
+-- rosters: students WHERE class_id=? ORDER BY name
+-- (students.user_id and assignments.class_id are covered by their FK indexes)
+CREATE INDEX idx_students_class_name ON students (class_id, name);
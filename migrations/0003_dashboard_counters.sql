@@ -0,0 +1,26 @@
+-- 0003_dashboard_counters.sql
+-- Running totals for the admin / teacher dashboards. Kept current by the
+-- write paths in app.py; `flask --app app db rebuild-counters` recomputes
+-- them from scratch.
+
+CREATE TABLE IF NOT EXISTS dashboard_counters (
+    name        VARCHAR(64) PRIMARY KEY,
+    value       BIGINT NOT NULL DEFAULT 0,
+    updated_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+REPLACE INTO dashboard_counters (name, value)
+SELECT 'users', COUNT(*) FROM users
+UNION ALL SELECT 'teachers', COUNT(*) FROM users WHERE role = 'teacher'
+UNION ALL SELECT 'parents', COUNT(*) FROM users WHERE role = 'parent'
+UNION ALL SELECT 'students', COUNT(*) FROM students
+UNION ALL SELECT 'classes', COUNT(*) FROM classes
+UNION ALL SELECT 'assignments', COUNT(*) FROM assignments
+UNION ALL
+SELECT 'pending_submissions', COUNT(*)
+FROM students s
+JOIN assignments a ON a.class_id = s.class_id
+LEFT JOIN assignment_submissions sub
+    ON sub.student_id = s.id
+    AND sub.assignment_id = a.id
+WHERE sub.id IS NULL;
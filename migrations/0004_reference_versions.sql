@@ -0,0 +1,12 @@
+-- 0004_reference_versions.sql
+-- One version number per cached reference list (classes, ...). Writers bump
+-- it in the same transaction as their change; app processes compare it with
+-- the version they have cached and reload only when it moved.
+
+CREATE TABLE IF NOT EXISTS reference_versions (
+    name        VARCHAR(64) PRIMARY KEY,
+    version     BIGINT NOT NULL DEFAULT 0,
+    updated_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT IGNORE INTO reference_versions (name, version) VALUES ('classes', 1);
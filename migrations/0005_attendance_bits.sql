@@ -0,0 +1,25 @@
+-- 0005_attendance_bits.sql
+-- One row per (student, month): bit d-1 of present / absent / on_leave is
+-- set when the student had that status on day d. Kept current by the
+-- attendance write paths in app.py; `flask --app app db
+-- backfill-attendance-bits` rebuilds it from the attendance table.
+
+CREATE TABLE IF NOT EXISTS attendance_bits (
+    student_id  INT NOT NULL,
+    month       DATE NOT NULL,
+    present     INT UNSIGNED NOT NULL DEFAULT 0,
+    absent      INT UNSIGNED NOT NULL DEFAULT 0,
+    on_leave    INT UNSIGNED NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, month),
+    CONSTRAINT fk_attendance_bits_student FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+REPLACE INTO attendance_bits (student_id, month, present, absent, on_leave)
+SELECT
+    student_id,
+    DATE_SUB(date, INTERVAL DAY(date) - 1 DAY),
+    BIT_OR(IF(LOWER(status) = 'present', 1 << (DAY(date) - 1), 0)),
+    BIT_OR(IF(LOWER(status) NOT IN ('present', 'leave'), 1 << (DAY(date) - 1), 0)),
+    BIT_OR(IF(LOWER(status) = 'leave', 1 << (DAY(date) - 1), 0))
+FROM attendance
+GROUP BY student_id, DATE_SUB(date, INTERVAL DAY(date) - 1 DAY);
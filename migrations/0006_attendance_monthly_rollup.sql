@@ -0,0 +1,31 @@
+-- 0006_attendance_monthly_rollup.sql
+-- Per student and month attendance counts for /attendance/monthly. Kept
+-- current from attendance_bits by the attendance write paths in app.py;
+-- `flask --app app db compact-rollups` rebuilds recent months from the
+-- attendance table and should run once a day.
+
+CREATE TABLE IF NOT EXISTS attendance_monthly_rollup (
+    student_id  INT NOT NULL,
+    class_id    INT NULL,
+    month       DATE NOT NULL,
+    present     SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+    absent      SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+    on_leave    SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+    total       SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, month),
+    KEY idx_rollup_month_class (month, class_id),
+    CONSTRAINT fk_rollup_student FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+REPLACE INTO attendance_monthly_rollup (student_id, class_id, month, present, absent, on_leave, total)
+SELECT
+    a.student_id,
+    s.class_id,
+    DATE_SUB(a.date, INTERVAL DAY(a.date) - 1 DAY),
+    SUM(LOWER(a.status) = 'present'),
+    SUM(LOWER(a.status) NOT IN ('present', 'leave')),
+    SUM(LOWER(a.status) = 'leave'),
+    COUNT(*)
+FROM attendance a
+JOIN students s ON s.id = a.student_id
+GROUP BY a.student_id, s.class_id, DATE_SUB(a.date, INTERVAL DAY(a.date) - 1 DAY);
@@ -0,0 +1,10 @@
+-- 0007_attendance_history_indexes.sql
+-- /attendance/history pages with ORDER BY date DESC, id DESC and a
+-- (date, id) keyset. Both indexes carry every column the page reads, so a
+-- page is an index range scan that stops after LIMIT rows.
+
+-- WHERE class_id=? AND date BETWEEN ... ORDER BY date, id
+CREATE INDEX idx_attendance_history_class ON attendance (class_id, date, id, student_id, status);
+-- no class filter: WHERE date BETWEEN ... ORDER BY date, id
+CREATE INDEX idx_attendance_history_date ON attendance (date, id, class_id, student_id, status);
+-- student filter: uq_attendance_student_date (student_id, date) + the primary key
@@ -0,0 +1,17 @@
+-- 0008_attendance_sync.sql
+-- Batch sync from teacher devices (POST /attendance/sync).
+-- client_ts: when the device recorded the status; a newer client_ts wins,
+-- rows saved from the web forms have none and lose to any device change.
+-- attendance_sync_keys: one row per (user, idempotency key) holding the
+-- ack that was sent, so a retried batch gets the same answer.
+
+ALTER TABLE attendance ADD COLUMN client_ts DATETIME(3) NULL;
+
+CREATE TABLE IF NOT EXISTS attendance_sync_keys (
+    user_id     INT NOT NULL,
+    idem_key    VARCHAR(64) NOT NULL,
+    response    TEXT NULL,
+    created_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, idem_key),
+    KEY idx_sync_keys_created (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
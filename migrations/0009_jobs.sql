@@ -0,0 +1,33 @@
+-- 0009_jobs.sql
+-- Background job queue (flask --app app jobs work).
+-- Workers claim queued rows whose run_after has passed with
+-- SELECT ... FOR UPDATE SKIP LOCKED and hold them with a lease
+-- (locked_until) that a heartbeat keeps extending; a job whose worker died
+-- is picked up again once its lease runs out.
+-- artifact: file name under JOB_ARTIFACT_DIR of the finished result.
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id              BIGINT AUTO_INCREMENT PRIMARY KEY,
+    kind            VARCHAR(50) NOT NULL,
+    params          TEXT NOT NULL,
+    state           ENUM('queued', 'running', 'done', 'failed', 'cancelled') NOT NULL DEFAULT 'queued',
+    attempts        INT NOT NULL DEFAULT 0,
+    max_attempts    INT NOT NULL DEFAULT 3,
+    run_after       DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    locked_by       VARCHAR(100) NULL,
+    locked_until    DATETIME(3) NULL,
+    progress_done   INT NOT NULL DEFAULT 0,
+    progress_total  INT NOT NULL DEFAULT 0,
+    message         VARCHAR(255) NULL,
+    error           TEXT NULL,
+    artifact        VARCHAR(255) NULL,
+    artifact_name   VARCHAR(255) NULL,
+    artifact_type   VARCHAR(100) NULL,
+    created_by      INT NULL,
+    created_at      DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at      DATETIME NULL,
+    finished_at     DATETIME NULL,
+    KEY idx_jobs_claim (state, run_after, id),
+    KEY idx_jobs_lease (state, locked_until),
+    KEY idx_jobs_owner (created_by, id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
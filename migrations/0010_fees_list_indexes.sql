@@ -0,0 +1,17 @@
+-- 0010_fees_list_indexes.sql
+-- /fees pages with ORDER BY created_at DESC, id DESC and a (created_at, id)
+-- keyset. Each index carries the columns the page filter and the totals of
+-- the filtered set read (status, student_id, amount), so the totals are an
+-- index-only range scan and a page stops after LIMIT rows, touching the
+-- table only for the rows it returns. They supersede the created_at
+-- indexes from 0002.
+-- A class filter goes through students (class_id) and
+-- idx_fees_student_status instead.
+
+-- no status filter: WHERE created_at BETWEEN ... ORDER BY created_at, id
+CREATE INDEX idx_fees_list ON fees (created_at, id, status, student_id, amount);
+-- WHERE status=? AND created_at BETWEEN ... ORDER BY created_at, id
+CREATE INDEX idx_fees_status_list ON fees (status, created_at, id, student_id, amount);
+
+DROP INDEX idx_fees_created ON fees;
+DROP INDEX idx_fees_status_created ON fees;
@@ -0,0 +1,27 @@
+-- 0011_fees_monthly_rollup.sql
+-- Fee count and amount per class, month and status for the /fees/reports
+-- summary. month: first day of the month the fee was created in;
+-- class_id: the student's current class (0 = none). Kept current by the fee
+-- write paths in app.py; `flask --app app db rebuild-fee-rollups`
+-- recomputes it and reports drift.
+
+CREATE TABLE IF NOT EXISTS fees_monthly_rollup (
+    class_id    INT NOT NULL DEFAULT 0,
+    month       DATE NOT NULL,
+    status      ENUM('paid', 'unpaid') NOT NULL,
+    records     INT NOT NULL DEFAULT 0,
+    amount      DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, class_id, status),
+    KEY idx_fees_rollup_class (class_id, month)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+REPLACE INTO fees_monthly_rollup (class_id, month, status, records, amount)
+SELECT
+    COALESCE(s.class_id, 0),
+    DATE_SUB(DATE(f.created_at), INTERVAL DAY(f.created_at) - 1 DAY),
+    f.status,
+    COUNT(*),
+    SUM(f.amount)
+FROM fees f
+LEFT JOIN students s ON s.id = f.student_id
+GROUP BY 1, 2, 3;
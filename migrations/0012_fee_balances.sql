@@ -0,0 +1,30 @@
+-- 0012_fee_balances.sql
+-- Running fee balance per student: total billed, paid, outstanding (unpaid)
+-- and the last payment date, for receipts, the student profile, parent
+-- fees, dues and outstanding reports. Kept current by the fee write paths
+-- in app.py, in the same transaction as the fee change;
+-- `flask --app app db verify-fee-balances` recomputes it and reports drift.
+
+CREATE TABLE IF NOT EXISTS fee_balances (
+    student_id    INT PRIMARY KEY,
+    billed        DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    paid          DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    outstanding   DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    unpaid_count  INT NOT NULL DEFAULT 0,
+    last_payment  DATE NULL,
+    updated_at    DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    KEY idx_fee_balances_unpaid (unpaid_count, outstanding),
+    CONSTRAINT fk_fee_balances_student FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+REPLACE INTO fee_balances (student_id, billed, paid, outstanding, unpaid_count, last_payment)
+SELECT
+    s.id,
+    COALESCE(SUM(f.amount), 0),
+    COALESCE(SUM(CASE WHEN f.status = 'paid' THEN f.amount END), 0),
+    COALESCE(SUM(CASE WHEN f.status = 'unpaid' THEN f.amount END), 0),
+    COUNT(CASE WHEN f.status = 'unpaid' THEN 1 END),
+    MAX(CASE WHEN f.status = 'paid' THEN f.paid_on END)
+FROM students s
+LEFT JOIN fees f ON f.student_id = s.id
+GROUP BY s.id;
@@ -0,0 +1,538 @@
+# pdf_render.py
+# The app's PDF documents (report cards, fee receipts) and the ReportLab
+# pieces they share:
+#   - ImageAsset: an image file decoded and compressed into a PDF image
+#     XObject once per process, then copied by reference into each document;
+#   - Letterhead: a static page header drawn once per document as a form
+#     XObject and placed on every page with doForm;
+#   - render_* functions return Canvas.getpdfdata() directly, so the bytes
+#     go to the response / cache / ZIP without a BytesIO round trip.
+#
+#   python pdf_render.py --receipts 500     # receipts/sec, per-document vs shared
+import argparse
+import copy
+import hashlib
+import os
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from PIL import Image
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.boxstuff import aspectRatioFix
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfgen import canvas
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SIGNATURE_PATH = os.path.join(BASE_DIR, "static", "signature.png")
+LOGO_PATH = os.path.join(BASE_DIR, "static", "logo.png")
+
+# Streams are written as binary. ReportLab's default ASCII85 wrapping only
+# matters for 7-bit transports and costs a pure-Python pass over every page
+# and image stream. This is process-wide on purpose: ReportLab reads the flag
+# whenever it creates or writes a stream rather than per Canvas, and every
+# PDF the app makes comes from this module.
+rl_config.useA85 = 0
+
+# False draws every image and header per document, the way the routes used
+# to; only the benchmark turns it off
+SHARED_ASSETS = True
+
+# Canvas / PDFDocument internals ImageAsset.draw() uses to share one XObject
+# (present in the ReportLab 4.x and 5.0 releases); without any of them it
+# falls back to the public drawImage()
+_CANVAS_INTERNALS = ("_doc", "_setXObjects", "_code", "_formsinuse")
+_DOC_INTERNALS = ("getXObjectName", "idToObject", "Reference", "addForm")
+
+
+def set_shared_assets(enabled):
+    global SHARED_ASSETS
+    SHARED_ASSETS = enabled
+
+
+def _can_share_xobjects(c):
+    return (all(hasattr(c, a) for a in _CANVAS_INTERNALS)
+            and all(hasattr(c._doc, a) for a in _DOC_INTERNALS))
+
+
+class ImageAsset:
+    """
+    An image file as a PDF image XObject, built on first use in each process
+    (and again if the file changes). Sources larger than `max_px` are scaled
+    down first; JPEG data is embedded as-is.
+    """
+
+    def __init__(self, path, max_px=None):
+        self.path = path
+        self.max_px = max_px
+        self._lock = threading.Lock()
+        self._loaded = None   # (mtime, template xobject, drawImage source)
+
+    def _template(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        with self._lock:
+            if self._loaded is None or self._loaded[0] != mtime:
+                self._loaded = (mtime, *self._build(mtime))
+            return self._loaded[1:]
+
+    def _build(self, mtime):
+        name = "Img" + hashlib.md5(f"{self.path}:{mtime}:{self.max_px}".encode()).hexdigest()[:16]
+        source = self.path
+        with Image.open(self.path) as im:
+            too_big = self.max_px and max(im.size) > self.max_px
+            if im.format != "JPEG" or too_big:
+                if too_big:
+                    im.thumbnail((self.max_px, self.max_px))
+                rgb = Image.new("RGB", im.size, "white")
+                rgba = im.convert("RGBA")
+                rgb.paste(rgba, mask=rgba)
+                source = ImageReader(rgb)
+            xobj = pdfdoc.PDFImageXObject(name, source)
+        xobj.name = name
+        return xobj, source
+
+    def draw(self, c, x, y, width=None, height=None, preserveAspectRatio=True, anchor="c"):
+        """Canvas.drawImage() for this asset; False if the file is missing."""
+        if not SHARED_ASSETS:
+            if not os.path.exists(self.path):
+                return False
+            c.drawImage(self.path, x, y, width=width, height=height,
+                        preserveAspectRatio=preserveAspectRatio, anchor=anchor, mask="auto")
+            return True
+
+        loaded = self._template()
+        if loaded is None:
+            return False
+        template, source = loaded
+
+        if not _can_share_xobjects(c):
+            c.drawImage(source, x, y, width=width, height=height,
+                        preserveAspectRatio=preserveAspectRatio, anchor=anchor, mask="auto")
+            return True
+
+        # the registration Canvas.drawImage does, except the XObject is a
+        # shallow copy of the process-wide one, so its stream isn't rebuilt
+        reg_name = c._doc.getXObjectName(template.name)
+        xobj = c._doc.idToObject.get(reg_name)
+        if xobj is None:
+            xobj = copy.copy(template)
+            c._setXObjects(xobj)
+            c._doc.Reference(xobj, reg_name)
+            c._doc.addForm(template.name, xobj)
+
+        x, y, width, height, _ = aspectRatioFix(
+            preserveAspectRatio, anchor, x, y, width, height, xobj.width, xobj.height
+        )
+        c._currentPageHasImages = 1
+        c.saveState()
+        c.translate(x, y)
+        c.scale(width, height)
+        c._code.append(f"/{reg_name} Do")
+        c.restoreState()
+        c._formsinuse.append(template.name)
+        return True
+
+
+class Letterhead:
+    """
+    Static page header: `draw_fn(c)` is recorded once per document as a
+    form XObject, and every page that carries the header just references it.
+    """
+
+    def __init__(self, name, draw_fn):
+        self.name = name
+        self.draw_fn = draw_fn
+
+    def draw(self, c):
+        if not SHARED_ASSETS:
+            self.draw_fn(c)
+            return
+        if not c.hasForm(self.name):
+            c.beginForm(self.name)
+            self.draw_fn(c)
+            c.endForm()
+        c.doForm(self.name)
+
+
+SIGNATURE = ImageAsset(SIGNATURE_PATH)
+LOGO = ImageAsset(LOGO_PATH, max_px=180)
+
+
+def new_canvas():
+    return canvas.Canvas(None, pagesize=A4)
+
+
+# ---------- report cards ----------
+def _draw_report_card_header(c):
+    width, height = A4
+    margin = 20 * mm
+    y = height - margin
+
+    # the per-document baseline is the card as the routes drew it, without a logo
+    if SHARED_ASSETS:
+        LOGO.draw(c, margin, y - 28, width=14 * mm, height=14 * mm)
+    c.setFont("Helvetica-Bold", 18)
+    c.drawCentredString(width / 2, y, "School Report Card")
+    c.line(margin, y - 30, width - margin, y - 30)
+
+
+REPORT_CARD_HEADER = Letterhead("ReportCardHeader", _draw_report_card_header)
+
+
+def report_grade(percentage):
+    if percentage >= 90:
+        return "A+"
+    if percentage >= 75:
+        return "A"
+    if percentage >= 60:
+        return "B"
+    if percentage >= 40:
+        return "C"
+    return "F"
+
+
+def report_card_filename(student, term):
+    safe_name = student["name"].replace(" ", "_")
+    return f"report_card_{safe_name}_{term}.pdf"
+
+
+def draw_report_card(p, student, term, results, attendance):
+    """Draw one report card on canvas `p` (A4), finishing its last page."""
+    total_marks = sum(r["marks"] for r in results if r["marks"] is not None)
+    max_marks = sum(r["max_marks"] for r in results if r["max_marks"] is not None)
+    percentage = (total_marks / max_marks * 100) if max_marks else 0
+    grade = report_grade(percentage)
+
+    width, height = A4
+
+    margin = 20 * mm
+    x = margin
+    y = height - margin
+
+    REPORT_CARD_HEADER.draw(p)
+    y -= 20
+    p.setFont("Helvetica", 12)
+    p.drawCentredString(width / 2, y, term)
+
+    # Student info
+    y -= 40
+    p.setFont("Helvetica", 11)
+    p.drawString(x, y, f"Name: {student['name']}")
+    y -= 15
+    p.drawString(x, y, f"Class: {student['class_name']} {student['section']}")
+
+    # Marks
+    y -= 30
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(x, y, "Academic Performance")
+    y -= 18
+
+    p.setFont("Helvetica", 10)
+    for r in results:
+        p.drawString(x + 10, y, r["subject"])
+        p.drawRightString(
+            width - margin,
+            y,
+            f"{r['marks']} / {r['max_marks']}"
+        )
+        y -= 14
+
+        if y < 120:
+            p.showPage()
+            y = height - margin
+
+    # Summary
+    y -= 20
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(x, y, "Result Summary")
+    y -= 16
+    p.setFont("Helvetica", 10)
+    p.drawString(x + 10, y, f"Total Marks: {total_marks} / {max_marks}")
+    y -= 14
+    p.drawString(x + 10, y, f"Percentage: {percentage:.2f}%")
+    y -= 14
+    p.drawString(x + 10, y, f"Grade: {grade}")
+
+    # Attendance
+    if attendance:
+        y -= 14
+        p.drawString(
+            x + 10, y,
+            "Attendance: " + ", ".join(f"{a['status']} {a['cnt']}" for a in attendance)
+        )
+
+    p.showPage()
+
+
+def render_report_card(student, term, results, attendance):
+    """One report card as PDF bytes."""
+    p = new_canvas()
+    draw_report_card(p, student, term, results, attendance)
+    return p.getpdfdata()
+
+
+def render_report_card_chunk(cards, merged):
+    """
+    Process-pool entry point. Returns [(zip name, pdf bytes)] for `cards`,
+    or a single PDF holding all of them when `merged`.
+    """
+    if not merged:
+        return [
+            (f"{card['student']['id']}_{report_card_filename(card['student'], card['term'])}",
+             render_report_card(**card))
+            for card in cards
+        ]
+
+    p = new_canvas()
+    for card in cards:
+        draw_report_card(p, **card)
+    return p.getpdfdata()
+
+
+# ---------- fee receipts ----------
+def school_details():
+    return {
+        "name": os.environ.get("SCHOOL_NAME", "Shree Manas International Public School"),
+        "address": os.environ.get(
+            "SCHOOL_ADDRESS",
+            "118, Sector 8 Main Rd, Sector 8, Raipur, Chhattisgarh 492014"
+        ),
+        "phone": os.environ.get("SCHOOL_PHONE", "+91-7000225026"),
+    }
+
+
+_receipt_letterheads = {}
+
+
+def receipt_letterhead(school):
+    """School header + receipt title, one Letterhead per distinct school details."""
+    key = (school["name"], school["address"], school["phone"])
+    letterhead = _receipt_letterheads.get(key)
+    if letterhead is None:
+        def draw(c):
+            width, height = A4
+            margin = 20 * mm
+            x = margin
+            y = height - margin
+
+            c.setFont("Helvetica-Bold", 18)
+            c.drawString(x, y, school["name"])
+            c.setFont("Helvetica", 10)
+            c.drawString(x, y - 16, "Address: " + school["address"])
+            c.drawString(x, y - 30, "Phone: " + school["phone"])
+
+            c.setFont("Helvetica-Bold", 14)
+            c.drawString(width - margin - 160, y, "                    FEE RECEIPT")
+
+        name = "ReceiptHeader" + hashlib.md5("\n".join(key).encode()).hexdigest()[:12]
+        letterhead = _receipt_letterheads[key] = Letterhead(name, draw)
+    return letterhead
+
+
+def render_fee_receipt(r):
+    """Simple receipt for one paid fee row, as PDF bytes."""
+    p = new_canvas()
+    width, height = A4
+
+    # Simple receipt layout
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(50, height - 80, "School App — Fee Receipt")
+    p.setFont("Helvetica", 11)
+    p.drawString(50, height - 110, f"Receipt ID: {r['id']}")
+    p.drawString(50, height - 130, f"Student: {r.get('student_name') or '-'} (ID: {r.get('student_id') or '-'})")
+    p.drawString(50, height - 150, f"Class: {r.get('student_class') or '-'}")
+    p.drawString(50, height - 170, f"Amount Paid: {r.get('amount')}")
+    p.drawString(50, height - 190, f"Paid On: {r.get('paid_on') or r.get('created_at')}")
+    p.drawString(50, height - 210, f"Note: {r.get('note') or ''}")
+    p.drawString(50, height - 250, "Thank you for your payment.")
+    p.showPage()
+    return p.getpdfdata()
+
+
+def render_fee_receipt_full(fee, totals, school, issued_on):
+    """Full receipt with the student's fee totals, as PDF bytes."""
+    total_paid = totals["total_paid"]
+    total_unpaid = totals["total_unpaid"]
+    paid_now = totals["paid_now"]
+    display_total_paid = totals["display_total_paid"]
+    remaining_after_payment = totals["remaining_after_payment"]
+
+    p = new_canvas()
+    width, height = A4
+
+    margin = 20 * mm
+    x = margin
+    y = height - margin
+
+    # header: school info + title
+    receipt_letterhead(school).draw(p)
+
+    # receipt id + date
+    p.setFont("Helvetica", 10)
+    p.drawString(width - margin - 160, y - 16, f"Receipt ID: {fee['fee_id']}")
+
+    paid_on_val = fee.get("paid_on") or fee.get("created_at") or datetime.utcnow().date()
+    if isinstance(paid_on_val, datetime):
+        paid_on_str = paid_on_val.strftime("%Y-%m-%d")
+    else:
+        paid_on_str = str(paid_on_val) if paid_on_val else date.today().isoformat()
+    p.drawString(width - margin - 160, y - 30, "Date: " + paid_on_str)
+
+    # student details
+    y -= 70
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(x, y, "Student Details")
+    p.setFont("Helvetica", 10)
+    y -= 16
+    p.drawString(x, y, f"Student: {fee.get('student_name') or '-'} (ID: {fee.get('student_db_id') or '-'})")
+    y -= 14
+    p.drawString(x, y, f"Parent: {fee.get('parent_name') or '-'}")
+    y -= 14
+    p.drawString(x, y, f"Class: {fee.get('student_class') or '-'}")
+
+    # payment table
+    y -= 28
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(x, y, "Payment Details")
+    y -= 16
+
+    table_x = x
+    table_w = width - 2 * margin
+    row_h = 16
+
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(table_x + 4, y, "Particulars")
+    p.drawString(table_x + table_w/2, y, "Amount (INR)")
+    y -= row_h
+
+    p.setFont("Helvetica", 10)
+    p.drawString(table_x + 4, y, "Total paid (all records)")
+    p.drawString(table_x + table_w/2, y, f"{total_paid:.2f}")
+    y -= row_h
+
+    p.drawString(table_x + 4, y, "Paid now")
+    p.drawString(table_x + table_w/2, y, f"{paid_now:.2f}")
+    y -= row_h
+
+    p.drawString(table_x + 4, y, "Remaining before payment")
+    p.drawString(table_x + table_w/2, y, f"{total_unpaid:.2f}")
+    y -= row_h
+
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(table_x + 4, y, "TOTAL PAID (including now)")
+    p.drawString(table_x + table_w/2, y, f"{display_total_paid:.2f}")
+    y -= (row_h + 6)
+
+    # note
+    p.setFont("Helvetica", 9)
+    p.drawString(table_x + 4, y, "Note: " + (fee.get("note") or ""))
+    y -= (row_h + 10)
+
+    # remaining box
+    box_x = table_x
+    box_w = 170 * mm
+    box_h = 30 * mm
+    p.setStrokeColor(colors.gray)
+    p.rect(box_x, y - box_h + 8, box_w, box_h, stroke=1, fill=0)
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(box_x + 6, y - 12, f"Remaining balance (after this payment): {remaining_after_payment:.2f}")
+    p.setFont("Helvetica", 9)
+    p.drawString(box_x + 6, y - 26, "Please clear dues at the school office.")
+
+    # signature area
+    sig_x = table_x + table_w - 80*mm
+    sig_y = y - 6
+    p.setFont("Helvetica", 10)
+    p.drawString(sig_x, sig_y, "Received by:")
+    p.line(sig_x, sig_y - 18, sig_x + 70*mm, sig_y - 18)
+    p.drawString(sig_x, sig_y - 30, "Authorized signatory")
+
+    try:
+        SIGNATURE.draw(p, sig_x, sig_y - 8 - 8, width=50*mm)
+    except Exception as e:
+        print("signature embed failed:", e)
+
+    # footer
+    p.setFont("Helvetica-Oblique", 9)
+    p.drawString(margin, 30, "Thank you. This is a computer generated receipt and does not require a physical stamp.")
+    p.drawString(margin, 16, f"Issued on: {issued_on}")
+
+    p.showPage()
+    return p.getpdfdata()
+
+
+# ---------- benchmark ----------
+def _sample_receipt(n):
+    fee = {
+        "fee_id": n, "student_id": 1000 + n, "amount": Decimal("2500.00"), "status": "paid",
+        "paid_on": date(2026, 4, 1), "note": "Term 1 tuition", "created_at": None,
+        "student_name": f"Student {n}", "parent_name": f"Parent {n}",
+        "student_class": "7", "student_db_id": 1000 + n,
+    }
+    totals = {
+        "total_paid": 7500.0, "total_unpaid": 2500.0, "paid_now": 2500.0,
+        "display_total_paid": 7500.0, "remaining_after_payment": 0.0,
+    }
+    return fee, totals
+
+
+def _sample_cards(n):
+    subjects = ["English", "Hindi", "Mathematics", "Science", "Social Studies", "Computer"]
+    return [
+        {
+            "student": {"id": i, "name": f"Student {i}", "class_name": "7", "section": "A"},
+            "term": "Term 1",
+            "results": [
+                {"subject": s, "marks": Decimal(60 + (i * 7 + k * 11) % 40), "max_marks": Decimal(100)}
+                for k, s in enumerate(subjects)
+            ],
+            "attendance": [{"status": "Present", "cnt": 180}, {"status": "Absent", "cnt": 12}],
+        }
+        for i in range(n)
+    ]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark receipt and report card rendering.")
+    ap.add_argument("--receipts", type=int, default=300)
+    ap.add_argument("--cards", type=int, default=60, help="report cards in one merged class PDF")
+    args = ap.parse_args()
+
+    school = school_details()
+    rates = {}
+    for label, shared in (("per document", False), ("shared assets", True)):
+        set_shared_assets(shared)
+        # the per-document baseline also pays for ASCII85, as the routes used to
+        rl_config.useA85 = 0 if shared else 1
+        fee, totals = _sample_receipt(0)
+        size = len(render_fee_receipt_full(fee, totals, school, "2026-04-01"))   # warm-up
+
+        started = time.perf_counter()
+        for n in range(args.receipts):
+            fee, totals = _sample_receipt(n)
+            render_fee_receipt_full(fee, totals, school, "2026-04-01")
+        rates[label] = args.receipts / (time.perf_counter() - started)
+
+        cards = _sample_cards(args.cards)
+        started = time.perf_counter()
+        merged = render_report_card_chunk(cards, True)
+        elapsed = time.perf_counter() - started
+
+        print(
+            f"{label:14} {rates[label]:8.0f} receipts/s  ({size} bytes each)   "
+            f"{args.cards} report cards merged in {elapsed * 1000:.0f}ms ({len(merged)} bytes)"
+        )
+
+    print(f"speed-up {rates['shared assets'] / rates['per document']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
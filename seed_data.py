@@ -0,0 +1,337 @@
+# seed_data.py
+# Deterministic synthetic school data for benchmarks.
+#
+#   python seed_data.py --truncate                 # full size (scale 1.0)
+#   python seed_data.py --truncate --scale 0.05    # ~1k students, quick
+#
+# Scale 1.0 is roughly: 20k students, 600 classes, 5 years of daily
+# attendance, 200k fee rows, marks for 3 terms, parent links for every
+# student. The same --seed / --scale / --end-date always produce the
+# same rows (ids included), so benchmark runs are comparable.
+#
+# Every generated user's password is "password123".
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+import mysql.connector
+from werkzeug.security import generate_password_hash
+
+import config
+
+FULL_SCALE = {
+    "students": 20000,
+    "classes": 600,
+    "fees": 200000,
+    "teachers": 900,
+    "notices": 500,
+    "books": 300,
+}
+GRADES = [str(g) for g in range(1, 13)]
+TERMS = ["Term 1", "Term 2", "Term 3"]
+SUBJECTS = ["English", "Hindi", "Mathematics", "Science", "Social Studies", "Computer"]
+FIRST_NAMES = [
+    "Aarav", "Vivaan", "Aditya", "Vihaan", "Arjun", "Sai", "Reyansh", "Krishna",
+    "Ishaan", "Rohan", "Ananya", "Diya", "Saanvi", "Aadhya", "Pari", "Anika",
+    "Navya", "Myra", "Sara", "Kavya", "Riya", "Meera", "Aryan", "Kabir", "Neha",
+]
+LAST_NAMES = [
+    "Sharma", "Verma", "Gupta", "Singh", "Patel", "Sahu", "Agrawal", "Mishra",
+    "Yadav", "Jain", "Tiwari", "Dubey", "Chandrakar", "Sinha", "Khan", "Das",
+]
+# tables in FK-safe load order; truncated in reverse
+TABLES = [
+    "users", "classes", "students", "parents", "parent_student", "attendance",
+    "fees", "marks", "assignments", "assignment_submissions", "homework",
+    "notices", "books",
+]
+# summary tables kept by the app; emptied with --truncate, rebuilt afterwards
+DERIVED_TABLES = ["fees_monthly_rollup", "fee_balances"]
+
+
+def section_labels(n):
+    labels = []
+    i = 0
+    while len(labels) < n:
+        q, r = divmod(i, 26)
+        labels.append((chr(65 + q - 1) if q else "") + chr(65 + r))
+        i += 1
+    return labels
+
+
+def school_days(start, end):
+    d = start
+    while d <= end:
+        if d.weekday() < 5:
+            yield d
+        d += timedelta(days=1)
+
+
+class Loader:
+    """Buffers rows per table and flushes them as multi-row INSERTs."""
+
+    def __init__(self, conn, chunk):
+        self.conn = conn
+        self.cur = conn.cursor()
+        self.chunk = chunk
+        self.counts = {}
+
+    def load(self, table, columns, rows):
+        cols = ", ".join(columns)
+        one = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        started = time.time()
+        n = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.chunk:
+                self._flush(table, cols, one, batch)
+                n += len(batch)
+                batch = []
+        if batch:
+            self._flush(table, cols, one, batch)
+            n += len(batch)
+        self.conn.commit()
+        self.counts[table] = self.counts.get(table, 0) + n
+        print(f"  {table:24} {n:>10,} rows  {time.time() - started:7.1f}s")
+
+    def _flush(self, table, cols, one, batch):
+        sql = f"INSERT INTO {table} ({cols}) VALUES " + ", ".join([one] * len(batch))
+        flat = [v for row in batch for v in row]
+        self.cur.execute(sql, flat)
+
+
+def generate(loader, rng, scale, years, end):
+    n_students = max(1, round(FULL_SCALE["students"] * scale))
+    n_classes = max(1, round(FULL_SCALE["classes"] * scale))
+    n_fees = max(1, round(FULL_SCALE["fees"] * scale))
+    n_teachers = max(1, round(FULL_SCALE["teachers"] * scale))
+    start = end - timedelta(days=365 * years)
+    password = generate_password_hash("password123")
+
+    def person():
+        return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+    def stamp(d):
+        return datetime(d.year, d.month, d.day, rng.randint(8, 16), rng.randint(0, 59), rng.randint(0, 59))
+
+    # ---- classes ----
+    per_grade = -(-n_classes // len(GRADES))
+    sections = section_labels(per_grade)
+    classes = []
+    for i in range(n_classes):
+        grade, sec = divmod(i, per_grade)
+        classes.append((i + 1, f"Class {GRADES[grade % len(GRADES)]}", sections[sec]))
+    loader.load("classes", ["id", "name", "section"], classes)
+
+    # ---- users: admin, teachers, students, parents ----
+    # parents: one per student, with ~15% of families having two children
+    family_of = []
+    family = 0
+    for sid in range(1, n_students + 1):
+        if sid > 1 and rng.random() < 0.15:
+            family_of.append(family)
+        else:
+            family += 1
+            family_of.append(family)
+    n_parents = family
+
+    teacher_base = 2
+    student_base = teacher_base + n_teachers
+    parent_base = student_base + n_students
+
+    def users():
+        yield (1, "admin", password, "admin")
+        for t in range(n_teachers):
+            yield (teacher_base + t, f"teacher{t + 1:04d}", password, "teacher")
+        for s in range(n_students):
+            yield (student_base + s, f"student{s + 1:05d}", password, "student")
+        for p in range(n_parents):
+            yield (parent_base + p, f"parent{p + 1:05d}", password, "parent")
+    loader.load("users", ["id", "username", "password", "role"], users())
+
+    # ---- students ----
+    student_class = []
+    student_rows = []
+    for s in range(n_students):
+        sid = s + 1
+        cid, cname, csec = classes[s % n_classes]
+        student_class.append(cid)
+        surname = LAST_NAMES[family_of[s] % len(LAST_NAMES)]
+        student_rows.append((
+            sid, student_base + s, f"{rng.choice(FIRST_NAMES)} {surname}",
+            f"ADM{sid:06d}", str(s // n_classes + 1), cid, cname, csec,
+            date(end.year - 6 - int(cname.split()[-1]), rng.randint(1, 12), rng.randint(1, 28)),
+            f"9{rng.randint(100000000, 999999999)}", f"student{sid:05d}@example.com",
+            f"{rng.choice(FIRST_NAMES)} {surname}", f"9{rng.randint(100000000, 999999999)}",
+            f"{rng.randint(1, 400)}, Sector {rng.randint(1, 30)}, Raipur",
+        ))
+    loader.load("students", [
+        "id", "user_id", "name", "admission_no", "roll_no", "class_id", "class", "section",
+        "dob", "phone", "email", "parent_name", "parent_phone", "address",
+    ], student_rows)
+    del student_rows
+
+    # ---- parents + links ----
+    loader.load("parents", ["id", "user_id", "name"], (
+        (p + 1, parent_base + p, person()) for p in range(n_parents)
+    ))
+    loader.load("parent_student", ["parent_id", "parent_user_id", "student_id"], (
+        (family_of[s], parent_base + family_of[s] - 1, s + 1) for s in range(n_students)
+    ))
+
+    # ---- attendance: every school day in the window ----
+    days = list(school_days(start, end))
+    presence = [rng.uniform(0.70, 0.99) for _ in range(n_students)]
+
+    def attendance():
+        for d in days:
+            for s in range(n_students):
+                r = rng.random()
+                if r < presence[s]:
+                    status = "Present"
+                elif r < presence[s] + (1 - presence[s]) * 0.8:
+                    status = "Absent"
+                else:
+                    status = "Leave"
+                yield (s + 1, student_class[s], d, status, "")
+    loader.load("attendance", ["student_id", "class_id", "date", "status", "remarks"], attendance())
+
+    # ---- fees ----
+    span = (end - start).days
+
+    def fees():
+        for _ in range(n_fees):
+            sid = rng.randint(1, n_students)
+            created = start + timedelta(days=rng.randint(0, span))
+            due = created + timedelta(days=30)
+            paid = rng.random() < 0.8
+            paid_on = created + timedelta(days=rng.randint(0, 45)) if paid else None
+            yield (
+                sid, rng.choice([1500, 2500, 3000, 4500, 6000, 12000]),
+                "paid" if paid else "unpaid", due, paid_on,
+                rng.choice(["Tuition", "Transport", "Exam fee", "Library", "Annual charges"]),
+                stamp(created),
+            )
+    loader.load("fees", ["student_id", "amount", "status", "due_date", "paid_on", "note", "created_at"], fees())
+
+    # ---- marks: every subject, every term ----
+    def marks():
+        for s in range(n_students):
+            ability = rng.uniform(0.35, 0.98)
+            for term in TERMS:
+                for subject in SUBJECTS:
+                    score = max(0, min(100, round(rng.gauss(ability * 100, 8))))
+                    yield (s + 1, subject, score, 100, term)
+    loader.load("marks", ["student_id", "subject", "marks", "max_marks", "exam"], marks())
+
+    # ---- assignments + submissions ----
+    per_class = 20
+    assignments = []
+    aid = 0
+    for cid, _, _ in classes:
+        for k in range(per_class):
+            aid += 1
+            due = end - timedelta(days=rng.randint(0, 300))
+            assignments.append((
+                aid, f"Assignment {k + 1}: {rng.choice(SUBJECTS)}", "Complete the exercises.",
+                cid, due, teacher_base + rng.randrange(n_teachers), stamp(due - timedelta(days=7)),
+            ))
+    loader.load("assignments", [
+        "id", "title", "description", "class_id", "due_date", "created_by", "created_at",
+    ], assignments)
+
+    by_class = {}
+    for s in range(n_students):
+        by_class.setdefault(student_class[s], []).append(s + 1)
+
+    def submissions():
+        for a in assignments:
+            for sid in by_class.get(a[3], []):
+                if rng.random() < 0.7:
+                    yield (a[0], sid, "Submitted work.", rng.randint(4, 10), "", stamp(a[4]))
+    loader.load("assignment_submissions", [
+        "assignment_id", "student_id", "submission_text", "marks", "remarks", "submitted_at",
+    ], submissions())
+
+    # ---- homework, notices, books ----
+    def homework():
+        for cid, _, _ in classes:
+            for k in range(30):
+                due = end - timedelta(days=rng.randint(0, 365))
+                yield (f"Homework {k + 1}", "Read the chapter and answer the questions.", cid, due,
+                       teacher_base + rng.randrange(n_teachers), stamp(due - timedelta(days=2)))
+    loader.load("homework", ["title", "description", "class_id", "due_date", "created_by", "created_at"], homework())
+
+    n_notices = max(1, round(FULL_SCALE["notices"] * scale))
+    loader.load("notices", ["title", "message", "class_id", "created_by", "created_at"], (
+        (f"Notice {i + 1}", "Please note the schedule change.",
+         rng.choice(classes)[0] if rng.random() < 0.6 else None, 1,
+         stamp(start + timedelta(days=rng.randint(0, span))))
+        for i in range(n_notices)
+    ))
+
+    n_books = max(1, round(FULL_SCALE["books"] * scale))
+    loader.load("books", ["title", "subject", "description", "class_id", "file_path", "uploaded_by", "uploaded_at"], (
+        (f"Book {i + 1}", rng.choice(SUBJECTS), "Reference text.", rng.choice(classes)[0],
+         f"static/uploads/books/book_{i + 1}.pdf", teacher_base + rng.randrange(n_teachers),
+         stamp(start + timedelta(days=rng.randint(0, span))))
+        for i in range(n_books)
+    ))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load deterministic synthetic school data.")
+    ap.add_argument("--scale", type=float, default=1.0, help="1.0 = 20k students / 600 classes / 200k fees")
+    ap.add_argument("--years", type=int, default=5, help="years of daily attendance")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--end-date", default="2026-03-31", help="last attendance day (YYYY-MM-DD)")
+    ap.add_argument("--chunk", type=int, default=2000, help="rows per INSERT statement")
+    ap.add_argument("--truncate", action="store_true", help="empty the tables first")
+    args = ap.parse_args()
+
+    conn = mysql.connector.connect(
+        host=config.DB_HOST,
+        port=config.DB_PORT,
+        user=config.DB_USER,
+        password=config.DB_PASS,
+        database=config.DB_NAME,
+        auth_plugin="mysql_native_password"
+    )
+    cur = conn.cursor()
+    cur.execute("SET FOREIGN_KEY_CHECKS = 0")
+    cur.execute("SET UNIQUE_CHECKS = 0")
+
+    if args.truncate:
+        for table in DERIVED_TABLES + list(reversed(TABLES)):
+            cur.execute(f"TRUNCATE TABLE {table}")
+    else:
+        cur.execute("SELECT COUNT(*) FROM students")
+        if cur.fetchone()[0]:
+            raise SystemExit("students is not empty; rerun with --truncate to replace the data.")
+
+    end = datetime.strptime(args.end_date, "%Y-%m-%d").date()
+    print(f"Seeding scale={args.scale} years={args.years} seed={args.seed} end={end}")
+    started = time.time()
+
+    loader = Loader(conn, args.chunk)
+    generate(loader, random.Random(args.seed), args.scale, args.years, end)
+
+    cur.execute("SET UNIQUE_CHECKS = 1")
+    cur.execute("SET FOREIGN_KEY_CHECKS = 1")
+    cur.close()
+    conn.close()
+
+    total = sum(loader.counts.values())
+    print(f"Done: {total:,} rows in {time.time() - started:.1f}s")
+    print("Derived tables are now stale; rebuild them with:")
+    print("  flask --app app db rebuild-counters")
+    print("  flask --app app db backfill-attendance-bits")
+    print(f"  flask --app app db compact-rollups --months {args.years * 12 + 1}")
+    print("  flask --app app db rebuild-fee-rollups")
+    print("  flask --app app db verify-fee-balances --fix")
+
+
+if __name__ == "__main__":
+    main()